@@ -1,13 +1,23 @@
 from __future__ import annotations
 
+import asyncio
 import base64
+import functools
 import io
 import logging
 import os
 import platform
-from typing import TYPE_CHECKING, Optional
+import shutil
+import struct
+import subprocess
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from typing import TYPE_CHECKING, Iterator, Optional
 
 from browser_use.agent.views import (
+	AgentHistory,
 	AgentHistoryList,
 )
 
@@ -31,27 +41,389 @@ def create_history_gif(
 	goal_font_size: int = 44,
 	margin: int = 40,
 	line_spacing: float = 1.5,
+	workers: int = 0,
 ) -> None:
-	"""Create a GIF from the agent's history with overlaid task and goal text."""
+	"""
+	Create a GIF from the agent's history with overlaid task and goal text.
+
+	Frames are written as soon as they are rendered, so only a few of them are in memory at any time.
+	Paths ending in .mp4 or .webm are encoded to video with a local ffmpeg instead.
+	Frames are rendered in the calling thread, or by `workers` threads if given; Pillow releases the GIL while
+	decoding, converting and encoding.
+	"""
 	if not history.history:
 		logger.warning('No history to create GIF from')
 		return
 
-	from PIL import Image, ImageFont
-
-	images = []
-
 	# if history is empty or first screenshot is None, we can't create a gif
-	if not history.history or not history.history[0].state.screenshot:
+	first_screenshot = history.history[0].state.get_screenshot()
+	if not first_screenshot:
 		logger.warning('No history or first screenshot to create GIF from')
 		return
 
+	output_path, video_format = _resolve_output_path(output_path)
+	style = _FrameStyle(
+		_image_size(first_screenshot),
+		video_format,
+		duration,
+		show_goals,
+		font_size,
+		title_font_size,
+		goal_font_size,
+		margin,
+		line_spacing,
+		show_logo,
+	)
+
+	def frame_jobs() -> Iterator[tuple]:
+		# Screenshots are read one at a time, from the screenshot store if the history only keeps references
+		if show_task and task:
+			yield (style, first_screenshot, 0, task, True)
+		for i, item in enumerate(history.history, 1):
+			job = _step_frame_job(style, i, item)
+			if job is not None:
+				yield job
+
+	output = _open_output(output_path, style)
+	try:
+		for frame in _render_frames(frame_jobs(), workers):
+			output.write(frame)
+	finally:
+		frame_count = output.close()
+
+	if frame_count:
+		logger.info(f'Created GIF at {output_path}')
+	else:
+		logger.warning('No images found in history to create GIF')
+
+
+class HistoryGifWriter:
+	"""
+	Renders the GIF (or video) of an agent run while it runs: every step's frame is rendered and appended
+	to the output file by a background thread, so closing it only finishes the file.
+
+	add_history waits while max_pending frames are queued, so a slow renderer holds back the agent
+	instead of piling up screenshots in memory.
+	"""
+
+	def __init__(
+		self,
+		task: str,
+		output_path: str = 'agent_history.gif',
+		duration: int = 3000,
+		show_goals: bool = True,
+		show_task: bool = True,
+		show_logo: bool = False,
+		font_size: int = 40,
+		title_font_size: int = 56,
+		goal_font_size: int = 44,
+		margin: int = 40,
+		line_spacing: float = 1.5,
+		max_pending: int = 4,
+	):
+		self.task = task
+		self.show_task = show_task
+		self.output_path, video_format = _resolve_output_path(output_path)
+		# Canvas size is set from the first screenshot
+		self._style = _FrameStyle(
+			(0, 0),
+			video_format,
+			duration,
+			show_goals,
+			font_size,
+			title_font_size,
+			goal_font_size,
+			margin,
+			line_spacing,
+			show_logo,
+		)
+		self.max_pending = max_pending
+
+		# One thread, so frames are appended in order
+		self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='history_gif')
+		self._pending: deque[Future[None]] = deque()
+		self._added = 0
+		self._output: Optional[_GifOutput | _VideoOutput] = None
+		self._failed = False
+
+	async def add_history(self, history: AgentHistoryList) -> None:
+		"""Queues the frames of the history items added since the last call"""
+		for step_number in range(self._added + 1, len(history.history) + 1):
+			while self._pending and self._pending[0].done():
+				self._pending.popleft()
+			if len(self._pending) >= self.max_pending:
+				await asyncio.wrap_future(self._pending.popleft())
+			self._pending.append(self._executor.submit(self._add_item, step_number, history.history[step_number - 1]))
+		self._added = len(history.history)
+
+	def close(self) -> 'Future[Optional[str]]':
+		"""
+		Finishes the file after the queued frames in the background. The future resolves to the output path,
+		or None if there was nothing to render. It can be awaited with asyncio.wrap_future or left running.
+		"""
+		future = self._executor.submit(self._close)
+		self._executor.shutdown(wait=False)
+		return future
+
+	def _add_item(self, step_number: int, item: AgentHistory) -> None:
+		if self._failed:
+			return
+		try:
+			if self._output is None:
+				screenshot = item.state.get_screenshot()
+				if not screenshot:
+					return
+				self._style = replace(self._style, canvas_size=_image_size(screenshot))
+				self._output = _open_output(self.output_path, self._style)
+				if self.show_task and self.task:
+					self._output.write(_render_frame((self._style, screenshot, 0, self.task, True)))
+
+			job = _step_frame_job(self._style, step_number, item)
+			if job is not None:
+				self._output.write(_render_frame(job))
+		except Exception as e:
+			# The run goes on without its GIF
+			logger.error(f'Failed to render GIF frame of step {step_number}: {e}')
+			self._failed = True
+
+	def _close(self) -> Optional[str]:
+		if self._output is None:
+			logger.warning('No images found in history to create GIF')
+			return None
+		frame_count = self._output.close()
+		if self._failed or not frame_count:
+			return None
+		logger.info(f'Created GIF at {self.output_path}')
+		return self.output_path
+
+
+@dataclass(frozen=True)
+class _FrameStyle:
+	canvas_size: tuple[int, int]
+	video_format: str  # 'gif', 'mp4' or 'webm'
+	duration: int
+	show_goals: bool
+	font_size: int
+	title_font_size: int
+	goal_font_size: int
+	margin: int
+	line_spacing: float
+	show_logo: bool
+
+
+def _resolve_output_path(output_path: str) -> tuple[str, str]:
+	"""Output path and format, .mp4 and .webm become a GIF if ffmpeg is not installed"""
+	video_format = os.path.splitext(output_path)[1].lower().lstrip('.')
+	if video_format not in ('mp4', 'webm'):
+		return output_path, 'gif'
+	if not shutil.which('ffmpeg'):
+		logger.warning(f'ffmpeg not found, creating a GIF instead of {output_path}')
+		return os.path.splitext(output_path)[0] + '.gif', 'gif'
+	return output_path, video_format
+
+
+def _image_size(screenshot: str) -> tuple[int, int]:
+	from PIL import Image
+
+	with Image.open(io.BytesIO(base64.b64decode(screenshot))) as image:
+		return image.size
+
+
+def _step_frame_job(style: _FrameStyle, step_number: int, item: AgentHistory) -> Optional[tuple]:
+	screenshot = item.state.get_screenshot()
+	if not screenshot:
+		return None
+	goal = item.model_output.current_state.next_goal if style.show_goals and item.model_output else None
+	return (style, screenshot, step_number, goal, False)
+
+
+def _render_frames(jobs: Iterator[tuple], workers: int) -> Iterator[bytes]:
+	"""Renders frames in order, with at most two frames per worker in flight"""
+	if workers <= 0:
+		yield from (_render_frame(job) for job in jobs)
+		return
+
+	with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='history_gif') as executor:
+		pending: deque[Future[bytes]] = deque()
+		for job in jobs:
+			pending.append(executor.submit(_render_frame, job))
+			if len(pending) >= 2 * workers:
+				yield pending.popleft().result()
+		while pending:
+			yield pending.popleft().result()
+
+
+def _render_frame(job: tuple) -> bytes:
+	"""Renders one frame to GIF frame data or raw RGB bytes, runs in the worker threads"""
+	from PIL import Image
+
+	style, screenshot, step_number, text, is_task_frame = job
+	regular_font, title_font, _ = _load_fonts(style.font_size, style.title_font_size, style.goal_font_size)
+	logo = _load_logo() if style.show_logo else None
+
+	image = Image.open(io.BytesIO(base64.b64decode(screenshot)))
+	if is_task_frame:
+		image = _create_task_frame(text, image, title_font, regular_font, logo, style.line_spacing)
+	elif text is not None:
+		image = _add_overlay_to_image(
+			image=image,
+			step_number=step_number,
+			goal_text=text,
+			regular_font=regular_font,
+			title_font=title_font,
+			margin=style.margin,
+			logo=logo,
+		)
+	image = image.convert('RGB')
+	if image.size != style.canvas_size:
+		image = image.resize(style.canvas_size, Image.Resampling.LANCZOS)
+
+	if style.video_format != 'gif':
+		return image.tobytes()
+	return _gif_frame_data(image.convert('P', palette=Image.Palette.ADAPTIVE), style.duration)
+
+
+def _gif_frame_data(frame: 'Image.Image', duration: int) -> bytes:
+	"""
+	Data of one frame for a GIF stream (GIF89a spec, sections 17-24): the frame is saved as a single frame GIF with
+	Image.save, then its header and trailer are dropped and its global color table becomes the frame's local one.
+	"""
+	output = io.BytesIO()
+	frame.save(output, format='GIF', duration=duration)
+	data = output.getvalue()
+
+	# Header and logical screen descriptor, then the global color table if its flag is set
+	packed = data[10]
+	table_size = 3 << ((packed & 0x07) + 1) if packed & 0x80 else 0
+	color_table = data[13 : 13 + table_size]
+	position = 13 + table_size
+	blocks = []
+	while data[position] == 0x21:
+		# Extension (graphic control, comment): introducer, label, then data sub-blocks up to an empty one
+		end = position + 2
+		while data[end]:
+			end += data[end] + 1
+		blocks.append(data[position : end + 1])
+		position = end + 1
+
+	if data[position] != 0x2C:
+		raise ValueError(f'No image descriptor in the GIF written by Pillow, found byte {data[position]:#x} at {position}')
+	descriptor = bytearray(data[position : position + 10])
+	if color_table and not descriptor[9] & 0x80:
+		descriptor[9] |= 0x80 | (packed & 0x07)
+		descriptor += color_table
+	# Image data up to the trailer
+	return b''.join(blocks) + bytes(descriptor) + data[position + 10 : -1]
+
+
+def _open_output(output_path: str, style: _FrameStyle) -> '_GifOutput | _VideoOutput':
+	if style.video_format == 'gif':
+		return _GifOutput(output_path, style.canvas_size)
+	return _VideoOutput(output_path, style.video_format, style.canvas_size, style.duration)
+
+
+class _GifOutput:
+	"""Writes GIF frame data as it arrives"""
+
+	def __init__(self, output_path: str, canvas_size: tuple[int, int]):
+		self.output_path = output_path
+		self.frame_count = 0
+		self._file = open(output_path, 'wb')
+		# Logical screen descriptor without a global color table, every frame has its own,
+		# then the NETSCAPE2.0 application extension that makes the GIF loop forever
+		self._file.write(b'GIF89a' + struct.pack('<HHBBB', *canvas_size, 0, 0, 0))
+		self._file.write(b'\x21\xff\x0bNETSCAPE2.0\x03\x01' + struct.pack('<H', 0) + b'\x00')
+
+	def write(self, frame: bytes) -> None:
+		self._file.write(frame)
+		self.frame_count += 1
+
+	def close(self) -> int:
+		"""Finishes the file, returns the number of frames"""
+		self._file.write(b';')
+		self._file.close()
+		if not self.frame_count:
+			os.remove(self.output_path)
+		return self.frame_count
+
+
+class _VideoOutput:
+	"""Pipes raw frames into ffmpeg"""
+
+	def __init__(self, output_path: str, video_format: str, canvas_size: tuple[int, int], duration: int):
+		codec = 'libx264' if video_format == 'mp4' else 'libvpx-vp9'
+		width, height = canvas_size
+		self.output_path = output_path
+		self.frame_count = 0
+		self._process = subprocess.Popen(
+			[
+				'ffmpeg',
+				'-y',
+				'-loglevel',
+				'error',
+				'-f',
+				'rawvideo',
+				'-pix_fmt',
+				'rgb24',
+				'-s',
+				f'{width}x{height}',
+				'-framerate',
+				str(1000 / duration),
+				'-i',
+				'-',
+				# yuv420p needs even dimensions
+				'-vf',
+				'scale=trunc(iw/2)*2:trunc(ih/2)*2',
+				'-c:v',
+				codec,
+				'-pix_fmt',
+				'yuv420p',
+				output_path,
+			],
+			stdin=subprocess.PIPE,
+		)
+
+	def write(self, frame: bytes) -> None:
+		assert self._process.stdin is not None
+		self._process.stdin.write(frame)
+		self.frame_count += 1
+
+	def close(self) -> int:
+		"""Waits for ffmpeg to finish the file, returns the number of frames"""
+		assert self._process.stdin is not None
+		self._process.stdin.close()
+		returncode = self._process.wait()
+		if returncode != 0:
+			raise RuntimeError(f'ffmpeg failed with exit code {returncode} while creating {self.output_path}')
+		return self.frame_count
+
+
+# Pillow does not document FreeType fonts as thread-safe, every rendering thread loads its own
+_thread_fonts = threading.local()
+
+
+def _load_fonts(
+	font_size: int, title_font_size: int, goal_font_size: int
+) -> tuple['ImageFont.FreeTypeFont', 'ImageFont.FreeTypeFont', 'ImageFont.FreeTypeFont']:
+	"""Regular, title and goal font, loaded once per thread"""
+	fonts = getattr(_thread_fonts, 'fonts', None)
+	if fonts is None:
+		fonts = _thread_fonts.fonts = {}
+	key = (font_size, title_font_size, goal_font_size)
+	if key not in fonts:
+		fonts[key] = _open_fonts(font_size, title_font_size, goal_font_size)
+	return fonts[key]
+
+
+def _open_fonts(
+	font_size: int, title_font_size: int, goal_font_size: int
+) -> tuple['ImageFont.FreeTypeFont', 'ImageFont.FreeTypeFont', 'ImageFont.FreeTypeFont']:
+	from PIL import ImageFont
+
 	# Try to load nicer fonts
 	try:
 		# Try different font options in order of preference
 		font_options = ['Helvetica', 'Arial', 'DejaVuSans', 'Verdana']
-		font_loaded = False
-
 		for font_name in font_options:
 			try:
 				if platform.system() == 'Windows':
@@ -60,95 +432,46 @@ def create_history_gif(
 				regular_font = ImageFont.truetype(font_name, font_size)
 				title_font = ImageFont.truetype(font_name, title_font_size)
 				goal_font = ImageFont.truetype(font_name, goal_font_size)
-				font_loaded = True
-				break
+				return regular_font, title_font, goal_font
 			except OSError:
 				continue
 
-		if not font_loaded:
-			raise OSError('No preferred fonts found')
+		raise OSError('No preferred fonts found')
 
 	except OSError:
 		regular_font = ImageFont.load_default()
 		title_font = ImageFont.load_default()
+		return regular_font, title_font, regular_font  # type: ignore
 
-		goal_font = regular_font
 
-	# Load logo if requested
-	logo = None
-	if show_logo:
-		try:
-			logo = Image.open('./static/browser-use.png')
-			# Resize logo to be small (e.g., 40px height)
-			logo_height = 150
-			aspect_ratio = logo.width / logo.height
-			logo_width = int(logo_height * aspect_ratio)
-			logo = logo.resize((logo_width, logo_height), Image.Resampling.LANCZOS)
-		except Exception as e:
-			logger.warning(f'Could not load logo: {e}')
-
-	# Create task frame if requested
-	if show_task and task:
-		task_frame = _create_task_frame(
-			task,
-			history.history[0].state.screenshot,
-			title_font,  # type: ignore
-			regular_font,  # type: ignore
-			logo,
-			line_spacing,
-		)
-		images.append(task_frame)
-
-	# Process each history item
-	for i, item in enumerate(history.history, 1):
-		if not item.state.screenshot:
-			continue
-
-		# Convert base64 screenshot to PIL Image
-		img_data = base64.b64decode(item.state.screenshot)
-		image = Image.open(io.BytesIO(img_data))
-
-		if show_goals and item.model_output:
-			image = _add_overlay_to_image(
-				image=image,
-				step_number=i,
-				goal_text=item.model_output.current_state.next_goal,
-				regular_font=regular_font,  # type: ignore
-				title_font=title_font,  # type: ignore
-				margin=margin,
-				logo=logo,
-			)
-
-		images.append(image)
-
-	if images:
-		# Save the GIF
-		images[0].save(
-			output_path,
-			save_all=True,
-			append_images=images[1:],
-			duration=duration,
-			loop=0,
-			optimize=False,
-		)
-		logger.info(f'Created GIF at {output_path}')
-	else:
-		logger.warning('No images found in history to create GIF')
+@functools.lru_cache(maxsize=1)
+def _load_logo() -> Optional['Image.Image']:
+	"""Logo resized to 150px height, loaded once"""
+	from PIL import Image
+
+	try:
+		logo = Image.open('./static/browser-use.png')
+		# Resize logo to be small (e.g., 40px height)
+		logo_height = 150
+		aspect_ratio = logo.width / logo.height
+		logo_width = int(logo_height * aspect_ratio)
+		return logo.resize((logo_width, logo_height), Image.Resampling.LANCZOS)
+	except Exception as e:
+		logger.warning(f'Could not load logo: {e}')
+		return None
 
 
 def _create_task_frame(
 	task: str,
-	first_screenshot: str,
+	template: 'Image.Image',
 	title_font: 'ImageFont.FreeTypeFont',
 	regular_font: 'ImageFont.FreeTypeFont',
 	logo: Optional[Image.Image] = None,
 	line_spacing: float = 1.5,
 ) -> 'Image.Image':
-	"""Create initial frame showing the task."""
+	"""Create initial frame showing the task, of the size of the first screenshot."""
 	from PIL import Image, ImageDraw, ImageFont
 
-	img_data = base64.b64decode(first_screenshot)
-	template = Image.open(io.BytesIO(img_data))
 	image = Image.new('RGB', template.size, (0, 0, 0))
 	draw = ImageDraw.Draw(image)
 
@@ -291,9 +614,10 @@ def _add_overlay_to_image(
 	return result.convert('RGB')
 
 
+@functools.lru_cache(maxsize=256)
 def _wrap_text(text: str, font: 'ImageFont.FreeTypeFont', max_width: int) -> str:
 	"""
-	Wrap text to fit within a given width.
+	Wrap text to fit within a given width. Cached, since consecutive steps often share their goal.
 
 	Args:
 	    text: Text to wrap
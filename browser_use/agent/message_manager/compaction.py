@@ -0,0 +1,169 @@
+"""
+Policies that keep the message history of long tasks small, applied by MessageManager.compact_history before every step.
+
+Policies only see the messages between the initial messages and the current state message, and only rewrite
+steps (model outputs, their tool responses, action results and plans). New tasks and messages without a type
+are kept as they are.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+from abc import ABC, abstractmethod
+from typing import Any
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+from browser_use.agent.message_manager.views import ManagedMessage, MessageMetadata
+
+logger = logging.getLogger(__name__)
+
+# Message types that belong to a step and may be dropped or rewritten
+_STEP_MESSAGE_TYPES = ('model_output', 'collapsed_model_output', 'tool', 'action_result', 'plan')
+_STEP_START_TYPES = ('model_output', 'collapsed_model_output')
+
+
+class CompactionPolicy(ABC):
+	"""Rewrites the steps of the message history, new messages are counted by the message manager"""
+
+	@abstractmethod
+	async def compact(self, messages: list[ManagedMessage]) -> list[ManagedMessage]:
+		"""Returns the compacted messages"""
+
+
+def _old_steps_end(messages: list[ManagedMessage], keep_last_steps: int) -> int:
+	"""Index of the first message of the last keep_last_steps steps, 0 if there are not more steps than that"""
+	step_starts = [i for i, m in enumerate(messages) if m.metadata.message_type in _STEP_START_TYPES]
+	if len(step_starts) <= keep_last_steps:
+		return 0
+	return step_starts[len(step_starts) - keep_last_steps] if keep_last_steps > 0 else len(messages)
+
+
+class SlidingWindow(CompactionPolicy):
+	"""
+	Keeps only the last max_steps steps.
+	"""
+
+	def __init__(self, max_steps: int = 20):
+		self.max_steps = max_steps
+
+	async def compact(self, messages: list[ManagedMessage]) -> list[ManagedMessage]:
+		end = _old_steps_end(messages, self.max_steps)
+		return [m for i, m in enumerate(messages) if i >= end or m.metadata.message_type not in _STEP_MESSAGE_TYPES]
+
+
+class DropOldActionResults(CompactionPolicy):
+	"""
+	Drops the action results (extracted content and errors) of all but the last keep_last_steps steps.
+	"""
+
+	def __init__(self, keep_last_steps: int = 5):
+		self.keep_last_steps = keep_last_steps
+
+	async def compact(self, messages: list[ManagedMessage]) -> list[ManagedMessage]:
+		end = _old_steps_end(messages, self.keep_last_steps)
+		return [m for i, m in enumerate(messages) if i >= end or m.metadata.message_type != 'action_result']
+
+
+class CollapseToolCalls(CompactionPolicy):
+	"""
+	Replaces the model outputs of all but the last keep_last_steps steps, and their tool responses, by a one line summary.
+	"""
+
+	def __init__(self, keep_last_steps: int = 5):
+		self.keep_last_steps = keep_last_steps
+
+	async def compact(self, messages: list[ManagedMessage]) -> list[ManagedMessage]:
+		end = _old_steps_end(messages, self.keep_last_steps)
+		collapsed_ids: set[str] = set()
+		compacted = []
+		for i, m in enumerate(messages):
+			if (
+				i < end
+				and m.metadata.message_type == 'model_output'
+				and isinstance(m.message, AIMessage)
+				and m.message.tool_calls
+			):
+				collapsed_ids.update(str(tool_call['id']) for tool_call in m.message.tool_calls)
+				summary = '; '.join(self._summarize(tool_call['args']) for tool_call in m.message.tool_calls)
+				compacted.append(
+					ManagedMessage(
+						message=AIMessage(content=summary), metadata=MessageMetadata(message_type='collapsed_model_output')
+					)
+				)
+			elif m.metadata.message_type == 'tool' and getattr(m.message, 'tool_call_id', None) in collapsed_ids:
+				# A tool response must follow its tool call, drop it with the call
+				continue
+			else:
+				compacted.append(m)
+		return compacted
+
+	@staticmethod
+	def _summarize(args: dict[str, Any]) -> str:
+		current_state = args.get('current_state', {})
+		actions = ', '.join(
+			f'{name}({", ".join(f"{key}={value!r}" for key, value in (params or {}).items())})'
+			for action in args.get('action', [])
+			for name, params in action.items()
+		)
+		return (
+			f'Evaluation: {current_state.get("evaluation_previous_goal", "")} | '
+			f'Goal: {current_state.get("next_goal", "")} | Actions: {actions}'
+		)
+
+
+class SummarizeHistory(CompactionPolicy):
+	"""
+	Summarizes all but the last keep_last_steps steps with an LLM (e.g. the planner LLM) into one message,
+	once at least min_steps old steps have accumulated. Earlier summaries are folded into the new one.
+	"""
+
+	def __init__(self, llm: BaseChatModel, keep_last_steps: int = 5, min_steps: int = 10):
+		self.llm = llm
+		self.keep_last_steps = keep_last_steps
+		self.min_steps = min_steps
+
+	async def compact(self, messages: list[ManagedMessage]) -> list[ManagedMessage]:
+		end = _old_steps_end(messages, self.keep_last_steps)
+		old = [i for i in range(end) if messages[i].metadata.message_type in (*_STEP_MESSAGE_TYPES, 'summary')]
+		old_steps = sum(1 for i in old if messages[i].metadata.message_type in _STEP_START_TYPES)
+		if old_steps < self.min_steps:
+			return messages
+
+		transcript = '\n'.join(self._to_text(messages[i].message) for i in old)
+		try:
+			response = await self.llm.ainvoke(
+				[
+					SystemMessage(
+						content='You compress the history of a browser automation agent. Summarize the steps below: '
+						'what was tried, what worked, what failed, and every result or piece of information found '
+						'that may be needed to finish the task. Be concise and keep exact values.'
+					),
+					HumanMessage(content=transcript),
+				]
+			)
+		except Exception as e:
+			logger.warning(f'Could not summarize the message history, keeping it: {e}')
+			return messages
+
+		summary = ManagedMessage(
+			message=HumanMessage(content=f'Summary of the previous steps: {response.content}'),
+			metadata=MessageMetadata(message_type='summary'),
+		)
+		old_indices = set(old)
+		compacted = [m for i, m in enumerate(messages) if i not in old_indices]
+		compacted.insert(old[0], summary)
+		logger.debug(f'Summarized {old_steps} steps ({len(old)} messages)')
+		return compacted
+
+	@staticmethod
+	def _to_text(message: BaseMessage) -> str:
+		if isinstance(message, AIMessage) and message.tool_calls:
+			return f'{message.type}: {json.dumps([tool_call["args"] for tool_call in message.tool_calls])}'
+		if isinstance(message.content, list):
+			return f'{message.type}: ' + ''.join(
+				item['text'] for item in message.content if isinstance(item, dict) and 'text' in item
+			)
+		return f'{message.type}: {message.content}'
@@ -1,6 +1,8 @@
 from __future__ import annotations
 
+import hashlib
 import logging
+from collections import OrderedDict
 from typing import Dict, List, Optional
 
 from langchain_core.messages import (
@@ -10,25 +12,55 @@ from langchain_core.messages import (
 	SystemMessage,
 	ToolMessage,
 )
-from pydantic import BaseModel
-
+from pydantic import BaseModel, ConfigDict
+
+from browser_use.agent.message_manager.compaction import CompactionPolicy
+from browser_use.agent.message_manager.tokenizer import (
+	Tokenizer,
+	count_image_tokens,
+	get_tokenizer,
+	image_size,
+	image_token_formula,
+)
+from browser_use.agent.message_manager.utils import diff_clickable_elements, screenshot_change, screenshot_fingerprint
 from browser_use.agent.message_manager.views import MessageMetadata
 from browser_use.agent.prompts import AgentMessagePrompt
 from browser_use.agent.views import ActionResult, AgentOutput, AgentStepInfo, MessageManagerState
 from browser_use.browser.views import BrowserState
-from browser_use.utils import time_execution_sync
+from browser_use.dom.history_tree_processor.service import HistoryTreeProcessor
+from browser_use.utils import SensitiveDataRedactor, time_execution_async, time_execution_sync
 
 logger = logging.getLogger(__name__)
 
+_TOKEN_COUNT_CACHE_SIZE = 256
+
 
 class MessageManagerSettings(BaseModel):
 	max_input_tokens: int = 128000
 	estimated_characters_per_token: int = 3
+	# Used for images of unknown size or models without a known image token formula
 	image_tokens: int = 800
+	# Picks the tokenizer and image token formula, tokenizer overrides the tokenizer
+	model_name: Optional[str] = None
+	tokenizer: Optional[Tokenizer] = None
 	include_attributes: list[str] = []
 	message_context: Optional[str] = None
 	sensitive_data: Optional[Dict[str, str]] = None
 	available_file_paths: Optional[List[str]] = None
+	# Keep the last screenshot sent in the history and send a note instead of a new one
+	# when less than this fraction of the screen changed since
+	skip_unchanged_screenshots: bool = False
+	screenshot_change_threshold: float = 0.005
+	# Mark the initial messages and the history as prompt cache breakpoints (Anthropic cache_control)
+	cache_prompt_prefix: bool = False
+	# Send only the changes of the interactive elements since a page snapshot kept in the history,
+	# with a new snapshot after navigation, every full_state_interval steps or when most of the page changed
+	diff_state_messages: bool = False
+	full_state_interval: int = 10
+	# Applied in order before every step, see browser_use.agent.message_manager.compaction
+	compaction_policies: list[CompactionPolicy] = []
+
+	model_config = ConfigDict(arbitrary_types_allowed=True)
 
 
 class MessageManager:
@@ -44,31 +76,42 @@ class MessageManager:
 		self.state = state
 		self.system_prompt = system_message
 
+		self.tokenizer = settings.tokenizer or get_tokenizer(settings.model_name, settings.estimated_characters_per_token)
+		self._image_token_formula = image_token_formula(settings.model_name)
+		# Token counts by message content, repeated messages are only tokenized once
+		self._token_counts: OrderedDict[bytes, int] = OrderedDict()
+
+		# Fingerprint and step of the last screenshot sent to the model
+		self._last_screenshot: Optional[tuple[bytes, int]] = None
+		# Url, step and elements of the page snapshot that state messages are diffed against
+		self._elements_snapshot: Optional[tuple[str, int, dict[tuple, str]]] = None
+		self._state_messages = 0
+
 		# Only initialize messages if state is empty
 		if len(self.state.history.messages) == 0:
 			self._init_messages()
 
 	def _init_messages(self) -> None:
 		"""Initialize the message history with system message, context, task, and other initial messages"""
-		self._add_message_with_tokens(self.system_prompt)
+		self._add_message_with_tokens(self.system_prompt, message_type='init')
 
 		if self.settings.message_context:
 			context_message = HumanMessage(content='Context for the task' + self.settings.message_context)
-			self._add_message_with_tokens(context_message)
+			self._add_message_with_tokens(context_message, message_type='init')
 
 		task_message = HumanMessage(
 			content=f'Your ultimate task is: """{self.task}""". If you achieved your ultimate task, stop everything and use the done action in the next step to complete the task. If not, continue as usual.'
 		)
-		self._add_message_with_tokens(task_message)
+		self._add_message_with_tokens(task_message, message_type='init')
 
 		if self.settings.sensitive_data:
 			info = f'Here are placeholders for sensitve data: {list(self.settings.sensitive_data.keys())}'
 			info += 'To use them, write <secret>the placeholder name</secret>'
 			info_message = HumanMessage(content=info)
-			self._add_message_with_tokens(info_message)
+			self._add_message_with_tokens(info_message, message_type='init')
 
 		placeholder_message = HumanMessage(content='Example output:')
-		self._add_message_with_tokens(placeholder_message)
+		self._add_message_with_tokens(placeholder_message, message_type='init')
 
 		tool_calls = [
 			{
@@ -90,20 +133,20 @@ class MessageManager:
 			content='',
 			tool_calls=tool_calls,
 		)
-		self._add_message_with_tokens(example_tool_call)
-		self.add_tool_message(content='Browser started')
+		self._add_message_with_tokens(example_tool_call, message_type='init')
+		self.add_tool_message(content='Browser started', message_type='init')
 
 		placeholder_message = HumanMessage(content='[Your task history memory starts here]')
-		self._add_message_with_tokens(placeholder_message)
+		self._add_message_with_tokens(placeholder_message, message_type='init')
 
 		if self.settings.available_file_paths:
 			filepaths_msg = HumanMessage(content=f'Here are file paths you can use: {self.settings.available_file_paths}')
-			self._add_message_with_tokens(filepaths_msg)
+			self._add_message_with_tokens(filepaths_msg, message_type='init')
 
 	def add_new_task(self, new_task: str) -> None:
 		content = f'Your new ultimate task is: """{new_task}""". Take the previous context into account and finish your new ultimate task. '
 		msg = HumanMessage(content=content)
-		self._add_message_with_tokens(msg)
+		self._add_message_with_tokens(msg, message_type='task')
 		self.task = new_task
 
 	@time_execution_sync('--add_state_message')
@@ -122,7 +165,7 @@ class MessageManager:
 				if r.include_in_memory:
 					if r.extracted_content:
 						msg = HumanMessage(content='Action result: ' + str(r.extracted_content))
-						self._add_message_with_tokens(msg)
+						self._add_message_with_tokens(msg, message_type='action_result')
 					if r.error:
 						# if endswith \n, remove it
 						if r.error.endswith('\n'):
@@ -130,17 +173,89 @@ class MessageManager:
 						# get only last line of error
 						last_line = r.error.split('\n')[-1]
 						msg = HumanMessage(content='Action error: ' + last_line)
-						self._add_message_with_tokens(msg)
+						self._add_message_with_tokens(msg, message_type='action_result')
 					result = None  # if result in history, we dont want to add it again
 
+		self._state_messages += 1
+		step_number = step_info.step_number + 1 if step_info else self._state_messages
+		send_screenshot = use_vision and bool(state.screenshot)
+		unchanged_since = None
+		if send_screenshot and self.settings.skip_unchanged_screenshots:
+			unchanged_since = self._screenshot_unchanged_since(state, step_number)
+			if unchanged_since is None:
+				self._add_screenshot_message(state, step_number)
+			# The screenshot message stays in the history, the state message only refers to it
+			send_screenshot = False
+		elements_diff = self._elements_diff(state, step_number) if self.settings.diff_state_messages else None
+
 		# otherwise add state message and result to next message (which will not stay in memory)
 		state_message = AgentMessagePrompt(
 			state,
 			result,
 			include_attributes=self.settings.include_attributes,
 			step_info=step_info,
-		).get_user_message(use_vision)
-		self._add_message_with_tokens(state_message)
+			elements_diff=elements_diff,
+			snapshot_step=self._elements_snapshot[1] if self._elements_snapshot else None,
+		).get_user_message(send_screenshot)
+		if self.settings.skip_unchanged_screenshots and self._last_screenshot is not None and use_vision and state.screenshot:
+			screenshot_step = self._last_screenshot[1]
+			if unchanged_since is None:
+				state_message.content += f'\nCurrent screenshot: the screenshot of step {screenshot_step} above.'
+			else:
+				state_message.content += (
+					f'\nScreenshot omitted: the screen is unchanged since the screenshot of step {screenshot_step} above.'
+				)
+				screenshot_url = f'data:{state.screenshot_media_type};base64,{state.screenshot}'
+				self.state.screenshot_tokens_saved += self._count_image_tokens({'image_url': {'url': screenshot_url}})
+				logger.debug(
+					f'Screen unchanged since step {screenshot_step}, {self.state.screenshot_tokens_saved} image tokens saved'
+				)
+		self._add_message_with_tokens(state_message, message_type='state')
+
+	def _elements_diff(self, state: BrowserState, step_number: int) -> List[str]:
+		"""
+		Changes of the interactive elements since the page snapshot in the history. Takes a new snapshot, which has no
+		changes, after navigation, every full_state_interval steps or when the changes are larger than half the page.
+		"""
+		elements = HistoryTreeProcessor.clickable_elements_by_key(state.element_tree, self.settings.include_attributes)
+		if self._elements_snapshot is not None:
+			url, snapshot_step, snapshot = self._elements_snapshot
+			if url == state.url and step_number - snapshot_step < self.settings.full_state_interval:
+				changes = diff_clickable_elements(snapshot, elements)
+				if len(changes) <= len(elements) / 2:
+					return changes
+
+		# The snapshot stays in the history, so the model always sees what the changes refer to
+		self.state.history.remove_messages('elements_snapshot')
+		elements_text = '\n'.join(elements.values()) or 'empty page'
+		snapshot_message = HumanMessage(
+			content=f'Page snapshot of step {step_number} ({state.url}), later states list the changes since this snapshot.\n'
+			f'Interactive elements from top layer of the page inside the viewport:\n{elements_text}'
+		)
+		self._add_message_with_tokens(snapshot_message, message_type='elements_snapshot')
+		self._elements_snapshot = (state.url, step_number, elements)
+		return []
+
+	def _screenshot_unchanged_since(self, state: BrowserState, step_number: int) -> Optional[int]:
+		"""Step of the last screenshot sent if the screen did not visibly change since, else remembers this one"""
+		fingerprint = screenshot_fingerprint(state.screenshot)
+		if self._last_screenshot is not None:
+			last_fingerprint, last_step = self._last_screenshot
+			if screenshot_change(last_fingerprint, fingerprint) < self.settings.screenshot_change_threshold:
+				return last_step
+		self._last_screenshot = (fingerprint, step_number)
+		return None
+
+	def _add_screenshot_message(self, state: BrowserState, step_number: int) -> None:
+		"""Replaces the screenshot kept in the history, state messages of an unchanged screen refer to it"""
+		self.state.history.remove_messages('screenshot')
+		screenshot_message = HumanMessage(
+			content=[
+				{'type': 'text', 'text': f'Screenshot of step {step_number} ({state.url}):'},
+				{'type': 'image_url', 'image_url': {'url': f'data:{state.screenshot_media_type};base64,{state.screenshot}'}},
+			]
+		)
+		self._add_message_with_tokens(screenshot_message, message_type='screenshot')
 
 	def add_model_output(self, model_output: AgentOutput) -> None:
 		"""Add model output as AI message"""
@@ -158,20 +273,52 @@ class MessageManager:
 			tool_calls=tool_calls,
 		)
 
-		self._add_message_with_tokens(msg)
+		self._add_message_with_tokens(msg, message_type='model_output')
 		# empty tool response
 		self.add_tool_message(content='')
 
 	def add_plan(self, plan: Optional[str], position: int | None = None) -> None:
 		if plan:
 			msg = AIMessage(content=plan)
-			self._add_message_with_tokens(msg, position)
+			self._add_message_with_tokens(msg, position, message_type='plan')
+
+	@time_execution_async('--compact_history')
+	async def compact_history(self) -> None:
+		"""Apply the compaction policies to the history between the initial messages and the current state message"""
+		if not self.settings.compaction_policies:
+			return
+
+		messages = self.state.history.messages
+		start = 0
+		while start < len(messages) and messages[start].metadata.message_type == 'init':
+			start += 1
+		end = len(messages)
+		if end > start and messages[-1].metadata.message_type == 'state':
+			end -= 1
+
+		compacted = messages[start:end]
+		for policy in self.settings.compaction_policies:
+			compacted = await policy.compact(compacted)
+
+		# Only messages created by the policies need to be counted
+		kept = {id(m) for m in messages}
+		for m in compacted:
+			if id(m) not in kept:
+				m.metadata.tokens = self._count_tokens(m.message)
+
+		tokens_before = self.state.history.current_tokens
+		self.state.history.messages = messages[:start] + compacted + messages[end:]
+		self.state.history.current_tokens = sum(m.metadata.tokens for m in self.state.history.messages)
+		if self.state.history.current_tokens != tokens_before:
+			logger.debug(f'Compacted history from {tokens_before} to {self.state.history.current_tokens} tokens')
 
 	@time_execution_sync('--get_messages')
 	def get_messages(self) -> List[BaseMessage]:
 		"""Get current message list, potentially trimmed to max tokens"""
 
 		msg = [m.message for m in self.state.history.messages]
+		if self.settings.cache_prompt_prefix:
+			msg = self._add_cache_breakpoints(msg)
 		# debug which messages are in history with token count # log
 		total_input_tokens = 0
 		logger.debug(f'Messages in history: {len(self.state.history.messages)}:')
@@ -182,7 +329,38 @@ class MessageManager:
 
 		return msg
 
-	def _add_message_with_tokens(self, message: BaseMessage, position: int | None = None) -> None:
+	def _add_cache_breakpoints(self, messages: List[BaseMessage]) -> List[BaseMessage]:
+		"""
+		Returns the messages with cache breakpoints after the initial messages, which are the same on every step, and after
+		the last history message before the current state, which only grows until the next compaction.
+		The history itself is not changed, so token counts and saved conversations stay as they are.
+		"""
+		managed = self.state.history.messages
+		breakpoints = []
+		prefix_end = max((i for i, m in enumerate(managed) if m.metadata.message_type == 'init'), default=None)
+		if prefix_end is not None:
+			breakpoints.append(prefix_end)
+		for i in range(len(managed) - 1, prefix_end if prefix_end is not None else -1, -1):
+			if managed[i].metadata.message_type in ('task', 'action_result', 'summary', 'elements_snapshot', 'screenshot'):
+				breakpoints.append(i)
+				break
+
+		messages = list(messages)
+		for i in breakpoints:
+			message = messages[i]
+			# cache_control goes on a content block, the last one of messages with several (the kept screenshot)
+			if not isinstance(message, (HumanMessage, SystemMessage)) or not message.content:
+				continue
+			if isinstance(message.content, str):
+				content = [{'type': 'text', 'text': message.content, 'cache_control': {'type': 'ephemeral'}}]
+			else:
+				content = [*message.content[:-1], {**message.content[-1], 'cache_control': {'type': 'ephemeral'}}]
+			messages[i] = message.model_copy(update={'content': content})
+		return messages
+
+	def _add_message_with_tokens(
+		self, message: BaseMessage, position: int | None = None, message_type: Optional[str] = None
+	) -> None:
 		"""Add message with token count metadata
 		position: None for last, -1 for second last, etc.
 		"""
@@ -192,38 +370,37 @@ class MessageManager:
 			message = self._filter_sensitive_data(message)
 
 		token_count = self._count_tokens(message)
-		metadata = MessageMetadata(tokens=token_count)
+		metadata = MessageMetadata(tokens=token_count, message_type=message_type)
 		self.state.history.add_message(message, metadata, position)
 
 	@time_execution_sync('--filter_sensitive_data')
 	def _filter_sensitive_data(self, message: BaseMessage) -> BaseMessage:
 		"""Filter out sensitive data from the message"""
-
-		def replace_sensitive(value: str) -> str:
-			if not self.settings.sensitive_data:
-				return value
-			for key, val in self.settings.sensitive_data.items():
-				if not val:
-					continue
-				value = value.replace(val, f'<secret>{key}</secret>')
-			return value
+		if not self.settings.sensitive_data:
+			return message
+		redactor = SensitiveDataRedactor.for_secrets(self.settings.sensitive_data)
 
 		if isinstance(message.content, str):
-			message.content = replace_sensitive(message.content)
+			message.content = redactor.redact(message.content)
 		elif isinstance(message.content, list):
-			for i, item in enumerate(message.content):
+			for item in message.content:
 				if isinstance(item, dict) and 'text' in item:
-					item['text'] = replace_sensitive(item['text'])
-					message.content[i] = item
+					item['text'] = redactor.redact(item['text'])
 		return message
 
 	def _count_tokens(self, message: BaseMessage) -> int:
-		"""Count tokens in a message using the model's tokenizer"""
+		"""Count tokens in a message using the model's tokenizer, memoized by message id or content"""
+		key = self._token_count_key(message)
+		tokens = self._token_counts.get(key)
+		if tokens is not None:
+			self._token_counts.move_to_end(key)
+			return tokens
+
 		tokens = 0
 		if isinstance(message.content, list):
 			for item in message.content:
 				if 'image_url' in item:
-					tokens += self.settings.image_tokens
+					tokens += self._count_image_tokens(item)
 				elif isinstance(item, dict) and 'text' in item:
 					tokens += self._count_text_tokens(item['text'])
 		else:
@@ -231,12 +408,32 @@ class MessageManager:
 			if hasattr(message, 'tool_calls'):
 				msg += str(message.tool_calls)  # type: ignore
 			tokens += self._count_text_tokens(msg)
+
+		self._token_counts[key] = tokens
+		if len(self._token_counts) > _TOKEN_COUNT_CACHE_SIZE:
+			self._token_counts.popitem(last=False)
 		return tokens
 
+	@staticmethod
+	def _token_count_key(message: BaseMessage) -> bytes:
+		if message.id:
+			return f'{message.type}:{message.id}'.encode()
+		content = f'{message.type}:{message.content}:{getattr(message, "tool_calls", "")}'
+		return hashlib.blake2b(content.encode(), digest_size=16).digest()
+
 	def _count_text_tokens(self, text: str) -> int:
 		"""Count tokens in a text string"""
-		tokens = len(text) // self.settings.estimated_characters_per_token  # Rough estimate if no tokenizer available
-		return tokens
+		return self.tokenizer.count(text)
+
+	def _count_image_tokens(self, item: dict) -> int:
+		"""Count tokens of an image from its size, with the formula of the model's provider"""
+		if self._image_token_formula is None:
+			return self.settings.image_tokens
+		image_url = item['image_url']
+		size = image_size(image_url['url'] if isinstance(image_url, dict) else image_url)
+		if size is None:
+			return self.settings.image_tokens
+		return count_image_tokens(*size, self._image_token_formula)
 
 	def cut_messages(self):
 		"""Get current message list, potentially trimmed to max tokens"""
@@ -252,11 +449,13 @@ class MessageManager:
 			for item in msg.message.content:
 				if 'image_url' in item:
 					msg.message.content.remove(item)
-					diff -= self.settings.image_tokens
-					msg.metadata.tokens -= self.settings.image_tokens
-					self.state.history.current_tokens -= self.settings.image_tokens
+					image_tokens = self._count_image_tokens(item)
+					diff -= image_tokens
+					msg.metadata.tokens -= image_tokens
+					self.state.history.current_tokens -= image_tokens
 					logger.debug(
-						f'Removed image with {self.settings.image_tokens} tokens - total tokens now: {self.state.history.current_tokens}/{self.settings.max_input_tokens}'
+						f'Removed image with {image_tokens} tokens - '
+						f'total tokens now: {self.state.history.current_tokens}/{self.settings.max_input_tokens}'
 					)
 				elif 'text' in item and isinstance(item, dict):
 					text += item['text']
@@ -287,7 +486,7 @@ class MessageManager:
 
 		# new message with updated content
 		msg = HumanMessage(content=content)
-		self._add_message_with_tokens(msg)
+		self._add_message_with_tokens(msg, message_type='state')
 
 		last_msg = self.state.history.messages[-1]
 
@@ -299,8 +498,8 @@ class MessageManager:
 		"""Remove last state message from history"""
 		self.state.history.remove_last_state_message()
 
-	def add_tool_message(self, content: str) -> None:
+	def add_tool_message(self, content: str, message_type: str = 'tool') -> None:
 		"""Add tool message to history"""
 		msg = ToolMessage(content=content, tool_call_id=str(self.state.tool_id))
 		self.state.tool_id += 1
-		self._add_message_with_tokens(msg)
+		self._add_message_with_tokens(msg, message_type=message_type)
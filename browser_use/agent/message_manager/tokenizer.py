@@ -0,0 +1,154 @@
+"""
+Token counting for the message history, with adapters for real tokenizers and per provider image token formulas.
+"""
+
+from __future__ import annotations
+
+import base64
+import logging
+import math
+import struct
+from abc import ABC, abstractmethod
+from typing import Literal, Optional
+
+logger = logging.getLogger(__name__)
+
+ImageTokenFormula = Literal['openai', 'anthropic', 'google']
+
+
+class Tokenizer(ABC):
+	"""Counts the tokens of a text the way the model will"""
+
+	@abstractmethod
+	def count(self, text: str) -> int:
+		"""Returns the number of tokens in text"""
+
+
+class EstimatedTokenizer(Tokenizer):
+	"""
+	Estimates tokens from the number of characters, used when no tokenizer for the model is available.
+	"""
+
+	def __init__(self, characters_per_token: int = 3):
+		self.characters_per_token = characters_per_token
+
+	def count(self, text: str) -> int:
+		return len(text) // self.characters_per_token
+
+
+class TiktokenTokenizer(Tokenizer):
+	"""
+	BPE tokenizer of OpenAI models, needs tiktoken (installed with langchain-openai).
+	"""
+
+	def __init__(self, model_name: Optional[str] = None, encoding_name: str = 'o200k_base'):
+		import tiktoken
+
+		try:
+			self.encoding = tiktoken.encoding_for_model(model_name) if model_name else tiktoken.get_encoding(encoding_name)
+		except KeyError:
+			# Model unknown to this tiktoken version
+			self.encoding = tiktoken.get_encoding(encoding_name)
+
+	def count(self, text: str) -> int:
+		return len(self.encoding.encode(text, disallowed_special=()))
+
+
+class HuggingFaceTokenizer(Tokenizer):
+	"""
+	Tokenizer of a local or hub model, needs the tokenizers package.
+	"""
+
+	def __init__(self, name_or_path: str):
+		from tokenizers import Tokenizer as _Tokenizer
+
+		if name_or_path.endswith('.json'):
+			self.tokenizer = _Tokenizer.from_file(name_or_path)
+		else:
+			self.tokenizer = _Tokenizer.from_pretrained(name_or_path)
+
+	def count(self, text: str) -> int:
+		return len(self.tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+def get_tokenizer(model_name: Optional[str], characters_per_token: int = 3) -> Tokenizer:
+	"""Returns the tokenizer of the model, or an estimate when it has none we can load"""
+	if model_name and model_name.startswith(('gpt-', 'o1', 'o3', 'o4', 'chatgpt-')):
+		try:
+			return TiktokenTokenizer(model_name)
+		except Exception as e:
+			# tiktoken not installed or its encoding cannot be downloaded
+			logger.debug(f'Could not load tiktoken for {model_name}, estimating tokens: {e}')
+	return EstimatedTokenizer(characters_per_token)
+
+
+def image_token_formula(model_name: Optional[str]) -> Optional[ImageTokenFormula]:
+	"""Returns how the provider of the model counts image tokens, None if unknown"""
+	if not model_name:
+		return None
+	if model_name.startswith(('gpt-', 'o1', 'o3', 'o4', 'chatgpt-')):
+		return 'openai'
+	if 'claude' in model_name:
+		return 'anthropic'
+	if 'gemini' in model_name:
+		return 'google'
+	return None
+
+
+def count_image_tokens(width: int, height: int, formula: ImageTokenFormula) -> int:
+	"""Tokens of an image of this size, as documented by the provider"""
+	if formula == 'openai':
+		# High detail: fit into 2048x2048, scale the shortest side down to 768, then 170 tokens per 512px tile
+		scale = min(1.0, 2048 / max(width, height))
+		width, height = width * scale, height * scale
+		scale = min(1.0, 768 / min(width, height))
+		width, height = width * scale, height * scale
+		return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+	if formula == 'anthropic':
+		# Images are scaled to at most 1568px on the long edge and about 1.15 megapixels
+		scale = min(1.0, 1568 / max(width, height), math.sqrt(1_150_000 / (width * height)))
+		return math.ceil(width * scale * height * scale / 750)
+	# google: 258 tokens for small images, else 258 per 768x768 tile
+	if width <= 384 and height <= 384:
+		return 258
+	return 258 * math.ceil(width / 768) * math.ceil(height / 768)
+
+
+def image_size(image_url: str) -> Optional[tuple[int, int]]:
+	"""Reads width and height from the header of a base64 data URL (png, jpeg, webp or gif)"""
+	if not image_url.startswith('data:') or ',' not in image_url:
+		return None
+	# The size is near the start, decode only the first 48KB
+	encoded = image_url.split(',', 1)[1][:65536]
+	try:
+		data = base64.b64decode(encoded[: len(encoded) // 4 * 4])
+	except ValueError:
+		return None
+
+	if data.startswith(b'\x89PNG\r\n\x1a\n') and len(data) >= 24:
+		return struct.unpack('>II', data[16:24])
+	if data[:6] in (b'GIF87a', b'GIF89a') and len(data) >= 10:
+		return struct.unpack('<HH', data[6:10])
+	if data.startswith(b'RIFF') and data[8:12] == b'WEBP' and len(data) >= 30:
+		chunk = data[12:16]
+		if chunk == b'VP8X':
+			return int.from_bytes(data[24:27], 'little') + 1, int.from_bytes(data[27:30], 'little') + 1
+		if chunk == b'VP8 ':
+			width, height = struct.unpack('<HH', data[26:30])
+			return width & 0x3FFF, height & 0x3FFF
+		if chunk == b'VP8L':
+			bits = int.from_bytes(data[21:25], 'little')
+			return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+		return None
+	if data.startswith(b'\xff\xd8'):
+		# Walk the JPEG segments up to the start of frame marker
+		offset = 2
+		while offset + 9 < len(data):
+			if data[offset] != 0xFF:
+				return None
+			marker = data[offset + 1]
+			if marker in (0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF):
+				height, width = struct.unpack('>HH', data[offset + 5 : offset + 9])
+				return width, height
+			offset += 2 + struct.unpack('>H', data[offset + 2 : offset + 4])[0]
+	return None
@@ -1,5 +1,8 @@
 from __future__ import annotations
 
+import base64
+import hashlib
+import io
 import json
 import logging
 import os
@@ -125,3 +128,51 @@ def _write_response_to_file(f: Any, response: Any) -> None:
 	"""Write model response to conversation file"""
 	f.write(' RESPONSE\n')
 	f.write(json.dumps(json.loads(response.model_dump_json(exclude_unset=True)), indent=2))
+
+
+# Size of the grayscale thumbnails screenshots are compared by
+_FINGERPRINT_SIZE = (64, 40)
+# Gray levels a thumbnail pixel has to change by to count as changed, below are compression and anti-aliasing noise
+_PIXEL_CHANGE_THRESHOLD = 16
+
+
+def screenshot_fingerprint(screenshot_b64: str) -> bytes:
+	"""
+	Small grayscale thumbnail of a base64 encoded screenshot to compare it with others.
+	Without Pillow, a hash of the image bytes, so only identical screenshots compare as unchanged.
+	"""
+	data = base64.b64decode(screenshot_b64)
+	try:
+		from PIL import Image
+	except ImportError:
+		return hashlib.blake2b(data, digest_size=16).digest()
+
+	with Image.open(io.BytesIO(data)) as image:
+		image.draft('L', _FINGERPRINT_SIZE)
+		return image.convert('L').resize(_FINGERPRINT_SIZE, Image.Resampling.BOX).tobytes()
+
+
+def screenshot_change(fingerprint: bytes, other: bytes) -> float:
+	"""Fraction of the thumbnail that changed between two screenshot fingerprints, from 0 to 1"""
+	if len(fingerprint) != len(other):
+		return 1.0
+	if len(fingerprint) != _FINGERPRINT_SIZE[0] * _FINGERPRINT_SIZE[1]:
+		return 0.0 if fingerprint == other else 1.0
+	changed = sum(1 for a, b in zip(fingerprint, other) if abs(a - b) > _PIXEL_CHANGE_THRESHOLD)
+	return changed / len(fingerprint)
+
+
+def diff_clickable_elements(snapshot: dict[tuple, str], current: dict[tuple, str]) -> list[str]:
+	"""
+	Changes from one clickable_elements_by_key result to another: added and changed lines in page order, then removed lines.
+	An element whose highlight index changed is changed.
+	"""
+	changes = []
+	for key, line in current.items():
+		previous = snapshot.get(key)
+		if previous is None:
+			changes.append(f'+ {line}')
+		elif previous != line:
+			changes.append(f'~ {line}')
+	changes.extend(f'- {line}' for key, line in snapshot.items() if key not in current)
+	return changes
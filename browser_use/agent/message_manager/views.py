@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Any
+from typing import TYPE_CHECKING, Any, Optional
 
 from langchain_core.load import dumpd, load
 from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
@@ -14,6 +14,8 @@ class MessageMetadata(BaseModel):
 	"""Metadata for a message"""
 
 	tokens: int = 0
+	# What the message is, e.g. init, task, state, model_output, tool, action_result, plan, summary or elements_snapshot
+	message_type: Optional[str] = None
 
 
 class ManagedMessage(BaseModel):
@@ -113,6 +115,13 @@ class MessageHistory(BaseModel):
 				self.messages.pop(i)
 				break
 
+	def remove_messages(self, message_type: str) -> None:
+		"""Remove all messages of a type from history"""
+		removed = [m for m in self.messages if m.metadata.message_type == message_type]
+		if removed:
+			self.messages = [m for m in self.messages if m.metadata.message_type != message_type]
+			self.current_tokens -= sum(m.metadata.tokens for m in removed)
+
 	def remove_last_state_message(self) -> None:
 		"""Remove last state message from history"""
 		if len(self.messages) > 2 and isinstance(self.messages[-1].message, HumanMessage):
@@ -125,5 +134,7 @@ class MessageManagerState(BaseModel):
 
 	history: MessageHistory = Field(default_factory=MessageHistory)
 	tool_id: int = 1
+	# Image tokens of screenshots not added to the history again because the screen was unchanged
+	screenshot_tokens_saved: int = 0
 
 	model_config = ConfigDict(arbitrary_types_allowed=True)
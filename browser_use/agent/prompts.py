@@ -67,14 +67,22 @@ class AgentMessagePrompt:
 		result: Optional[List['ActionResult']] = None,
 		include_attributes: list[str] = [],
 		step_info: Optional['AgentStepInfo'] = None,
+		elements_diff: Optional[List[str]] = None,
+		snapshot_step: Optional[int] = None,
 	):
 		self.state = state
 		self.result = result
 		self.include_attributes = include_attributes
 		self.step_info = step_info
+		# Changes of the interactive elements since the page snapshot of snapshot_step, which is in the history
+		self.elements_diff = elements_diff
+		self.snapshot_step = snapshot_step
 
 	def get_user_message(self, use_vision: bool = True) -> HumanMessage:
-		elements_text = self.state.element_tree.clickable_elements_to_string(include_attributes=self.include_attributes)
+		if self.elements_diff is not None:
+			elements_text = self._elements_diff_text()
+		else:
+			elements_text = self.state.element_tree.clickable_elements_to_string(include_attributes=self.include_attributes)
 
 		has_content_above = (self.state.pixels_above or 0) > 0
 		has_content_below = (self.state.pixels_below or 0) > 0
@@ -130,13 +138,24 @@ Interactive elements from top layer of the current page inside the viewport:
 					{'type': 'text', 'text': state_description},
 					{
 						'type': 'image_url',
-						'image_url': {'url': f'data:image/png;base64,{self.state.screenshot}'},  # , 'detail': 'low'
+						'image_url': {
+							'url': f'data:{self.state.screenshot_media_type};base64,{self.state.screenshot}'
+						},  # , 'detail': 'low'
 					},
 				]
 			)
 
 		return HumanMessage(content=state_description)
 
+	def _elements_diff_text(self) -> str:
+		if not self.elements_diff:
+			return f'Unchanged since the page snapshot of step {self.snapshot_step}.'
+		changes = '\n'.join(self.elements_diff)
+		return (
+			f'Changes since the page snapshot of step {self.snapshot_step} (+ added, - removed, ~ changed), '
+			f'all other elements of the snapshot are unchanged and keep their index:\n{changes}'
+		)
+
 
 class PlannerPrompt(SystemPrompt):
 	def get_system_message(self) -> SystemMessage:
@@ -5,6 +5,7 @@ import json
 import logging
 import re
 import time
+from concurrent.futures import Future
 from pathlib import Path
 from typing import Any, Awaitable, Callable, Dict, Generic, List, Optional, TypeVar
 
@@ -19,8 +20,10 @@ from langchain_core.messages import (
 # from lmnr.sdk.decorators import observe
 from pydantic import BaseModel, ValidationError
 
-from browser_use.agent.gif import create_history_gif
+from browser_use.agent.gif import HistoryGifWriter
+from browser_use.agent.message_manager.compaction import CompactionPolicy
 from browser_use.agent.message_manager.service import MessageManager, MessageManagerSettings
+from browser_use.agent.message_manager.tokenizer import Tokenizer
 from browser_use.agent.message_manager.utils import convert_input_messages, extract_json_from_model_output, save_conversation
 from browser_use.agent.prompts import AgentMessagePrompt, PlannerPrompt, SystemPrompt
 from browser_use.agent.views import (
@@ -37,6 +40,7 @@ from browser_use.agent.views import (
 )
 from browser_use.browser.browser import Browser
 from browser_use.browser.context import BrowserContext
+from browser_use.browser.screenshot_store import ScreenshotStore
 from browser_use.browser.views import BrowserState, BrowserStateHistory
 from browser_use.controller.registry.views import ActionModel
 from browser_use.controller.service import Controller
@@ -96,6 +100,10 @@ class Agent(Generic[Context]):
 		# Agent settings
 		use_vision: bool = True,
 		use_vision_for_planner: bool = False,
+		skip_unchanged_screenshots: bool = False,
+		cache_prompt_prefix: Optional[bool] = None,
+		diff_state_messages: bool = False,
+		full_state_interval: int = 10,
 		save_conversation_path: Optional[str] = None,
 		save_conversation_path_encoding: Optional[str] = 'utf-8',
 		max_failures: int = 3,
@@ -103,9 +111,13 @@ class Agent(Generic[Context]):
 		override_system_message: Optional[str] = None,
 		extend_system_message: Optional[str] = None,
 		max_input_tokens: int = 128000,
+		tokenizer: Optional[Tokenizer] = None,
+		compaction_policies: Optional[list[CompactionPolicy]] = None,
 		validate_output: bool = False,
 		message_context: Optional[str] = None,
 		generate_gif: bool | str = False,
+		wait_for_gif: bool = True,
+		screenshot_store: Optional[ScreenshotStore] = None,
 		available_file_paths: Optional[list[str]] = None,
 		include_attributes: list[str] = [
 			'title',
@@ -141,6 +153,10 @@ class Agent(Generic[Context]):
 		self.settings = AgentSettings(
 			use_vision=use_vision,
 			use_vision_for_planner=use_vision_for_planner,
+			skip_unchanged_screenshots=skip_unchanged_screenshots,
+			cache_prompt_prefix=cache_prompt_prefix,
+			diff_state_messages=diff_state_messages,
+			full_state_interval=full_state_interval,
 			save_conversation_path=save_conversation_path,
 			save_conversation_path_encoding=save_conversation_path_encoding,
 			max_failures=max_failures,
@@ -151,6 +167,7 @@ class Agent(Generic[Context]):
 			validate_output=validate_output,
 			message_context=message_context,
 			generate_gif=generate_gif,
+			wait_for_gif=wait_for_gif,
 			available_file_paths=available_file_paths,
 			include_attributes=include_attributes,
 			max_actions_per_step=max_actions_per_step,
@@ -160,6 +177,16 @@ class Agent(Generic[Context]):
 			planner_interval=planner_interval,
 		)
 
+		# With a store, history keeps references into it instead of base64 screenshots, identical screenshots are kept once
+		self.screenshot_store = screenshot_store
+
+		# GIF of the run, rendered step by step; gif_future resolves to its path once the run finished
+		self._gif_writer: Optional[HistoryGifWriter] = None
+		self.gif_future: Optional[Future[Optional[str]]] = None
+
+		# Prompt cache usage of the last model call, recorded in the step metadata
+		self._input_token_details: dict[str, Any] = {}
+
 		# Initialize state
 		self.state = injected_agent_state or AgentState()
 
@@ -188,10 +215,17 @@ class Agent(Generic[Context]):
 			).get_system_message(),
 			settings=MessageManagerSettings(
 				max_input_tokens=self.settings.max_input_tokens,
+				model_name=self.model_name,
+				tokenizer=tokenizer,
+				compaction_policies=compaction_policies or [],
 				include_attributes=self.settings.include_attributes,
 				message_context=self.settings.message_context,
 				sensitive_data=sensitive_data,
 				available_file_paths=self.settings.available_file_paths,
+				skip_unchanged_screenshots=self.settings.skip_unchanged_screenshots,
+				cache_prompt_prefix=self._uses_prompt_cache_breakpoints(),
+				diff_state_messages=self.settings.diff_state_messages,
+				full_state_interval=self.settings.full_state_interval,
 			),
 			state=self.state.message_manager_state,
 		)
@@ -260,6 +294,12 @@ class Agent(Generic[Context]):
 		self.version = version
 		self.source = source
 
+	def _uses_prompt_cache_breakpoints(self) -> bool:
+		"""Anthropic models only cache prompts up to explicit breakpoints, OpenAI caches prefixes automatically"""
+		if self.settings.cache_prompt_prefix is not None:
+			return self.settings.cache_prompt_prefix
+		return self.chat_model_library == 'ChatAnthropic'
+
 	def _set_model_names(self) -> None:
 		self.chat_model_library = self.llm.__class__.__name__
 		self.model_name = 'Unknown'
@@ -330,6 +370,7 @@ class Agent(Generic[Context]):
 		result: list[ActionResult] = []
 		step_start_time = time.time()
 		tokens = 0
+		self._input_token_details = {}
 
 		try:
 			state = await self.browser_context.get_state()
@@ -337,6 +378,7 @@ class Agent(Generic[Context]):
 			await self._raise_if_stopped_or_paused()
 
 			self._message_manager.add_state_message(state, self.state.last_result, step_info, self.settings.use_vision)
+			await self._message_manager.compact_history()
 
 			# Run planner at specified intervals if planner is configured
 			if self.settings.planner_llm and self.state.n_steps % self.settings.planner_interval == 0:
@@ -421,6 +463,8 @@ class Agent(Generic[Context]):
 					step_start_time=step_start_time,
 					step_end_time=step_end_time,
 					input_tokens=tokens,
+					cache_read_input_tokens=self._input_token_details.get('cache_read'),
+					cache_creation_input_tokens=self._input_token_details.get('cache_creation'),
 				)
 				self._make_history_item(model_output, state, result, metadata)
 
@@ -473,13 +517,23 @@ class Agent(Generic[Context]):
 		else:
 			interacted_elements = [None]
 
-		state_history = BrowserStateHistory(
-			url=state.url,
-			title=state.title,
-			tabs=state.tabs,
-			interacted_element=interacted_elements,
-			screenshot=state.screenshot,
-		)
+		if self.screenshot_store is not None and state.screenshot:
+			state_history = BrowserStateHistory(
+				url=state.url,
+				title=state.title,
+				tabs=state.tabs,
+				interacted_element=interacted_elements,
+				screenshot_ref=self.screenshot_store.put_base64(state.screenshot),
+				screenshot_store=self.screenshot_store,
+			)
+		else:
+			state_history = BrowserStateHistory(
+				url=state.url,
+				title=state.title,
+				tabs=state.tabs,
+				interacted_element=interacted_elements,
+				screenshot=state.screenshot,
+			)
 
 		history_item = AgentHistory(model_output=model_output, result=result, state=state_history, metadata=metadata)
 
@@ -505,6 +559,7 @@ class Agent(Generic[Context]):
 
 		if self.tool_calling_method == 'raw':
 			output = self.llm.invoke(input_messages)
+			self._record_input_token_details(output)
 			# TODO: currently invoke does not return reasoning_content, we should override invoke
 			output.content = self._remove_think_tags(str(output.content))
 			try:
@@ -517,10 +572,12 @@ class Agent(Generic[Context]):
 		elif self.tool_calling_method is None:
 			structured_llm = self.llm.with_structured_output(self.AgentOutput, include_raw=True)
 			response: dict[str, Any] = await structured_llm.ainvoke(input_messages)  # type: ignore
+			self._record_input_token_details(response['raw'])
 			parsed: AgentOutput | None = response['parsed']
 		else:
 			structured_llm = self.llm.with_structured_output(self.AgentOutput, include_raw=True, method=self.tool_calling_method)
 			response: dict[str, Any] = await structured_llm.ainvoke(input_messages)  # type: ignore
+			self._record_input_token_details(response['raw'])
 			parsed: AgentOutput | None = response['parsed']
 
 		if parsed is None:
@@ -534,6 +591,13 @@ class Agent(Generic[Context]):
 
 		return parsed
 
+	def _record_input_token_details(self, message: Optional[BaseMessage]) -> None:
+		"""Remember the prompt cache usage the provider reported for the last model call"""
+		usage = getattr(message, 'usage_metadata', None) or {}
+		self._input_token_details = dict(usage.get('input_token_details') or {})
+		if self._input_token_details:
+			logger.debug(f'Prompt cache: {self._input_token_details}')
+
 	def _log_agent_run(self) -> None:
 		"""Log the agent run"""
 		logger.info(f'🚀 Starting task: {self.task}')
@@ -579,6 +643,12 @@ class Agent(Generic[Context]):
 		try:
 			self._log_agent_run()
 
+			if self.settings.generate_gif:
+				output_path: str = 'agent_history.gif'
+				if isinstance(self.settings.generate_gif, str):
+					output_path = self.settings.generate_gif
+				self._gif_writer = HistoryGifWriter(task=self.task, output_path=output_path)
+
 			# Execute initial actions if provided
 			if self.initial_actions:
 				result = await self.multi_act(self.initial_actions, check_for_new_elements=False)
@@ -603,6 +673,9 @@ class Agent(Generic[Context]):
 				step_info = AgentStepInfo(step_number=step, max_steps=max_steps)
 				await self.step(step_info)
 
+				if self._gif_writer:
+					await self._gif_writer.add_history(self.state.history)
+
 				if self.state.history.is_done():
 					if self.settings.validate_output and step < max_steps - 1:
 						if not await self._validate_output():
@@ -634,12 +707,13 @@ class Agent(Generic[Context]):
 			if not self.injected_browser and self.browser:
 				await self.browser.close()
 
-			if self.settings.generate_gif:
-				output_path: str = 'agent_history.gif'
-				if isinstance(self.settings.generate_gif, str):
-					output_path = self.settings.generate_gif
-
-				create_history_gif(task=self.task, history=self.state.history, output_path=output_path)
+			if self._gif_writer:
+				# Frames were rendered after every step, only the last ones and the end of the file are left
+				await self._gif_writer.add_history(self.state.history)
+				self.gif_future = self._gif_writer.close()
+				self._gif_writer = None
+				if self.settings.wait_for_gif:
+					await asyncio.wrap_future(self.gif_future)
 
 	# @observe(name='controller.multi_act')
 	@time_execution_async('--multi-act (agent)')
@@ -840,7 +914,7 @@ class Agent(Generic[Context]):
 		if not historical_element or not current_state.element_tree:
 			return action
 
-		current_element = HistoryTreeProcessor.find_history_element_in_tree(historical_element, current_state.element_tree)
+		current_element = HistoryTreeProcessor.find_history_element_in_state(historical_element, current_state)
 
 		if not current_element or current_element.highlight_index is None:
 			return None
@@ -862,7 +936,7 @@ class Agent(Generic[Context]):
 		"""
 		if not history_file:
 			history_file = 'AgentHistory.json'
-		history = AgentHistoryList.load_from_file(history_file, self.AgentOutput)
+		history = AgentHistoryList.load_from_file(history_file, self.AgentOutput, self.screenshot_store)
 		return await self.rerun_history(history, **kwargs)
 
 	def save_history(self, file_path: Optional[str | Path] = None) -> None:
@@ -12,6 +12,7 @@ from openai import RateLimitError
 from pydantic import BaseModel, ConfigDict, Field, ValidationError, create_model
 
 from browser_use.agent.message_manager.views import MessageManagerState
+from browser_use.browser.screenshot_store import ScreenshotStore
 from browser_use.browser.views import BrowserStateHistory
 from browser_use.controller.registry.views import ActionModel
 from browser_use.dom.history_tree_processor.service import (
@@ -29,6 +30,10 @@ class AgentSettings(BaseModel):
 
 	use_vision: bool = True
 	use_vision_for_planner: bool = False
+	skip_unchanged_screenshots: bool = False
+	cache_prompt_prefix: Optional[bool] = None
+	diff_state_messages: bool = False
+	full_state_interval: int = 10
 	save_conversation_path: Optional[str] = None
 	save_conversation_path_encoding: Optional[str] = 'utf-8'
 	max_failures: int = 3
@@ -37,6 +42,7 @@ class AgentSettings(BaseModel):
 	validate_output: bool = False
 	message_context: Optional[str] = None
 	generate_gif: bool | str = False
+	wait_for_gif: bool = True
 	available_file_paths: Optional[list[str]] = None
 	override_system_message: Optional[str] = None
 	extend_system_message: Optional[str] = None
@@ -105,12 +111,22 @@ class StepMetadata(BaseModel):
 	step_end_time: float
 	input_tokens: int  # Approximate tokens from message manager for this step
 	step_number: int
+	# Prompt cache usage reported by the provider, None if it reports none
+	cache_read_input_tokens: Optional[int] = None
+	cache_creation_input_tokens: Optional[int] = None
 
 	@property
 	def duration_seconds(self) -> float:
 		"""Calculate step duration in seconds"""
 		return self.step_end_time - self.step_start_time
 
+	@property
+	def cache_hit(self) -> Optional[bool]:
+		"""Whether part of the prompt was read from the provider's cache, None if unknown"""
+		if self.cache_read_input_tokens is None:
+			return None
+		return self.cache_read_input_tokens > 0
+
 
 class AgentBrain(BaseModel):
 	"""Current state of the agent"""
@@ -218,6 +234,10 @@ class AgentHistoryList(BaseModel):
 				total += h.metadata.input_tokens
 		return total
 
+	def total_cache_read_input_tokens(self) -> int:
+		"""Get total input tokens read from the provider's prompt cache across all steps"""
+		return sum(h.metadata.cache_read_input_tokens or 0 for h in self.history if h.metadata)
+
 	def input_token_usage(self) -> list[int]:
 		"""Get token usage for each step"""
 		return [h.metadata.input_tokens for h in self.history if h.metadata]
@@ -247,8 +267,10 @@ class AgentHistoryList(BaseModel):
 		}
 
 	@classmethod
-	def load_from_file(cls, filepath: str | Path, output_model: Type[AgentOutput]) -> 'AgentHistoryList':
-		"""Load history from JSON file"""
+	def load_from_file(
+		cls, filepath: str | Path, output_model: Type[AgentOutput], screenshot_store: Optional[ScreenshotStore] = None
+	) -> 'AgentHistoryList':
+		"""Load history from JSON file, screenshot references are read from screenshot_store when needed"""
 		with open(filepath, 'r', encoding='utf-8') as f:
 			data = json.load(f)
 		# loop through history and validate output_model actions to enrich with custom actions
@@ -261,6 +283,9 @@ class AgentHistoryList(BaseModel):
 			if 'interacted_element' not in h['state']:
 				h['state']['interacted_element'] = None
 		history = cls.model_validate(data)
+		if screenshot_store is not None:
+			for h in history.history:
+				h.state.screenshot_store = screenshot_store
 		return history
 
 	def last_action(self) -> None | dict:
@@ -310,7 +335,7 @@ class AgentHistoryList(BaseModel):
 
 	def screenshots(self) -> list[str | None]:
 		"""Get all screenshots from history"""
-		return [h.state.screenshot if h.state.screenshot is not None else None for h in self.history]
+		return [h.state.get_screenshot() for h in self.history]
 
 	def action_names(self) -> list[str]:
 		"""Get all action names from history"""
@@ -12,7 +12,9 @@ import re
 import time
 import uuid
 from dataclasses import dataclass, field
-from typing import TYPE_CHECKING, Optional, TypedDict
+from importlib import resources
+from typing import TYPE_CHECKING, Iterable, Literal, Optional, TypedDict
+from urllib.parse import urlparse
 
 from playwright._impl._errors import TimeoutError
 from playwright.async_api import Browser as PlaywrightBrowser
@@ -20,18 +22,20 @@ from playwright.async_api import (
 	BrowserContext as PlaywrightBrowserContext,
 )
 from playwright.async_api import (
+	CDPSession,
 	ElementHandle,
 	FrameLocator,
 	Page,
 )
 
+from browser_use.browser.highlights import draw_highlights
 from browser_use.browser.views import (
 	BrowserError,
 	BrowserState,
 	TabInfo,
 	URLNotAllowedError,
 )
-from browser_use.dom.service import DomService
+from browser_use.dom.service import BUILD_DOM_TREE_INIT_SCRIPT, DomService
 from browser_use.dom.views import DOMElementNode, SelectorMap
 from browser_use.utils import time_execution_async, time_execution_sync
 
@@ -40,12 +44,157 @@ if TYPE_CHECKING:
 
 logger = logging.getLogger(__name__)
 
+# Whether gc.freeze() was already called by a context of this process
+_gc_frozen = False
+
+# Requests that _wait_for_stable_network waits for
+_RELEVANT_RESOURCE_TYPES = frozenset({'document', 'stylesheet', 'image', 'font', 'script', 'iframe'})
+_RELEVANT_CONTENT_TYPE_PATTERN = re.compile(
+	'|'.join(
+		re.escape(content_type)
+		for content_type in ('text/html', 'text/css', 'application/javascript', 'image/', 'font/', 'application/json')
+	)
+)
+# Streaming or real-time responses
+_IGNORED_CONTENT_TYPE_PATTERN = re.compile(
+	'|'.join(
+		re.escape(content_type)
+		for content_type in ('streaming', 'video', 'audio', 'webm', 'mp4', 'event-stream', 'websocket', 'protobuf')
+	)
+)
+# URL substrings of requests that are not needed for the page, matched in one pass
+_IGNORED_URL_PATTERN = re.compile(
+	'|'.join(
+		re.escape(pattern)
+		for pattern in (
+			# Analytics and tracking
+			'analytics',
+			'tracking',
+			'telemetry',
+			'beacon',
+			'metrics',
+			# Ad-related
+			'doubleclick',
+			'adsystem',
+			'adserver',
+			'advertising',
+			# Social media widgets
+			'facebook.com/plugins',
+			'platform.twitter',
+			'linkedin.com/embed',
+			# Live chat and support
+			'livechat',
+			'zendesk',
+			'intercom',
+			'crisp.chat',
+			'hotjar',
+			# Push notifications
+			'push-notifications',
+			'onesignal',
+			'pushwoosh',
+			# Background sync/heartbeat
+			'heartbeat',
+			'ping',
+			'alive',
+			# WebRTC and streaming
+			'webrtc',
+			'rtmp://',
+			'wss://',
+			# Common CDNs for dynamic content
+			'cloudfront.net',
+			'fastly.net',
+		)
+	)
+)
+
+
+# Default blocklists of BrowserContextConfig.block_resources
+_DEFAULT_BLOCKED_RESOURCE_TYPES = ('media', 'font')
+_DEFAULT_BLOCKED_URL_PATTERNS = ('/ads/', 'adserver', 'adsystem', '/analytics.js', '/gtag/js', '/pixel.gif', 'telemetry')
+_DEFAULT_BLOCKED_DOMAINS = (
+	# Ads
+	'doubleclick.net',
+	'googlesyndication.com',
+	'googleadservices.com',
+	'amazon-adsystem.com',
+	'adnxs.com',
+	'criteo.com',
+	'pubmatic.com',
+	'rubiconproject.com',
+	'taboola.com',
+	'outbrain.com',
+	'moatads.com',
+	# Analytics and tracking
+	'google-analytics.com',
+	'googletagmanager.com',
+	'scorecardresearch.com',
+	'quantserve.com',
+	'hotjar.com',
+	'mixpanel.com',
+	'segment.io',
+)
+
+
+class RequestBlocker:
+	"""
+	Aborts requests by resource type, URL substring and domain (including subdomains), and counts what it blocked.
+	Top level documents are never blocked, so navigating to a page always works.
+	"""
+
+	def __init__(self, resource_types: Iterable[str], url_patterns: Iterable[str], domains: Iterable[str]):
+		self.resource_types = frozenset(resource_types)
+		url_patterns = [pattern.lower() for pattern in url_patterns]
+		self._url_pattern = re.compile('|'.join(re.escape(pattern) for pattern in url_patterns)) if url_patterns else None
+		self.domains = frozenset(domain.lower().lstrip('.') for domain in domains)
+
+		self.blocked_requests = 0
+		self.blocked_by_resource_type: dict[str, int] = {}
+
+	def should_block(self, request) -> bool:
+		resource_type = request.resource_type
+		if resource_type == 'document' and request.frame.parent_frame is None:
+			return False
+		if resource_type in self.resource_types:
+			return True
+
+		url = request.url.lower()
+		if self._url_pattern is not None and self._url_pattern.search(url):
+			return True
+
+		if self.domains:
+			host = urlparse(url).hostname or ''
+			# example.com, then its parent domains
+			while host:
+				if host in self.domains:
+					return True
+				host = host.partition('.')[2]
+		return False
+
+	async def handle_route(self, route):
+		request = route.request
+		if not self.should_block(request):
+			await route.fallback()
+			return
+
+		self.blocked_requests += 1
+		self.blocked_by_resource_type[request.resource_type] = self.blocked_by_resource_type.get(request.resource_type, 0) + 1
+		await route.abort('blockedbyclient')
+
 
 class BrowserContextWindowSize(TypedDict):
 	width: int
 	height: int
 
 
+class ScreenshotClip(TypedDict):
+	"""Region of the viewport in CSS pixels"""
+
+	x: float
+	y: float
+	width: float
+	height: float
+
+
 @dataclass
 class BrowserContextConfig:
 	"""
@@ -98,6 +247,10 @@ class BrowserContextConfig:
 	    highlight_elements: True
 	        Highlight elements in the DOM on the screen
 
+		highlight_mode: 'overlay'
+			How elements are highlighted: 'overlay' draws all boxes into one canvas overlay in the page, 'screenshot' draws them
+			onto the screenshot only (needs Pillow), so the page DOM is never changed.
+
 	    viewport_expansion: 500
 	        Viewport expansion in pixels. This amount will increase the number of elements which are included in the state what the LLM will see. If set to -1, all elements will be included (this leads to high token usage). If set to 0, only the elements which are visible in the viewport will be included.
 
@@ -107,6 +260,48 @@ class BrowserContextConfig:
 
 	    include_dynamic_attributes: bool = True
 	        Include dynamic attributes in the CSS selector. If you want to reuse the css_selectors, it might be better to set this to False.
+
+		incremental_dom_snapshots: False
+			Track DOM mutations with a MutationObserver and only re-evaluate changed subtrees when getting the page state.
+			Unchanged elements keep their highlight index between steps.
+
+		gc_thresholds: None
+			Generation thresholds passed to gc.set_threshold when the session starts, e.g. (50000, 50, 100) to collect less often.
+			Applies to the whole process.
+
+		gc_freeze_after_startup: False
+			Move all objects alive after the first session start into the permanent generation (gc.freeze), so collections do not
+			scan them again. Applies to the whole process.
+
+		screenshot_format: 'png'
+			Image format of screenshots: 'png', 'jpeg' or 'webp'. JPEG and WebP are much smaller to send to vision models.
+
+		screenshot_quality: None
+			Compression quality from 0 to 100 for 'jpeg' and 'webp' screenshots.
+
+		screenshot_max_dimension: None
+			Downscale screenshots so that their larger side is at most this many pixels, e.g. 1024.
+
+		screenshot_clip: None
+			Only capture this region of the viewport, e.g. {'x': 0, 'y': 0, 'width': 1280, 'height': 800}.
+
+		parallel_screenshot: False
+			Take the screenshot while the DOM is walked instead of after it. Only applies when highlight_elements is False, since
+			the screenshot has to show the highlights otherwise.
+
+		block_resources: False
+			Abort requests matching blocked_resource_types, blocked_url_patterns or blocked_domains, e.g. ads, trackers, media and
+			fonts. Blocked requests are counted on BrowserContext.request_blocker. Note that Playwright disables the HTTP cache of
+			a context with request routing.
+
+		blocked_resource_types: ['media', 'font']
+			Playwright resource types to block when block_resources is enabled.
+
+		blocked_url_patterns: ['/ads/', 'adserver', 'adsystem', ...]
+			Case-insensitive URL substrings to block when block_resources is enabled.
+
+		blocked_domains: ['doubleclick.net', 'google-analytics.com', ...]
+			Domains to block, including their subdomains, when block_resources is enabled.
 	"""
 
 	cookies_file: str | None = None
@@ -129,9 +324,22 @@ class BrowserContextConfig:
 	)
 
 	highlight_elements: bool = True
+	highlight_mode: Literal['overlay', 'screenshot'] = 'overlay'
 	viewport_expansion: int = 500
 	allowed_domains: list[str] | None = None
 	include_dynamic_attributes: bool = True
+	incremental_dom_snapshots: bool = False
+	gc_thresholds: tuple[int, int, int] | None = None
+	gc_freeze_after_startup: bool = False
+	screenshot_format: Literal['png', 'jpeg', 'webp'] = 'png'
+	screenshot_quality: int | None = None
+	screenshot_max_dimension: int | None = None
+	screenshot_clip: ScreenshotClip | None = None
+	parallel_screenshot: bool = False
+	block_resources: bool = False
+	blocked_resource_types: list[str] = field(default_factory=lambda: list(_DEFAULT_BLOCKED_RESOURCE_TYPES))
+	blocked_url_patterns: list[str] = field(default_factory=lambda: list(_DEFAULT_BLOCKED_URL_PATTERNS))
+	blocked_domains: list[str] = field(default_factory=lambda: list(_DEFAULT_BLOCKED_DOMAINS))
 
 	_force_keep_context_alive: bool = False
 
@@ -169,6 +377,21 @@ class BrowserContext:
 		# Initialize these as None - they'll be set up when needed
 		self.session: BrowserSession | None = None
 
+		# One DomService per page, so incremental snapshots can patch the previous tree
+		self._dom_services: dict[Page, DomService] = {}
+
+		# CDP sessions per page, for screenshots
+		self._cdp_sessions: dict[Page, CDPSession] = {}
+
+		# Seconds spent per phase by the last state update
+		self.state_timings: dict[str, float] = {}
+
+		self.request_blocker: RequestBlocker | None = None
+		if self.config.block_resources:
+			self.request_blocker = RequestBlocker(
+				self.config.blocked_resource_types, self.config.blocked_url_patterns, self.config.blocked_domains
+			)
+
 	async def __aenter__(self):
 		"""Async context manager entry"""
 		await self._initialize_session()
@@ -215,6 +438,10 @@ class BrowserContext:
 			# Dereference everything
 			self.session = None
 			self._page_event_handler = None
+			self._dom_services = {}
+			self._cdp_sessions = {}
+			if hasattr(self, 'current_state'):
+				del self.current_state
 
 	def __del__(self):
 		"""Cleanup when object is destroyed"""
@@ -282,8 +509,22 @@ class BrowserContext:
 		await active_page.bring_to_front()
 		await active_page.wait_for_load_state('load')
 
+		self._apply_gc_tuning()
+
 		return self.session
 
+	def _apply_gc_tuning(self):
+		"""Apply the garbage collector settings of the config, they are process wide"""
+		global _gc_frozen
+
+		if self.config.gc_thresholds is not None:
+			gc.set_threshold(*self.config.gc_thresholds)
+
+		# Freeze only once, objects frozen later would never be freed
+		if self.config.gc_freeze_after_startup and not _gc_frozen:
+			gc.freeze()
+			_gc_frozen = True
+
 	def _add_new_page_listener(self, context: PlaywrightBrowserContext):
 		async def on_page(page: Page):
 			if self.browser.config.cdp_url:
@@ -375,176 +616,121 @@ class BrowserContext:
             """
 		)
 
+		await context.add_init_script(BUILD_DOM_TREE_INIT_SCRIPT)
+
+		if self.config.incremental_dom_snapshots:
+			await context.add_init_script(resources.read_text('browser_use.dom', 'mutationObserver.js'))
+
+		if self.request_blocker:
+			await context.route('**/*', self.request_blocker.handle_route)
+
 		return context
 
 	async def _wait_for_stable_network(self):
+		"""
+		Waits until no relevant request has been pending for wait_for_network_idle_page_load_time,
+		at most maximum_wait_page_load_time. Wakes up from a timer that is re-armed on network activity,
+		instead of polling.
+		"""
 		page = await self.get_current_page()
+		loop = asyncio.get_running_loop()
+		idle_time = self.config.wait_for_network_idle_page_load_time
 
 		pending_requests = set()
-		last_activity = asyncio.get_event_loop().time()
-
-		# Define relevant resource types and content types
-		RELEVANT_RESOURCE_TYPES = {
-			'document',
-			'stylesheet',
-			'image',
-			'font',
-			'script',
-			'iframe',
-		}
-
-		RELEVANT_CONTENT_TYPES = {
-			'text/html',
-			'text/css',
-			'application/javascript',
-			'image/',
-			'font/',
-			'application/json',
-		}
-
-		# Additional patterns to filter out
-		IGNORED_URL_PATTERNS = {
-			# Analytics and tracking
-			'analytics',
-			'tracking',
-			'telemetry',
-			'beacon',
-			'metrics',
-			# Ad-related
-			'doubleclick',
-			'adsystem',
-			'adserver',
-			'advertising',
-			# Social media widgets
-			'facebook.com/plugins',
-			'platform.twitter',
-			'linkedin.com/embed',
-			# Live chat and support
-			'livechat',
-			'zendesk',
-			'intercom',
-			'crisp.chat',
-			'hotjar',
-			# Push notifications
-			'push-notifications',
-			'onesignal',
-			'pushwoosh',
-			# Background sync/heartbeat
-			'heartbeat',
-			'ping',
-			'alive',
-			# WebRTC and streaming
-			'webrtc',
-			'rtmp://',
-			'wss://',
-			# Common CDNs for dynamic content
-			'cloudfront.net',
-			'fastly.net',
-		}
-
-		async def on_request(request):
-			# Filter by resource type
-			if request.resource_type not in RELEVANT_RESOURCE_TYPES:
+		last_activity = loop.time()
+		idle = asyncio.Event()
+		idle_timer: Optional[asyncio.TimerHandle] = None
+
+		def update_idle_timer():
+			nonlocal idle_timer
+			if idle_timer is not None:
+				idle_timer.cancel()
+				idle_timer = None
+			if not pending_requests:
+				idle_timer = loop.call_at(last_activity + idle_time, idle.set)
+
+		def on_request(request):
+			# Filter by resource type, this also drops streaming, websocket and other real-time requests
+			if request.resource_type not in _RELEVANT_RESOURCE_TYPES:
 				return
 
-			# Filter out streaming, websocket, and other real-time requests
-			if request.resource_type in {
-				'websocket',
-				'media',
-				'eventsource',
-				'manifest',
-				'other',
-			}:
+			# Blocked requests are aborted right away
+			if self.request_blocker and self.request_blocker.should_block(request):
 				return
 
-			# Filter out by URL patterns
+			# Filter out data URLs, blob URLs and by URL patterns
 			url = request.url.lower()
-			if any(pattern in url for pattern in IGNORED_URL_PATTERNS):
-				return
-
-			# Filter out data URLs and blob URLs
-			if url.startswith(('data:', 'blob:')):
+			if url.startswith(('data:', 'blob:')) or _IGNORED_URL_PATTERN.search(url):
 				return
 
 			# Filter out requests with certain headers
 			headers = request.headers
-			if headers.get('purpose') == 'prefetch' or headers.get('sec-fetch-dest') in [
-				'video',
-				'audio',
-			]:
+			if headers.get('purpose') == 'prefetch' or headers.get('sec-fetch-dest') in ('video', 'audio'):
 				return
 
 			nonlocal last_activity
 			pending_requests.add(request)
-			last_activity = asyncio.get_event_loop().time()
+			last_activity = loop.time()
+			update_idle_timer()
 			# logger.debug(f'Request started: {request.url} ({request.resource_type})')
 
-		async def on_response(response):
+		def on_response(response):
 			request = response.request
 			if request not in pending_requests:
 				return
+			pending_requests.remove(request)
 
-			# Filter by content type if available
+			# Responses that are not needed for the page (streaming or real-time data, irrelevant content
+			# types, larger than 5MB) do not count as activity
 			content_type = response.headers.get('content-type', '').lower()
-
-			# Skip if content type indicates streaming or real-time data
-			if any(
-				t in content_type
-				for t in [
-					'streaming',
-					'video',
-					'audio',
-					'webm',
-					'mp4',
-					'event-stream',
-					'websocket',
-					'protobuf',
-				]
+			content_length = response.headers.get('content-length')
+			if (
+				_IGNORED_CONTENT_TYPE_PATTERN.search(content_type)
+				or not _RELEVANT_CONTENT_TYPE_PATTERN.search(content_type)
+				or (content_length and int(content_length) > 5 * 1024 * 1024)
 			):
-				pending_requests.remove(request)
+				update_idle_timer()
 				return
 
-			# Only process relevant content types
-			if not any(ct in content_type for ct in RELEVANT_CONTENT_TYPES):
-				pending_requests.remove(request)
-				return
+			nonlocal last_activity
+			last_activity = loop.time()
+			update_idle_timer()
+			# logger.debug(f'Request resolved: {request.url} ({content_type})')
 
-			# Skip if response is too large (likely not essential for page load)
-			content_length = response.headers.get('content-length')
-			if content_length and int(content_length) > 5 * 1024 * 1024:  # 5MB
-				pending_requests.remove(request)
+		def on_request_done(request):
+			# Requests that fail or finish without a response event would otherwise stay pending until the timeout
+			if request not in pending_requests:
 				return
-
 			nonlocal last_activity
 			pending_requests.remove(request)
-			last_activity = asyncio.get_event_loop().time()
-			# logger.debug(f'Request resolved: {request.url} ({content_type})')
+			last_activity = loop.time()
+			update_idle_timer()
 
 		# Attach event listeners
 		page.on('request', on_request)
 		page.on('response', on_response)
+		page.on('requestfailed', on_request_done)
+		page.on('requestfinished', on_request_done)
 
 		try:
-			# Wait for idle time
-			start_time = asyncio.get_event_loop().time()
-			while True:
-				await asyncio.sleep(0.1)
-				now = asyncio.get_event_loop().time()
-				if len(pending_requests) == 0 and (now - last_activity) >= self.config.wait_for_network_idle_page_load_time:
-					break
-				if now - start_time > self.config.maximum_wait_page_load_time:
-					logger.debug(
-						f'Network timeout after {self.config.maximum_wait_page_load_time}s with {len(pending_requests)} '
-						f'pending requests: {[r.url for r in pending_requests]}'
-					)
-					break
-
+			update_idle_timer()
+			try:
+				await asyncio.wait_for(idle.wait(), timeout=self.config.maximum_wait_page_load_time)
+			except asyncio.TimeoutError:
+				logger.debug(
+					f'Network timeout after {self.config.maximum_wait_page_load_time}s with {len(pending_requests)} '
+					f'pending requests: {[r.url for r in pending_requests]}'
+				)
 		finally:
 			# Clean up event listeners
+			if idle_timer is not None:
+				idle_timer.cancel()
 			page.remove_listener('request', on_request)
 			page.remove_listener('response', on_response)
+			page.remove_listener('requestfailed', on_request_done)
+			page.remove_listener('requestfinished', on_request_done)
 
-		logger.debug(f'Network stabilized for {self.config.wait_for_network_idle_page_load_time} seconds')
+		logger.debug(f'Network stabilized for {idle_time} seconds')
 
 	async def _wait_for_page_and_frames_load(self, timeout_overwrite: float | None = None):
 		"""
@@ -774,24 +960,65 @@ class BrowserContext:
 				raise BrowserError('Browser closed: no valid pages available')
 
 		try:
-			await self.remove_highlights()
-			dom_service = DomService(page)
-			content = await dom_service.get_clickable_elements(
-				focus_element=focus_element,
-				viewport_expansion=self.config.viewport_expansion,
-				highlight_elements=self.config.highlight_elements,
-			)
+			timings = {}
 
-			screenshot_b64 = await self.take_screenshot()
-			pixels_above, pixels_below = await self.get_scroll_info(page)
+			async def timed(phase, awaitable):
+				start = time.perf_counter()
+				try:
+					return await awaitable
+				finally:
+					timings[phase] = time.perf_counter() - start
+
+			await timed('remove_highlights', self.remove_highlights())
+			highlight_in_page = self.config.highlight_elements and self.config.highlight_mode == 'overlay'
+			highlight_on_screenshot = self.config.highlight_elements and self.config.highlight_mode == 'screenshot'
+			dom_service = self._get_dom_service(page)
+			dom_walk = timed(
+				'dom',
+				dom_service.get_clickable_elements(
+					focus_element=focus_element,
+					viewport_expansion=self.config.viewport_expansion,
+					highlight_elements=highlight_in_page,
+					incremental=self.config.incremental_dom_snapshots,
+					highlight_rects=highlight_on_screenshot,
+				),
+			)
+			page_info = timed('page_info', self._get_page_info(page))
+			tabs = timed('tabs', self.get_tabs_info())
+
+			# The screenshot shows the highlights, so it has to wait for the DOM walk that draws them
+			if self.config.parallel_screenshot and not highlight_in_page:
+				content, (title, pixels_above, pixels_below), tabs_info, screenshot_b64 = await asyncio.gather(
+					dom_walk, page_info, tabs, timed('screenshot', self.take_screenshot())
+				)
+			else:
+				content, (title, pixels_above, pixels_below), tabs_info = await asyncio.gather(dom_walk, page_info, tabs)
+				screenshot_b64 = await timed('screenshot', self.take_screenshot())
+
+			if highlight_on_screenshot and screenshot_b64:
+				screenshot_b64 = await timed(
+					'draw_highlights',
+					asyncio.to_thread(
+						draw_highlights,
+						screenshot_b64,
+						content.selector_map,
+						self.config.screenshot_clip,
+						self.config.screenshot_format,
+						self.config.screenshot_quality,
+					),
+				)
+
+			self.state_timings = timings
+			logger.debug('State phases: ' + ', '.join(f'{phase} {seconds * 1000:.0f} ms' for phase, seconds in timings.items()))
 
 			self.current_state = BrowserState(
 				element_tree=content.element_tree,
 				selector_map=content.selector_map,
 				url=page.url,
-				title=await page.title(),
-				tabs=await self.get_tabs_info(),
+				title=title,
+				tabs=tabs_info,
 				screenshot=screenshot_b64,
+				screenshot_media_type=f'image/{self.config.screenshot_format}',
 				pixels_above=pixels_above,
 				pixels_below=pixels_below,
 			)
@@ -804,17 +1031,49 @@ class BrowserContext:
 				return self.current_state
 			raise
 
+	async def _get_page_info(self, page: Page) -> tuple[str, int, int]:
+		"""Title and scroll position (pixels above and below the viewport) of a page in one round-trip"""
+		info = await page.evaluate(
+			"""() => ({
+				title: document.title,
+				scrollY: window.scrollY,
+				innerHeight: window.innerHeight,
+				scrollHeight: document.documentElement.scrollHeight,
+			})"""
+		)
+		scroll_y = info['scrollY']
+		return info['title'], scroll_y, info['scrollHeight'] - (scroll_y + info['innerHeight'])
+
+	def _get_dom_service(self, page: Page) -> DomService:
+		"""Get the DomService of a page, services of closed pages are dropped"""
+		self._dom_services = {p: service for p, service in self._dom_services.items() if not p.is_closed()}
+		if page not in self._dom_services:
+			self._dom_services[page] = DomService(page)
+		return self._dom_services[page]
+
 	# region - Browser Actions
 	@time_execution_async('--take_screenshot')
-	async def take_screenshot(self, full_page: bool = False) -> str:
+	async def take_screenshot(self, full_page: bool = False, clip: ScreenshotClip | None = None) -> str:
 		"""
 		Returns a base64 encoded screenshot of the current page.
+
+		With screenshot_format, screenshot_quality, screenshot_max_dimension or a clip set, the screenshot is
+		encoded and downscaled by the browser with CDP Page.captureScreenshot, whose base64 data is returned as is.
 		"""
 		page = await self.get_current_page()
 
 		await page.bring_to_front()
 		await page.wait_for_load_state()
 
+		clip = clip or self.config.screenshot_clip
+		if (
+			self.config.screenshot_format != 'png'
+			or self.config.screenshot_quality is not None
+			or self.config.screenshot_max_dimension is not None
+			or clip is not None
+		):
+			return await self._capture_screenshot(page, full_page, clip)
+
 		screenshot = await page.screenshot(
 			full_page=full_page,
 			animations='disabled',
@@ -826,10 +1085,60 @@ class BrowserContext:
 
 		return screenshot_b64
 
+	async def _capture_screenshot(self, page: Page, full_page: bool, clip: ScreenshotClip | None) -> str:
+		"""Screenshot with CDP Page.captureScreenshot, clipped and scaled in the browser, as base64"""
+		metrics = await page.evaluate(
+			"""() => ({
+				scrollX: window.scrollX,
+				scrollY: window.scrollY,
+				width: window.innerWidth,
+				height: window.innerHeight,
+				scrollWidth: document.documentElement.scrollWidth,
+				scrollHeight: document.documentElement.scrollHeight,
+			})"""
+		)
+		# Clip in CSS pixels of the document
+		if clip is not None:
+			region = {
+				'x': metrics['scrollX'] + clip['x'],
+				'y': metrics['scrollY'] + clip['y'],
+				'width': clip['width'],
+				'height': clip['height'],
+			}
+		elif full_page:
+			region = {'x': 0, 'y': 0, 'width': metrics['scrollWidth'], 'height': metrics['scrollHeight']}
+		else:
+			region = {'x': metrics['scrollX'], 'y': metrics['scrollY'], 'width': metrics['width'], 'height': metrics['height']}
+
+		scale = 1
+		max_dimension = self.config.screenshot_max_dimension
+		if max_dimension and max(region['width'], region['height']) > max_dimension:
+			scale = max_dimension / max(region['width'], region['height'])
+
+		params = {
+			'format': self.config.screenshot_format,
+			'clip': {**region, 'scale': scale},
+			'captureBeyondViewport': full_page,
+			'optimizeForSpeed': True,
+		}
+		if self.config.screenshot_quality is not None and self.config.screenshot_format != 'png':
+			params['quality'] = self.config.screenshot_quality
+
+		cdp_session = await self._get_cdp_session(page)
+		result = await cdp_session.send('Page.captureScreenshot', params)
+		return result['data']
+
+	async def _get_cdp_session(self, page: Page) -> CDPSession:
+		"""Get the CDP session of a page, sessions of closed pages are dropped"""
+		self._cdp_sessions = {p: cdp_session for p, cdp_session in self._cdp_sessions.items() if not p.is_closed()}
+		if page not in self._cdp_sessions:
+			self._cdp_sessions[page] = await page.context.new_cdp_session(page)
+		return self._cdp_sessions[page]
+
 	@time_execution_async('--remove_highlights')
 	async def remove_highlights(self):
 		"""
-		Removes all highlight overlays and labels created by the highlightElement function.
+		Removes the highlight overlay drawn by buildDomTree.js, together with its scroll and resize listeners.
 		Handles cases where the page might be closed or inaccessible.
 		"""
 		try:
@@ -837,17 +1146,8 @@ class BrowserContext:
 			await page.evaluate(
 				"""
                 try {
-                    // Remove the highlight container and all its contents
-                    const container = document.getElementById('playwright-highlight-container');
-                    if (container) {
-                        container.remove();
-                    }
-
-                    // Remove highlight attributes from elements
-                    const highlightedElements = document.querySelectorAll('[browser-user-highlight-id^="playwright-highlight-"]');
-                    highlightedElements.forEach(el => {
-                        el.removeAttribute('browser-user-highlight-id');
-                    });
+                    window.__browserUseHighlights?.remove();
+                    document.getElementById('playwright-highlight-container')?.remove();
                 } catch (e) {
                     console.error('Failed to remove highlights:', e);
                 }
@@ -1163,12 +1463,9 @@ class BrowserContext:
 		"""Get information about all tabs"""
 		session = await self.get_session()
 
-		tabs_info = []
-		for page_id, page in enumerate(session.context.pages):
-			tab_info = TabInfo(page_id=page_id, url=page.url, title=await page.title())
-			tabs_info.append(tab_info)
-
-		return tabs_info
+		pages = session.context.pages
+		titles = await asyncio.gather(*(page.title() for page in pages))
+		return [TabInfo(page_id=page_id, url=page.url, title=title) for page_id, (page, title) in enumerate(zip(pages, titles))]
 
 	@time_execution_async('--switch_to_tab')
 	async def switch_to_tab(self, page_id: int) -> None:
@@ -1297,11 +1594,7 @@ class BrowserContext:
 
 	async def get_scroll_info(self, page: Page) -> tuple[int, int]:
 		"""Get scroll position information for the current page."""
-		scroll_y = await page.evaluate('window.scrollY')
-		viewport_height = await page.evaluate('window.innerHeight')
-		total_height = await page.evaluate('document.documentElement.scrollHeight')
-		pixels_above = scroll_y
-		pixels_below = total_height - (scroll_y + viewport_height)
+		_, pixels_above, pixels_below = await self._get_page_info(page)
 		return pixels_above, pixels_below
 
 	async def reset_context(self):
@@ -1317,6 +1610,8 @@ class BrowserContext:
 
 		session.cached_state = None
 		self.state.target_id = None
+		self._dom_services = {}
+		self._cdp_sessions = {}
 
 	async def _get_unique_filename(self, directory, filename):
 		"""Generate a unique filename by appending (1), (2), etc., if a file already exists."""
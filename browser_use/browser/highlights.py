@@ -0,0 +1,110 @@
+"""
+Set-of-marks highlights drawn onto a screenshot from element coordinates, so the page DOM is never changed.
+"""
+
+import base64
+import io
+import logging
+from typing import TYPE_CHECKING, Optional
+
+from browser_use.dom.views import SelectorMap
+
+if TYPE_CHECKING:
+	from browser_use.browser.context import ScreenshotClip
+
+logger = logging.getLogger(__name__)
+
+# Same colors as the overlay of buildDomTree.js, picked by highlight index
+HIGHLIGHT_COLORS = (
+	'#FF0000',
+	'#00FF00',
+	'#0000FF',
+	'#FFA500',
+	'#800080',
+	'#008080',
+	'#FF69B4',
+	'#4B0082',
+	'#FF4500',
+	'#2E8B57',
+	'#DC143C',
+	'#4682B4',
+)
+
+_LABEL_HEIGHT = 16
+
+
+def draw_highlights(
+	screenshot_b64: str,
+	selector_map: SelectorMap,
+	clip: Optional['ScreenshotClip'] = None,
+	image_format: str = 'png',
+	quality: Optional[int] = None,
+) -> str:
+	"""
+	Draws a box and an index label for every element of the selector map with viewport_coordinates
+	(see DomService.get_clickable_elements(highlight_rects=True)) onto a base64 encoded viewport screenshot.
+
+	The screenshot may be clipped (clip in CSS pixels of the viewport) and scaled, the scale is taken from
+	the image width. Without Pillow, the screenshot is returned as is.
+	"""
+	elements = [element for element in selector_map.values() if element.viewport_coordinates and element.viewport_info]
+	if not elements:
+		return screenshot_b64
+	try:
+		from PIL import Image, ImageDraw, ImageFont
+	except ImportError:
+		logger.warning('Pillow is needed to draw highlights onto screenshots, install it with `pip install pillow`')
+		return screenshot_b64
+
+	viewport = elements[0].viewport_info
+	assert viewport is not None
+	offset_x, offset_y = (clip['x'], clip['y']) if clip else (0, 0)
+	region_width = clip['width'] if clip else viewport.width
+
+	with Image.open(io.BytesIO(base64.b64decode(screenshot_b64))) as screenshot:
+		image = screenshot.convert('RGBA')
+	scale = image.width / region_width if region_width else 1
+
+	overlay = Image.new('RGBA', image.size, (0, 0, 0, 0))
+	draw = ImageDraw.Draw(overlay)
+	font = ImageFont.load_default()
+	label_height = round(_LABEL_HEIGHT * scale)
+	for element in elements:
+		coordinates = element.viewport_coordinates
+		assert coordinates is not None and element.highlight_index is not None
+		left = (coordinates.top_left.x - offset_x) * scale
+		top = (coordinates.top_left.y - offset_y) * scale
+		right = left + coordinates.width * scale
+		bottom = top + coordinates.height * scale
+		if right < 0 or bottom < 0 or left > image.width or top > image.height:
+			continue
+
+		color = HIGHLIGHT_COLORS[element.highlight_index % len(HIGHLIGHT_COLORS)]
+		rgb = tuple(int(color[i : i + 2], 16) for i in (1, 3, 5))
+		draw.rectangle((left, top, right, bottom), fill=(*rgb, 26), outline=(*rgb, 255), width=max(1, round(2 * scale)))
+
+		# Label in the top right corner, above the box if the box is too small
+		label = str(element.highlight_index)
+		text_left, text_top, text_right, text_bottom = draw.textbbox((0, 0), label, font=font)
+		label_width = text_right - text_left + round(8 * scale)
+		label_top, label_left = top + 2, right - label_width - 2
+		if right - left < label_width + 4 or bottom - top < label_height + 4:
+			label_top, label_left = top - label_height - 2, right - label_width
+		draw.rectangle((label_left, label_top, label_left + label_width, label_top + label_height), fill=(*rgb, 255))
+		draw.text(
+			(
+				label_left + (label_width - (text_right - text_left)) / 2 - text_left,
+				label_top + (label_height - (text_bottom - text_top)) / 2 - text_top,
+			),
+			label,
+			fill='white',
+			font=font,
+		)
+
+	image = Image.alpha_composite(image, overlay)
+	if image_format != 'png':
+		image = image.convert('RGB')
+	output = io.BytesIO()
+	save_options = {'quality': quality} if quality is not None and image_format != 'png' else {}
+	image.save(output, format=image_format.upper(), **save_options)
+	return base64.b64encode(output.getvalue()).decode('utf-8')
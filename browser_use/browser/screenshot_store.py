@@ -0,0 +1,114 @@
+"""
+Content-addressed storage for screenshots, so histories keep references instead of base64 strings.
+"""
+
+import base64
+import hashlib
+import logging
+import os
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ScreenshotStore(ABC):
+	"""Stores screenshots by a hash of their bytes, identical screenshots are stored once"""
+
+	# Whether screenshots outlive the process, saved histories inline the screenshots of other stores
+	persistent = False
+
+	@staticmethod
+	def key_for(data: bytes) -> str:
+		return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+	@abstractmethod
+	def put(self, data: bytes) -> str:
+		"""Stores the screenshot and returns its key"""
+
+	@abstractmethod
+	def get(self, key: str) -> Optional[bytes]:
+		"""Returns the screenshot of a key, None if it is not (or no longer) stored"""
+
+	def put_base64(self, screenshot_b64: str) -> str:
+		return self.put(base64.b64decode(screenshot_b64))
+
+	def get_base64(self, key: str) -> Optional[str]:
+		data = self.get(key)
+		return base64.b64encode(data).decode('utf-8') if data is not None else None
+
+
+class InMemoryScreenshotStore(ScreenshotStore):
+	"""
+	Keeps screenshots in memory. Unbounded by default, as histories reference every screenshot they stored.
+	With max_bytes, least recently used ones are evicted above it, and reading an evicted one logs a warning.
+	"""
+
+	def __init__(self, max_bytes: Optional[int] = None):
+		self.max_bytes = max_bytes
+		self.size = 0
+		self._screenshots: OrderedDict[str, bytes] = OrderedDict()
+		self._evicted: set[str] = set()
+
+	def put(self, data: bytes) -> str:
+		key = self.key_for(data)
+		if key in self._screenshots:
+			self._screenshots.move_to_end(key)
+			return key
+
+		self._screenshots[key] = data
+		self._evicted.discard(key)
+		self.size += len(data)
+		while self.max_bytes is not None and self.size > self.max_bytes and len(self._screenshots) > 1:
+			evicted_key, evicted = self._screenshots.popitem(last=False)
+			self._evicted.add(evicted_key)
+			self.size -= len(evicted)
+		return key
+
+	def get(self, key: str) -> Optional[bytes]:
+		data = self._screenshots.get(key)
+		if data is not None:
+			self._screenshots.move_to_end(key)
+		elif key in self._evicted:
+			logger.warning(
+				f'Screenshot {key} was evicted from the in-memory store (max_bytes={self.max_bytes}), '
+				'raise max_bytes or use a FileSystemScreenshotStore to keep every screenshot of the history'
+			)
+		return data
+
+	def __len__(self) -> int:
+		return len(self._screenshots)
+
+
+class FileSystemScreenshotStore(ScreenshotStore):
+	"""
+	Writes every screenshot once to <directory>/<key> and reads it back on demand.
+	"""
+
+	persistent = True
+
+	def __init__(self, directory: str | Path):
+		self.directory = Path(directory)
+		self.directory.mkdir(parents=True, exist_ok=True)
+
+	def put(self, data: bytes) -> str:
+		key = self.key_for(data)
+		path = self.directory / key
+		if not path.exists():
+			# Write to a temporary file first, so a crash never leaves a truncated screenshot behind
+			temporary_path = path.with_name(f'{key}.{os.getpid()}.tmp')
+			temporary_path.write_bytes(data)
+			os.replace(temporary_path, path)
+		return key
+
+	def get(self, key: str) -> Optional[bytes]:
+		# Keys come from history files, never read outside of the directory
+		if not key.isalnum():
+			return None
+		try:
+			return (self.directory / key).read_bytes()
+		except FileNotFoundError:
+			logger.debug(f'Screenshot {key} not found in {self.directory}')
+			return None
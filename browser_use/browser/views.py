@@ -3,6 +3,7 @@ from typing import Any, Optional
 
 from pydantic import BaseModel
 
+from browser_use.browser.screenshot_store import ScreenshotStore
 from browser_use.dom.history_tree_processor.service import DOMHistoryElement
 from browser_use.dom.views import DOMState
 
@@ -25,6 +26,7 @@ class BrowserState(DOMState):
 	pixels_above: int = 0
 	pixels_below: int = 0
 	browser_errors: list[str] = field(default_factory=list)
+	screenshot_media_type: str = 'image/png'
 
 
 @dataclass
@@ -33,18 +35,46 @@ class BrowserStateHistory:
 	title: str
 	tabs: list[TabInfo]
 	interacted_element: list[DOMHistoryElement | None] | list[None]
+	# Base64 screenshot, read from screenshot_store when the history only keeps screenshot_ref (see the property below)
 	screenshot: Optional[str] = None
+	# Key of the screenshot in screenshot_store, instead of the base64 string in screenshot
+	screenshot_ref: Optional[str] = None
+	screenshot_store: Optional[ScreenshotStore] = field(default=None, repr=False, compare=False)
+
+	def get_screenshot(self) -> Optional[str]:
+		"""Base64 encoded screenshot, read from the screenshot store if the history only keeps a reference"""
+		screenshot = self.__dict__.get('screenshot')
+		if screenshot is not None:
+			return screenshot
+		if self.screenshot_ref is not None and self.screenshot_store is not None:
+			return self.screenshot_store.get_base64(self.screenshot_ref)
+		return None
+
+	def _set_screenshot(self, screenshot: Optional[str]) -> None:
+		# Kept in the instance dict under the field name, where pydantic validation stores it as well
+		self.__dict__['screenshot'] = screenshot
 
 	def to_dict(self) -> dict[str, Any]:
 		data = {}
 		data['tabs'] = [tab.model_dump() for tab in self.tabs]
-		data['screenshot'] = self.screenshot
+		if self.screenshot_ref is not None and self.screenshot_store is not None and not self.screenshot_store.persistent:
+			# The store is gone with the process, saved histories keep the screenshot itself
+			data['screenshot'] = self.get_screenshot()
+		else:
+			data['screenshot'] = self.__dict__.get('screenshot')
+			if self.screenshot_ref is not None:
+				data['screenshot_ref'] = self.screenshot_ref
 		data['interacted_element'] = [el.to_dict() if el else None for el in self.interacted_element]
 		data['url'] = self.url
 		data['title'] = self.title
 		return data
 
 
+# Replaces the field attribute once the dataclass took its default, so reading state.screenshot keeps working for
+# histories that keep a reference into a screenshot store
+BrowserStateHistory.screenshot = property(BrowserStateHistory.get_screenshot, BrowserStateHistory._set_screenshot)  # type: ignore[assignment]
+
+
 class BrowserError(Exception):
 	"""Base class for all browser errors"""
 
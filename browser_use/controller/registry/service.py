@@ -16,7 +16,7 @@ from browser_use.telemetry.views import (
 	ControllerRegisteredFunctionsTelemetryEvent,
 	RegisteredFunction,
 )
-from browser_use.utils import time_execution_async, time_execution_sync
+from browser_use.utils import SensitiveDataRedactor, time_execution_async, time_execution_sync
 
 Context = TypeVar('Context')
 
@@ -146,29 +146,8 @@ class Registry(Generic[Context]):
 			raise RuntimeError(f'Error executing action {action_name}: {str(e)}') from e
 
 	def _replace_sensitive_data(self, params: BaseModel, sensitive_data: Dict[str, str]) -> BaseModel:
-		"""Replaces the sensitive data in the params"""
-		# if there are any str with <secret>placeholder</secret> in the params, replace them with the actual value from sensitive_data
-
-		import re
-
-		secret_pattern = re.compile(r'<secret>(.*?)</secret>')
-
-		def replace_secrets(value):
-			if isinstance(value, str):
-				matches = secret_pattern.findall(value)
-				for placeholder in matches:
-					if placeholder in sensitive_data:
-						value = value.replace(f'<secret>{placeholder}</secret>', sensitive_data[placeholder])
-				return value
-			elif isinstance(value, dict):
-				return {k: replace_secrets(v) for k, v in value.items()}
-			elif isinstance(value, list):
-				return [replace_secrets(v) for v in value]
-			return value
-
-		for key, value in params.model_dump().items():
-			params.__dict__[key] = replace_secrets(value)
-		return params
+		"""Replaces the <secret>placeholder</secret> strings in the params with the actual values from sensitive_data"""
+		return SensitiveDataRedactor.for_secrets(sensitive_data).unredact_params(params)
 
 	@time_execution_sync('--create_action_model')
 	def create_action_model(self, include_actions: Optional[list[str]] = None) -> Type[ActionModel]:
@@ -4,9 +4,20 @@
     focusHighlightIndex: -1,
     viewportExpansion: 0,
     debugMode: false,
+    incremental: false,
+    snapshotId: null,
+    highlightRects: false,
   }
 ) => {
-  const { doHighlightElements, focusHighlightIndex, viewportExpansion, debugMode } = args;
+  const {
+    doHighlightElements,
+    focusHighlightIndex,
+    viewportExpansion,
+    debugMode,
+    incremental = false,
+    snapshotId = null,
+    highlightRects = false,
+  } = args;
   let highlightIndex = 0; // Reset highlight index
 
   // Add timing stack to handle recursion
@@ -33,6 +44,7 @@
     buildDomTreeCalls: 0,
     timings: {
       buildDomTree: 0,
+      resolveTopElements: 0,
       highlightElement: 0,
       isInteractiveElement: 0,
       isElementVisible: 0,
@@ -56,6 +68,8 @@
       totalNodes: 0,
       processedNodes: 0,
       skippedNodes: 0,
+      reusedNodes: 0,
+      topElementChecks: 0,
     },
     buildDomTreeBreakdown: {
       totalTime: 0,
@@ -64,10 +78,14 @@
       domOperations: {
         getBoundingClientRect: 0,
         getComputedStyle: 0,
+        checkVisibility: 0,
+        elementFromPoint: 0,
       },
       domOperationCounts: {
         getBoundingClientRect: 0,
         getComputedStyle: 0,
+        checkVisibility: 0,
+        elementFromPoint: 0,
       }
     }
   } : null;
@@ -188,148 +206,287 @@
   const HIGHLIGHT_CONTAINER_ID = "playwright-highlight-container";
 
   /**
-   * Highlights an element in the DOM and returns the index of the next element.
+   * Incremental snapshot state, kept on the window between calls.
+   *
+   * Every emitted element keeps a cache entry (id, highlight index, bounding rect and
+   * emitted child elements). Subtrees that mutationObserver.js did not report as changed
+   * are referenced by their previous id instead of being walked and serialized again.
+   * Only works when the observer init script is installed, otherwise we fall back to
+   * full snapshots.
    */
-  function highlightElement(element, index, parentIframe = null) {
-    if (!element) return index;
+  const DOM_OBSERVER = incremental ? window.__browserUseDomObserver : null;
+  const previousSnapshot = DOM_OBSERVER ? window.__browserUseDomSnapshot : null;
+  const layoutKey = [window.scrollX, window.scrollY, window.innerWidth, window.innerHeight, viewportExpansion].join(",");
+  let dirtyNodes = new Set();
+  let reuseEnabled = false;
+
+  if (DOM_OBSERVER) {
+    const { dirty, overflow } = DOM_OBSERVER.takeDirtyNodes();
+    dirtyNodes = dirty;
+    reuseEnabled = !!previousSnapshot &&
+      !overflow &&
+      previousSnapshot.id === snapshotId &&
+      previousSnapshot.layoutKey === layoutKey;
+  }
 
-    try {
-      // Create or get highlight container
-      let container = document.getElementById(HIGHLIGHT_CONTAINER_ID);
-      if (!container) {
-        container = document.createElement("div");
-        container.id = HIGHLIGHT_CONTAINER_ID;
-        container.style.position = "fixed";
-        container.style.pointerEvents = "none";
-        container.style.top = "0";
-        container.style.left = "0";
-        container.style.width = "100%";
-        container.style.height = "100%";
-        container.style.zIndex = "2147483647";
-        document.body.appendChild(container);
-      }
+  const SNAPSHOT = DOM_OBSERVER ? {
+    id: `${Date.now().toString(36)}${Math.random().toString(36).slice(2, 8)}`,
+    layoutKey,
+    generation: reuseEnabled ? previousSnapshot.generation + 1 : 0,
+    entries: reuseEnabled ? previousSnapshot.entries : new WeakMap(),
+    nextNodeId: reuseEnabled ? previousSnapshot.nextNodeId : 0,
+    nextHighlightIndex: reuseEnabled ? previousSnapshot.nextHighlightIndex : 0,
+  } : null;
 
-      // Get element position
-      const rect = measureDomOperation(
-        () => element.getBoundingClientRect(),
-        'getBoundingClientRect'
-      );
+  if (SNAPSHOT) {
+    // Ids and highlight indices are never handed out twice within a snapshot chain,
+    // so unchanged elements keep their index between steps
+    ID.current = SNAPSHOT.nextNodeId;
+    highlightIndex = SNAPSHOT.nextHighlightIndex;
+  }
 
-      if (!rect) return index;
-
-      // Generate a color based on the index
-      const colors = [
-        "#FF0000",
-        "#00FF00",
-        "#0000FF",
-        "#FFA500",
-        "#800080",
-        "#008080",
-        "#FF69B4",
-        "#4B0082",
-        "#FF4500",
-        "#2E8B57",
-        "#DC143C",
-        "#4682B4",
-      ];
-      const colorIndex = index % colors.length;
-      const baseColor = colors[colorIndex];
-      const backgroundColor = baseColor + "1A"; // 10% opacity version of the color
-
-      // Create highlight overlay
-      const overlay = document.createElement("div");
-      overlay.style.position = "fixed";
-      overlay.style.border = `2px solid ${baseColor}`;
-      overlay.style.backgroundColor = backgroundColor;
-      overlay.style.pointerEvents = "none";
-      overlay.style.boxSizing = "border-box";
-
-      // Get element position
-      let iframeOffset = { x: 0, y: 0 };
-
-      // If element is in an iframe, calculate iframe offset
-      if (parentIframe) {
-        const iframeRect = parentIframe.getBoundingClientRect();
-        iframeOffset.x = iframeRect.left;
-        iframeOffset.y = iframeRect.top;
+  // Ancestors of changed nodes have to be revisited, their clean children can still be reused
+  const dirtyPaths = new Set();
+  if (reuseEnabled) {
+    for (const node of dirtyNodes) {
+      let current = node;
+      while (current) {
+        const parent = current.parentNode instanceof ShadowRoot ? current.parentNode.host : current.parentNode;
+        if (!parent || dirtyPaths.has(parent)) break;
+        dirtyPaths.add(parent);
+        current = parent;
       }
+    }
+  }
 
-      // Calculate position
-      const top = rect.top + iframeOffset.y;
-      const left = rect.left + iframeOffset.x;
-
-      overlay.style.top = `${top}px`;
-      overlay.style.left = `${left}px`;
-      overlay.style.width = `${rect.width}px`;
-      overlay.style.height = `${rect.height}px`;
-
-      // Create and position label
-      const label = document.createElement("div");
-      label.className = "playwright-highlight-label";
-      label.style.position = "fixed";
-      label.style.background = baseColor;
-      label.style.color = "white";
-      label.style.padding = "1px 4px";
-      label.style.borderRadius = "4px";
-      label.style.fontSize = `${Math.min(12, Math.max(8, rect.height / 2))}px`;
-      label.textContent = index;
-
-      const labelWidth = 20;
-      const labelHeight = 16;
-
-      let labelTop = top + 2;
-      let labelLeft = left + rect.width - labelWidth - 2;
-
-      if (rect.width < labelWidth + 4 || rect.height < labelHeight + 4) {
-        labelTop = top - labelHeight - 2;
-        labelLeft = left + rect.width - labelWidth;
-      }
+  /**
+   * Returns the cache entry of an element if its subtree can be reused as-is.
+   */
+  function getReusableEntry(node, parentIframe, reuseAllowed) {
+    if (!reuseEnabled || !reuseAllowed || parentIframe) return null;
+    if (dirtyNodes.has(node) || dirtyPaths.has(node)) return null;
+
+    const entry = SNAPSHOT.entries.get(node);
+    // Only entries emitted in the previous snapshot are known to the Python side
+    if (!entry || !entry.reusable || entry.generation !== SNAPSHOT.generation - 1) return null;
+
+    // Layout shifts move clean subtrees without mutating them
+    const rect = getCachedBoundingRect(node);
+    if (
+      !rect ||
+      rect.top !== entry.rect.top ||
+      rect.left !== entry.rect.left ||
+      rect.width !== entry.rect.width ||
+      rect.height !== entry.rect.height
+    ) {
+      return null;
+    }
 
-      label.style.top = `${labelTop}px`;
-      label.style.left = `${labelLeft}px`;
+    // Changed nodes may cover (or uncover) clean elements
+    if (dirtyNodes.size > 0 && !isStackingUnchanged(entry)) return null;
+    return entry;
+  }
 
-      // Add to container
-      container.appendChild(overlay);
-      container.appendChild(label);
+  const STACKING_CACHE = new Map();
 
-      // Update positions on scroll
-      const updatePositions = () => {
-        const newRect = element.getBoundingClientRect();
-        let newIframeOffset = { x: 0, y: 0 };
+  /**
+   * Checks that every element of a cached subtree is still (not) the top element at its position.
+   */
+  function isStackingUnchanged(entry) {
+    if (STACKING_CACHE.has(entry)) return STACKING_CACHE.get(entry);
+
+    let unchanged = entry.wasTop === null || isTopElement(entry.element) === entry.wasTop;
+    if (unchanged) {
+      unchanged = entry.childElements.every((child) => {
+        const childEntry = SNAPSHOT.entries.get(child);
+        return !childEntry || isStackingUnchanged(childEntry);
+      });
+    }
+    STACKING_CACHE.set(entry, unchanged);
+    return unchanged;
+  }
 
-        if (parentIframe) {
-          const iframeRect = parentIframe.getBoundingClientRect();
-          newIframeOffset.x = iframeRect.left;
-          newIframeOffset.y = iframeRect.top;
-        }
+  /**
+   * Marks a reused subtree as part of this snapshot and redraws its highlights.
+   */
+  function reuseEntry(entry) {
+    entry.generation = SNAPSHOT.generation;
+    if (entry.highlightIndex !== null) {
+      highlightIfNeeded(entry.element, entry.highlightIndex, null);
+    }
+    for (const child of entry.childElements) {
+      const childEntry = SNAPSHOT.entries.get(child);
+      if (childEntry) reuseEntry(childEntry);
+    }
+  }
 
-        const newTop = newRect.top + newIframeOffset.y;
-        const newLeft = newRect.left + newIframeOffset.x;
+  function recordEntry(node, id, nodeData, childElements, parentIframe) {
+    if (!SNAPSHOT || parentIframe) return;
+
+    const rect = getCachedBoundingRect(node);
+    const tagName = nodeData.tagName;
+    SNAPSHOT.entries.set(node, {
+      id,
+      element: node,
+      generation: SNAPSHOT.generation,
+      // Both are set by resolveTopElements for the elements it hit-tests
+      highlightIndex: null,
+      wasTop: null,
+      rect: rect ?
+        { top: rect.top, left: rect.left, width: rect.width, height: rect.height } :
+        { top: NaN, left: NaN, width: NaN, height: NaN },
+      childElements,
+      // Same-origin iframe content is not observed, so it is always walked again
+      reusable: tagName !== "iframe" &&
+        childElements.every((child) => SNAPSHOT.entries.get(child)?.reusable),
+    });
+  }
 
-        overlay.style.top = `${newTop}px`;
-        overlay.style.left = `${newLeft}px`;
-        overlay.style.width = `${newRect.width}px`;
-        overlay.style.height = `${newRect.height}px`;
+  /**
+   * Highlight index the element had in the previous snapshot, read before recordEntry replaces its entry.
+   */
+  function previousHighlightIndex(node) {
+    if (!reuseEnabled) return null;
+    return SNAPSHOT.entries.get(node)?.highlightIndex ?? null;
+  }
 
-        let newLabelTop = newTop + 2;
-        let newLabelLeft = newLeft + newRect.width - labelWidth - 2;
+  function nextHighlightIndex(previousIndex) {
+    return previousIndex ?? highlightIndex++;
+  }
 
-        if (newRect.width < labelWidth + 4 || newRect.height < labelHeight + 4) {
-          newLabelTop = newTop - labelHeight - 2;
-          newLabelLeft = newLeft + newRect.width - labelWidth;
-        }
+  function highlightIfNeeded(element, index, parentIframe) {
+    if (!doHighlightElements && !highlightRects) return;
+    if (focusHighlightIndex >= 0 && focusHighlightIndex !== index) return;
+    highlightElement(element, index, parentIframe);
+  }
 
-        label.style.top = `${newLabelTop}px`;
-        label.style.left = `${newLabelLeft}px`;
-      };
+  /**
+   * Elements to highlight, drawn in one pass after the walk so the walk never writes to the DOM.
+   */
+  const HIGHLIGHTS = [];
 
-      window.addEventListener('scroll', updatePositions);
-      window.addEventListener('resize', updatePositions);
+  /**
+   * Records an element to highlight.
+   */
+  function highlightElement(element, index, parentIframe = null) {
+    if (!element) return index;
+    HIGHLIGHTS.push({ element, index, parentIframe });
+    return index + 1;
+  }
 
-      return index + 1;
-    } finally {
-      popTiming('highlighting');
-    }
+  const HIGHLIGHT_COLORS = [
+    "#FF0000",
+    "#00FF00",
+    "#0000FF",
+    "#FFA500",
+    "#800080",
+    "#008080",
+    "#FF69B4",
+    "#4B0082",
+    "#FF4500",
+    "#2E8B57",
+    "#DC143C",
+    "#4682B4",
+  ];
+
+  /**
+   * Viewport rect of a highlighted element, offset by its iframe.
+   */
+  function getHighlightRect({ element, parentIframe }) {
+    const rect = element.getBoundingClientRect();
+    if (!parentIframe) return rect;
+    const iframeRect = parentIframe.getBoundingClientRect();
+    return { left: rect.left + iframeRect.left, top: rect.top + iframeRect.top, width: rect.width, height: rect.height };
+  }
+
+  /**
+   * Draws all highlights into a single canvas overlay with one shared, rAF-throttled scroll
+   * and resize handler. window.__browserUseHighlights.remove() takes everything down again.
+   */
+  function renderHighlights(highlights) {
+    window.__browserUseHighlights?.remove();
+    document.getElementById(HIGHLIGHT_CONTAINER_ID)?.remove();
+
+    const container = document.createElement("div");
+    container.id = HIGHLIGHT_CONTAINER_ID;
+    container.style.position = "fixed";
+    container.style.pointerEvents = "none";
+    container.style.top = "0";
+    container.style.left = "0";
+    container.style.width = "100%";
+    container.style.height = "100%";
+    container.style.zIndex = "2147483647";
+    const canvas = document.createElement("canvas");
+    canvas.style.width = "100%";
+    canvas.style.height = "100%";
+    container.appendChild(canvas);
+    document.body.appendChild(container);
+
+    const labelHeight = 16;
+    let frame = null;
+
+    const draw = () => {
+      frame = null;
+      // Read all positions first, then draw, so layout is computed at most once
+      const rects = highlights.map((highlight) => highlight.element.isConnected ? getHighlightRect(highlight) : null);
+
+      const ratio = window.devicePixelRatio || 1;
+      const width = window.innerWidth;
+      const height = window.innerHeight;
+      if (canvas.width !== Math.round(width * ratio) || canvas.height !== Math.round(height * ratio)) {
+        canvas.width = Math.round(width * ratio);
+        canvas.height = Math.round(height * ratio);
+      }
+      const context = canvas.getContext("2d");
+      context.setTransform(ratio, 0, 0, ratio, 0, 0);
+      context.clearRect(0, 0, width, height);
+      context.lineWidth = 2;
+      context.textBaseline = "middle";
+
+      highlights.forEach(({ index }, i) => {
+        const rect = rects[i];
+        if (!rect || rect.left + rect.width < 0 || rect.top + rect.height < 0 || rect.left > width || rect.top > height) {
+          return;
+        }
+        const color = HIGHLIGHT_COLORS[index % HIGHLIGHT_COLORS.length];
+        context.fillStyle = color + "1A"; // 10% opacity version of the color
+        context.fillRect(rect.left, rect.top, rect.width, rect.height);
+        context.strokeStyle = color;
+        context.strokeRect(rect.left + 1, rect.top + 1, Math.max(0, rect.width - 2), Math.max(0, rect.height - 2));
+
+        context.font = `${Math.min(12, Math.max(8, rect.height / 2))}px sans-serif`;
+        const labelWidth = context.measureText(String(index)).width + 8;
+        let labelTop = rect.top + 2;
+        let labelLeft = rect.left + rect.width - labelWidth - 2;
+        if (rect.width < labelWidth + 4 || rect.height < labelHeight + 4) {
+          labelTop = rect.top - labelHeight - 2;
+          labelLeft = rect.left + rect.width - labelWidth;
+        }
+        context.fillStyle = color;
+        context.fillRect(labelLeft, labelTop, labelWidth, labelHeight);
+        context.fillStyle = "white";
+        context.fillText(String(index), labelLeft + 4, labelTop + labelHeight / 2);
+      });
+    };
+
+    const schedule = () => {
+      if (frame === null) frame = requestAnimationFrame(draw);
+    };
+    // Capturing also catches scrolling inside scrollable elements
+    const listenerOptions = { capture: true, passive: true };
+    window.addEventListener("scroll", schedule, listenerOptions);
+    window.addEventListener("resize", schedule, listenerOptions);
+
+    window.__browserUseHighlights = {
+      remove() {
+        window.removeEventListener("scroll", schedule, listenerOptions);
+        window.removeEventListener("resize", schedule, listenerOptions);
+        if (frame !== null) cancelAnimationFrame(frame);
+        container.remove();
+        if (window.__browserUseHighlights === this) delete window.__browserUseHighlights;
+      },
+    };
+    draw();
   }
 
   /**
@@ -376,6 +533,22 @@
    */
   function isTextNodeVisible(textNode) {
     try {
+      // Check parent visibility first, it is cheaper than measuring the text
+      const parentElement = textNode.parentElement;
+      if (!parentElement) return false;
+
+      let isParentVisible;
+      if (typeof parentElement.checkVisibility === "function") {
+        isParentVisible = measureDomOperation(
+          () => parentElement.checkVisibility({ checkOpacity: true, checkVisibilityCSS: true }),
+          'checkVisibility'
+        );
+      } else {
+        const style = getCachedComputedStyle(parentElement);
+        isParentVisible = style.display !== 'none' && style.visibility !== 'hidden' && style.opacity !== '0';
+      }
+      if (!isParentVisible) return false;
+
       const range = document.createRange();
       range.selectNodeContents(textNode);
       const rect = range.getBoundingClientRect();
@@ -386,30 +559,12 @@
       }
 
       // Simple viewport check without scroll calculations
-      const isInViewport = !(
+      return !(
         rect.bottom < -viewportExpansion ||
         rect.top > window.innerHeight + viewportExpansion ||
         rect.right < -viewportExpansion ||
         rect.left > window.innerWidth + viewportExpansion
       );
-
-      // Check parent visibility
-      const parentElement = textNode.parentElement;
-      if (!parentElement) return false;
-
-      try {
-        return isInViewport && parentElement.checkVisibility({
-          checkOpacity: true,
-          checkVisibilityCSS: true,
-        });
-      } catch (e) {
-        // Fallback if checkVisibility is not supported
-        const style = window.getComputedStyle(parentElement);
-        return isInViewport &&
-          style.display !== 'none' &&
-          style.visibility !== 'hidden' &&
-          style.opacity !== '0';
-      }
     } catch (e) {
       console.warn('Error checking text node visibility:', e);
       return false;
@@ -445,13 +600,17 @@
    * Checks if an element is visible.
    */
   function isElementVisible(element) {
+    if (!(element.offsetWidth > 0 && element.offsetHeight > 0)) return false;
+
+    // checkVisibility answers from the layout tree without creating a computed style object
+    if (typeof element.checkVisibility === "function") {
+      return measureDomOperation(
+        () => element.checkVisibility({ visibilityProperty: true, checkVisibilityCSS: true }),
+        'checkVisibility'
+      );
+    }
     const style = getCachedComputedStyle(element);
-    return (
-      element.offsetWidth > 0 &&
-      element.offsetHeight > 0 &&
-      style.visibility !== "hidden" &&
-      style.display !== "none"
-    );
+    return style.visibility !== "hidden" && style.display !== "none";
   }
 
   /**
@@ -702,7 +861,10 @@
     const centerY = rect.top + rect.height / 2;
 
     try {
-      const topEl = document.elementFromPoint(centerX, centerY);
+      const topEl = measureDomOperation(
+        () => document.elementFromPoint(centerX, centerY),
+        'elementFromPoint'
+      );
       if (!topEl) return false;
 
       let current = topEl;
@@ -791,8 +953,11 @@
 
   /**
    * Creates a node data object for a given node and its descendants.
+   *
+   * The xpath of an element is built top-down by processChildren from the xpath of its parent,
+   * getXPathTree is only needed for the root.
    */
-  function buildDomTree(node, parentIframe = null) {
+  function buildDomTree(node, parentIframe = null, reuseAllowed = true, xpath = null) {
     if (debugMode) PERF_METRICS.nodeMetrics.totalNodes++;
 
     if (!node || node.id === HIGHLIGHT_CONTAINER_ID) {
@@ -810,10 +975,7 @@
       };
 
       // Process children of body
-      for (const child of node.childNodes) {
-        const domElement = buildDomTree(child, parentIframe);
-        if (domElement) nodeData.children.push(domElement);
-      }
+      processChildren(nodeData, node.childNodes, parentIframe, reuseAllowed && !dirtyNodes.has(node), getXPathTree(node, true));
 
       const id = `${ID.current++}`;
       DOM_HASH_MAP[id] = nodeData;
@@ -872,11 +1034,19 @@
       }
     }
 
+    // Unchanged subtrees from the previous snapshot are referenced by id
+    const reusableEntry = getReusableEntry(node, parentIframe, reuseAllowed);
+    if (reusableEntry) {
+      reuseEntry(reusableEntry);
+      if (debugMode) PERF_METRICS.nodeMetrics.reusedNodes++;
+      return reusableEntry.id;
+    }
+
     // Process element node
     const nodeData = {
       tagName: node.tagName.toLowerCase(),
       attributes: {},
-      xpath: getXPathTree(node, true),
+      xpath: xpath ?? getXPathTree(node, true),
       children: [],
     };
 
@@ -890,32 +1060,25 @@
 
     // if (isInteractiveCandidate(node)) {
 
-    // Check interactivity
+    // Check interactivity, the hit-test whether the element is on top is left to resolveTopElements
+    let topElementCandidate = null;
     if (node.nodeType === Node.ELEMENT_NODE) {
       nodeData.isVisible = isElementVisible(node);
-      if (nodeData.isVisible) {
-        nodeData.isTopElement = isTopElement(node);
-        if (nodeData.isTopElement) {
-          nodeData.isInteractive = isInteractiveElement(node);
-          if (nodeData.isInteractive) {
-            nodeData.isInViewport = true;
-            nodeData.highlightIndex = highlightIndex++;
-
-            if (doHighlightElements) {
-              if (focusHighlightIndex >= 0) {
-                if (focusHighlightIndex === nodeData.highlightIndex) {
-                  highlightElement(node, nodeData.highlightIndex, parentIframe);
-                }
-              } else {
-                highlightElement(node, nodeData.highlightIndex, parentIframe);
-              }
-            }
-          }
-        }
+      if (nodeData.isVisible && isInteractiveElement(node)) {
+        topElementCandidate = {
+          node,
+          nodeData,
+          parentIframe,
+          previousIndex: previousHighlightIndex(node),
+          emitted: true,
+        };
+        TOP_ELEMENT_CANDIDATES.push(topElementCandidate);
       }
     }
 
     // Process children, with special handling for iframes and rich text editors
+    const childReuseAllowed = reuseAllowed && !dirtyNodes.has(node);
+    let childElements = [];
     if (node.tagName) {
       const tagName = node.tagName.toLowerCase();
 
@@ -924,10 +1087,7 @@
         try {
           const iframeDoc = node.contentDocument || node.contentWindow?.document;
           if (iframeDoc) {
-            for (const child of iframeDoc.childNodes) {
-              const domElement = buildDomTree(child, node);
-              if (domElement) nodeData.children.push(domElement);
-            }
+            childElements = processChildren(nodeData, iframeDoc.childNodes, node, false, "");
           }
         } catch (e) {
           console.warn("Unable to access iframe:", e);
@@ -942,40 +1102,207 @@
         (tagName === "body" && node.getAttribute("data-id")?.startsWith("mce_"))
       ) {
         // Process all child nodes to capture formatted text
-        for (const child of node.childNodes) {
-          const domElement = buildDomTree(child, parentIframe);
-          if (domElement) nodeData.children.push(domElement);
-        }
+        childElements = processChildren(nodeData, node.childNodes, parentIframe, childReuseAllowed, nodeData.xpath);
       }
       // Handle shadow DOM
       else if (node.shadowRoot) {
         nodeData.shadowRoot = true;
-        for (const child of node.shadowRoot.childNodes) {
-          const domElement = buildDomTree(child, parentIframe);
-          if (domElement) nodeData.children.push(domElement);
-        }
+        // XPaths restart below the shadow root. getXPathTree only stops at shadow roots of this window's
+        // realm, the children of a shadow root in an iframe document keep their own segment
+        const shadowXPath = node.shadowRoot instanceof ShadowRoot ? null : "";
+        childElements = processChildren(nodeData, node.shadowRoot.childNodes, parentIframe, childReuseAllowed, shadowXPath);
       }
       // Handle regular elements
       else {
-        for (const child of node.childNodes) {
-          const domElement = buildDomTree(child, parentIframe);
-          if (domElement) nodeData.children.push(domElement);
-        }
+        childElements = processChildren(nodeData, node.childNodes, parentIframe, childReuseAllowed, nodeData.xpath);
       }
     }
 
     // Skip empty anchor tags
     if (nodeData.tagName === 'a' && nodeData.children.length === 0 && !nodeData.attributes.href) {
+      if (topElementCandidate) topElementCandidate.emitted = false;
       if (debugMode) PERF_METRICS.nodeMetrics.skippedNodes++;
       return null;
     }
 
     const id = `${ID.current++}`;
     DOM_HASH_MAP[id] = nodeData;
+    recordEntry(node, id, nodeData, childElements, parentIframe);
     if (debugMode) PERF_METRICS.nodeMetrics.processedNodes++;
     return id;
   }
 
+  /**
+   * Visible interactive elements found by the walk, in document order, still to be hit-tested.
+   */
+  const TOP_ELEMENT_CANDIDATES = [];
+
+  /**
+   * Second phase of the walk: hit-tests the candidates after all geometry has been read, and hands
+   * out highlight indices in document order to the ones on top. Nothing is written to the DOM
+   * before this, so the layout computed for the walk stays valid for every elementFromPoint call.
+   */
+  function resolveTopElements() {
+    for (const { node } of TOP_ELEMENT_CANDIDATES) getCachedBoundingRect(node);
+
+    for (const candidate of TOP_ELEMENT_CANDIDATES) {
+      const { node, nodeData, parentIframe } = candidate;
+      nodeData.isTopElement = isTopElement(node);
+      if (debugMode) PERF_METRICS.nodeMetrics.topElementChecks++;
+
+      const entry = SNAPSHOT && !parentIframe ? SNAPSHOT.entries.get(node) : null;
+      if (entry) entry.wasTop = nodeData.isTopElement;
+      if (!nodeData.isTopElement || !candidate.emitted) continue;
+
+      nodeData.isInteractive = true;
+      nodeData.isInViewport = true;
+      nodeData.highlightIndex = nextHighlightIndex(candidate.previousIndex);
+      if (entry) entry.highlightIndex = nodeData.highlightIndex;
+      highlightIfNeeded(node, nodeData.highlightIndex, parentIframe);
+    }
+  }
+
+  /**
+   * Builds the children of a node, returns the child elements that were emitted.
+   *
+   * parentXPath is the xpath the child xpaths are built on: "" in an iframe document and below shadow roots
+   * of iframe documents, null for the children of other shadow roots, whose own xpath is empty as
+   * getXPathTree stops at the boundary.
+   * Same-tag siblings are counted in one pass instead of walking the previous siblings per element.
+   */
+  function processChildren(nodeData, childNodes, parentIframe, reuseAllowed, parentXPath) {
+    const childElements = [];
+    const tagCounts = new Map();
+    for (const child of childNodes) {
+      let xpath = null;
+      if (child.nodeType === Node.ELEMENT_NODE) {
+        const count = tagCounts.get(child.nodeName) ?? 0;
+        tagCounts.set(child.nodeName, count + 1);
+        const segment = child.nodeName.toLowerCase() + (count > 0 ? `[${count + 1}]` : "");
+        xpath = parentXPath === null ? "" : parentXPath ? `${parentXPath}/${segment}` : segment;
+      }
+      const domElement = buildDomTree(child, parentIframe, reuseAllowed, xpath);
+      if (domElement) {
+        nodeData.children.push(domElement);
+        if (child.nodeType === Node.ELEMENT_NODE) childElements.push(child);
+      }
+    }
+    return childElements;
+  }
+
+  /**
+   * Node flags of the wire format, keep in sync with browser_use/dom/service.py.
+   */
+  const FLAGS = {
+    TEXT: 1,
+    VISIBLE: 2,
+    INTERACTIVE: 4,
+    TOP_ELEMENT: 8,
+    IN_VIEWPORT: 16,
+    SHADOW_ROOT: 32,
+    // The xpath column holds the whole xpath instead of the segment below the parent
+    XPATH_ABSOLUTE: 64,
+    // Unchanged subtree of the previous snapshot, only its id is sent
+    REUSED: 128,
+  };
+
+  /**
+   * Encodes the node map into parallel columns plus an interned string table.
+   *
+   * Rows are in pre-order, so parents always come before their children and
+   * children are appended in document order. Tag names, texts, xpath segments
+   * and attribute keys/values are indices into `strings`.
+   */
+  function encodeDomTree(rootId) {
+    const strings = [];
+    const stringIndices = new Map();
+    const intern = (value) => {
+      let index = stringIndices.get(value);
+      if (index === undefined) {
+        index = strings.length;
+        strings.push(value);
+        stringIndices.set(value, index);
+      }
+      return index;
+    };
+
+    const ids = [];
+    const parents = [];
+    const flags = [];
+    const names = [];
+    const xpaths = [];
+    const highlights = [];
+    const attributeCounts = [];
+    const attributes = [];
+    const xpathOfRow = [];
+
+    const stack = rootId === null ? [] : [[rootId, -1]];
+    while (stack.length > 0) {
+      const [id, parent] = stack.pop();
+      const row = flags.length;
+      const nodeData = DOM_HASH_MAP[id];
+
+      ids.push(+id);
+      parents.push(parent);
+
+      if (!nodeData) {
+        flags.push(FLAGS.REUSED);
+        names.push(-1);
+        xpaths.push(-1);
+        highlights.push(-1);
+        attributeCounts.push(0);
+        xpathOfRow.push(null);
+        continue;
+      }
+
+      if (nodeData.type === "TEXT_NODE") {
+        flags.push(FLAGS.TEXT | (nodeData.isVisible ? FLAGS.VISIBLE : 0));
+        names.push(intern(nodeData.text));
+        xpaths.push(-1);
+        highlights.push(-1);
+        attributeCounts.push(0);
+        xpathOfRow.push(null);
+        continue;
+      }
+
+      let nodeFlags =
+        (nodeData.isVisible ? FLAGS.VISIBLE : 0) |
+        (nodeData.isInteractive ? FLAGS.INTERACTIVE : 0) |
+        (nodeData.isTopElement ? FLAGS.TOP_ELEMENT : 0) |
+        (nodeData.isInViewport ? FLAGS.IN_VIEWPORT : 0) |
+        (nodeData.shadowRoot ? FLAGS.SHADOW_ROOT : 0);
+
+      const parentXPath = parent >= 0 ? xpathOfRow[parent] : null;
+      if (parentXPath !== null && nodeData.xpath.startsWith(parentXPath + "/")) {
+        xpaths.push(intern(nodeData.xpath.slice(parentXPath.length + 1)));
+      } else {
+        nodeFlags |= FLAGS.XPATH_ABSOLUTE;
+        xpaths.push(intern(nodeData.xpath));
+      }
+      xpathOfRow.push(nodeData.xpath);
+
+      flags.push(nodeFlags);
+      names.push(intern(nodeData.tagName));
+      highlights.push(nodeData.highlightIndex ?? -1);
+
+      let attributeCount = 0;
+      for (const name in nodeData.attributes) {
+        attributes.push(intern(name), intern(nodeData.attributes[name]));
+        attributeCount++;
+      }
+      attributeCounts.push(attributeCount);
+
+      for (let i = nodeData.children.length - 1; i >= 0; i--) {
+        stack.push([nodeData.children[i], row]);
+      }
+    }
+
+    const encoded = { strings, parents, flags, names, xpaths, highlights, attributeCounts, attributes };
+    // Node ids are only needed to patch the tree with the next incremental snapshot
+    if (SNAPSHOT) encoded.ids = ids;
+    return encoded;
+  }
+
   // After all functions are defined, wrap them with performance measurement
   // Remove buildDomTree from here as we measure it separately
   highlightElement = measureTime(highlightElement);
@@ -986,7 +1313,13 @@
   isTextNodeVisible = measureTime(isTextNodeVisible);
   getEffectiveScroll = measureTime(getEffectiveScroll);
 
+  const walkStart = debugMode ? performance.now() : 0;
   const rootId = buildDomTree(document.body);
+  if (debugMode) PERF_METRICS.timings.buildDomTree = performance.now() - walkStart;
+
+  const hitTestStart = debugMode ? performance.now() : 0;
+  resolveTopElements();
+  if (debugMode) PERF_METRICS.timings.resolveTopElements = performance.now() - hitTestStart;
 
   // Clear the cache before starting
   DOM_CACHE.clearCache();
@@ -1041,7 +1374,27 @@
     }
   }
 
-  return debugMode ?
-    { rootId, map: DOM_HASH_MAP, perfMetrics: PERF_METRICS } :
-    { rootId, map: DOM_HASH_MAP };
+  const result = encodeDomTree(rootId);
+  if (debugMode) result.perfMetrics = PERF_METRICS;
+
+  if (doHighlightElements && HIGHLIGHTS.length > 0) renderHighlights(HIGHLIGHTS);
+  if (highlightRects) {
+    // [index, left, top, width, height] per highlighted element, in CSS pixels of the viewport
+    result.highlightRects = HIGHLIGHTS.flatMap((highlight) => {
+      const rect = getHighlightRect(highlight);
+      return [highlight.index, rect.left, rect.top, rect.width, rect.height];
+    });
+    result.viewport = [window.scrollX, window.scrollY, window.innerWidth, window.innerHeight];
+  }
+
+  if (SNAPSHOT) {
+    SNAPSHOT.nextNodeId = ID.current;
+    SNAPSHOT.nextHighlightIndex = highlightIndex;
+    window.__browserUseDomSnapshot = SNAPSHOT;
+    result.snapshotId = SNAPSHOT.id;
+    result.incremental = reuseEnabled;
+  }
+
+  // A single string is much cheaper to transfer than a deeply nested object
+  return JSON.stringify(result);
 };
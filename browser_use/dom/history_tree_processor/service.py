@@ -1,8 +1,72 @@
 import hashlib
-from typing import Optional
+import logging
+from typing import Iterable, Optional
 
 from browser_use.dom.history_tree_processor.view import DOMHistoryElement, HashedDomElement
-from browser_use.dom.views import DOMElementNode
+from browser_use.dom.views import DOMElementNode, DOMState, DOMTree
+
+logger = logging.getLogger(__name__)
+
+try:
+	import xxhash
+
+	def _new_hasher():
+		return xxhash.xxh64()
+except ImportError:
+
+	def _new_hasher():
+		# Element hashes are only compared within a process, so a short non-cryptographic digest is enough
+		return hashlib.blake2b(digest_size=8)
+
+
+def _fast_hash(value: str) -> str:
+	hasher = _new_hasher()
+	hasher.update(value.encode())
+	return hasher.hexdigest()
+
+
+# Attributes hash of elements without attributes
+_EMPTY_ATTRIBUTES_HASH = _fast_hash('')
+
+
+class DOMElementHashIndex:
+	"""
+	Highlighted elements by HashedDomElement, plus buckets by xpath hash alone and by attributes hash
+	alone, so elements that changed slightly since they were recorded are still found without a traversal.
+	"""
+
+	def __init__(self, elements: Iterable[DOMElementNode]):
+		self.exact: dict[HashedDomElement, DOMElementNode] = {}
+		self.by_xpath: dict[str, list[DOMElementNode]] = {}
+		self.by_attributes: dict[str, list[DOMElementNode]] = {}
+
+		for element in elements:
+			hashed = element.hash
+			self.exact.setdefault(hashed, element)
+			self.by_xpath.setdefault(hashed.xpath_hash, []).append(element)
+			self.by_attributes.setdefault(hashed.attributes_hash, []).append(element)
+
+	def find(self, hashed: HashedDomElement) -> Optional[DOMElementNode]:
+		element = self.exact.get(hashed)
+		if element is not None:
+			return element
+
+		# Same attributes and branch path or xpath (the element moved among its siblings or to another branch at the
+		# same xpath), then same xpath with changed attributes. Attribute-less elements share the empty attributes
+		# hash, which says nothing about the element, so it is never matched alone. Ambiguous matches are no match.
+		candidates: list[DOMElementNode] = []
+		if hashed.attributes_hash != _EMPTY_ATTRIBUTES_HASH:
+			candidates = [
+				candidate
+				for candidate in self.by_attributes.get(hashed.attributes_hash, ())
+				if candidate.hash.branch_path_hash == hashed.branch_path_hash or candidate.hash.xpath_hash == hashed.xpath_hash
+			]
+		if len(candidates) != 1:
+			candidates = self.by_xpath.get(hashed.xpath_hash, [])
+		if len(candidates) == 1:
+			logger.warning(f'No exact match for the element, using {candidates[0]} with a partially matching hash')
+			return candidates[0]
+		return None
 
 
 class HistoryTreeProcessor:
@@ -35,6 +99,10 @@ class HistoryTreeProcessor:
 	def find_history_element_in_tree(dom_history_element: DOMHistoryElement, tree: DOMElementNode) -> Optional[DOMElementNode]:
 		hashed_dom_history_element = HistoryTreeProcessor._hash_dom_history_element(dom_history_element)
 
+		# Whole trees are looked up in the hash index, subtrees are searched
+		if tree.parent is None:
+			return HistoryTreeProcessor.get_element_by_hash(tree.tree, hashed_dom_history_element)
+
 		def process_node(node: DOMElementNode):
 			if node.highlight_index is not None:
 				hashed_node = HistoryTreeProcessor._hash_dom_element(node)
@@ -49,6 +117,93 @@ class HistoryTreeProcessor:
 
 		return process_node(tree)
 
+	@staticmethod
+	def find_history_element_in_state(dom_history_element: DOMHistoryElement, state: DOMState) -> Optional[DOMElementNode]:
+		"""Looks the element up in the hash index of the state, falls back to partially matching hashes"""
+		hashed_dom_history_element = HistoryTreeProcessor._hash_dom_history_element(dom_history_element)
+		return state.hash_index.find(hashed_dom_history_element)
+
+	@staticmethod
+	def get_element_by_hash(tree: DOMTree, hashed_dom_element: HashedDomElement) -> Optional[DOMElementNode]:
+		"""Returns the first highlighted element of the tree with the given hash"""
+		row = HistoryTreeProcessor.hash_dom_tree(tree).get(hashed_dom_element)
+		return tree.node(row) if row is not None else None  # type: ignore
+
+	@staticmethod
+	def hash_dom_tree(tree: DOMTree) -> dict[HashedDomElement, int]:
+		"""
+		Hashes all highlighted elements of a tree at once and indexes them by hash.
+
+		Branch path hashes are built from parent to child: the hasher of an element continues from a
+		copy of its parent's hasher, which is memoized. So every ancestor is hashed once, instead of
+		walking up to the root for every element. Memoized on the tree.
+		"""
+		if tree._hash_index is not None:
+			return tree._hash_index
+
+		parents = tree.parents
+		names = tree.names
+		strings = tree.strings
+		# row -> hasher of the branch path up to that row, roots are not part of the branch paths
+		hashers = {}
+		hash_index: dict[HashedDomElement, int] = {}
+
+		for row in tree.highlighted_rows():
+			path = []
+			current = row
+			while current >= 0 and current not in hashers:
+				path.append(current)
+				current = parents[current]
+			if current < 0:
+				current = path.pop()
+				hashers[current] = _new_hasher()
+
+			for child in reversed(path):
+				if parents[current] < 0:
+					hasher = _new_hasher()
+					hasher.update(strings[names[child]].encode())
+				else:
+					hasher = hashers[current].copy()
+					hasher.update(f'/{strings[names[child]]}'.encode())
+				hashers[child] = hasher
+				current = child
+
+			node: DOMElementNode = tree.node(row)  # type: ignore
+			hashed = HashedDomElement(
+				hashers[row].hexdigest(),
+				HistoryTreeProcessor._attributes_hash(node.attributes),
+				HistoryTreeProcessor._xpath_hash(tree.xpath(row)),
+			)
+			tree._hashes[row] = hashed
+			hash_index.setdefault(hashed, row)
+
+		tree._hash_index = hash_index
+		return hash_index
+
+	@staticmethod
+	def clickable_elements_by_key(element_tree: DOMElementNode, include_attributes: list[str] = []) -> dict[tuple, str]:
+		"""
+		The lines of clickable_elements_to_string in order, keyed by the branch path and xpath hash of their element, so
+		an element keeps its key when its attributes, text or highlight index change. Text lines are keyed by their text.
+		Repeated keys are numbered.
+		"""
+		tree = element_tree.tree
+		HistoryTreeProcessor.hash_dom_tree(tree)
+		highlight_indices = tree.highlight_indices
+
+		lines: dict[tuple, str] = {}
+		occurrences: dict[tuple, int] = {}
+		for row, line in element_tree.iter_clickable_element_rows(include_attributes):
+			if highlight_indices[row] >= 0:
+				hashed = tree._hashes[row]
+				key: tuple = ('element', hashed.branch_path_hash, hashed.xpath_hash)
+			else:
+				key = ('text', line)
+			occurrence = occurrences.get(key, 0)
+			occurrences[key] = occurrence + 1
+			lines[(*key, occurrence)] = line
+		return lines
+
 	@staticmethod
 	def compare_history_element_and_dom_element(dom_history_element: DOMHistoryElement, dom_element: DOMElementNode) -> bool:
 		hashed_dom_history_element = HistoryTreeProcessor._hash_dom_history_element(dom_history_element)
@@ -89,19 +244,19 @@ class HistoryTreeProcessor:
 	@staticmethod
 	def _parent_branch_path_hash(parent_branch_path: list[str]) -> str:
 		parent_branch_path_string = '/'.join(parent_branch_path)
-		return hashlib.sha256(parent_branch_path_string.encode()).hexdigest()
+		return _fast_hash(parent_branch_path_string)
 
 	@staticmethod
 	def _attributes_hash(attributes: dict[str, str]) -> str:
 		attributes_string = ''.join(f'{key}={value}' for key, value in attributes.items())
-		return hashlib.sha256(attributes_string.encode()).hexdigest()
+		return _fast_hash(attributes_string)
 
 	@staticmethod
 	def _xpath_hash(xpath: str) -> str:
-		return hashlib.sha256(xpath.encode()).hexdigest()
+		return _fast_hash(xpath)
 
 	@staticmethod
 	def _text_hash(dom_element: DOMElementNode) -> str:
 		""" """
 		text_string = dom_element.get_all_text_till_next_clickable_element()
-		return hashlib.sha256(text_string.encode()).hexdigest()
+		return _fast_hash(text_string)
@@ -0,0 +1,104 @@
+(() => {
+  // Installed once per document (via add_init_script) so buildDomTree.js can
+  // re-evaluate only the subtrees that changed since the previous snapshot.
+  if (window.__browserUseDomObserver) return;
+
+  const HIGHLIGHT_CONTAINER_ID = "playwright-highlight-container";
+
+  // Past this many dirty roots a full rebuild is cheaper than tracking them
+  const MAX_DIRTY_NODES = 2000;
+
+  const state = {
+    // Nodes whose whole subtree has to be re-evaluated
+    dirty: new Set(),
+    // Set when too much changed (or tracking failed) - forces a full rebuild
+    overflow: false,
+    version: 0,
+  };
+
+  function isHighlightNode(node) {
+    if (!node) return false;
+    if (node.id === HIGHLIGHT_CONTAINER_ID) return true;
+    const element = node.nodeType === Node.ELEMENT_NODE ? node : node.parentElement;
+    return !!(element && element.closest && element.closest(`#${HIGHLIGHT_CONTAINER_ID}`));
+  }
+
+  function markDirty(node) {
+    if (state.overflow || !node) return;
+    state.dirty.add(node);
+    state.version++;
+    if (state.dirty.size > MAX_DIRTY_NODES) {
+      state.overflow = true;
+      state.dirty.clear();
+    }
+  }
+
+  function handleMutations(mutations) {
+    for (const mutation of mutations) {
+      if (isHighlightNode(mutation.target)) continue;
+
+      if (mutation.type === "childList") {
+        // Our own overlay container being added/removed is not a page change
+        const changed = [...mutation.addedNodes, ...mutation.removedNodes];
+        if (changed.length > 0 && changed.every(isHighlightNode)) continue;
+      }
+
+      // Text changes invalidate the containing element
+      if (mutation.type === "characterData") {
+        markDirty(mutation.target.parentNode);
+      } else {
+        markDirty(mutation.target);
+      }
+    }
+  }
+
+  const observer = new MutationObserver(handleMutations);
+  const observerOptions = {
+    subtree: true,
+    childList: true,
+    attributes: true,
+    characterData: true,
+  };
+
+  function observe(root) {
+    try {
+      observer.observe(root, observerOptions);
+    } catch (e) {
+      state.overflow = true;
+    }
+  }
+
+  observe(document);
+
+  // Mutations inside shadow roots are not reported to the document observer
+  const originalAttachShadow = Element.prototype.attachShadow;
+  Element.prototype.attachShadow = function attachShadow(options) {
+    const shadowRoot = originalAttachShadow.call(this, options);
+    observe(shadowRoot);
+    return shadowRoot;
+  };
+
+  // Scrolling a container moves all of its descendants without any mutation
+  document.addEventListener(
+    "scroll",
+    (event) => {
+      const target = event.target;
+      if (target && target !== document && target !== document.documentElement) {
+        markDirty(target);
+      }
+    },
+    { capture: true, passive: true }
+  );
+
+  window.__browserUseDomObserver = {
+    state,
+    // Deliver pending records and hand over the dirty set, starting a new window
+    takeDirtyNodes() {
+      handleMutations(observer.takeRecords());
+      const result = { dirty: state.dirty, overflow: state.overflow };
+      state.dirty = new Set();
+      state.overflow = false;
+      return result;
+    },
+  };
+})();
@@ -1,6 +1,6 @@
-import gc
 import json
 import logging
+from array import array
 from dataclasses import dataclass
 from importlib import resources
 from typing import TYPE_CHECKING, Optional
@@ -8,11 +8,12 @@ from typing import TYPE_CHECKING, Optional
 if TYPE_CHECKING:
 	from playwright.async_api import Page
 
+from browser_use.dom.history_tree_processor.view import Coordinates, CoordinateSet
+from browser_use.dom.history_tree_processor.view import ViewportInfo as PageViewportInfo
 from browser_use.dom.views import (
-	DOMBaseNode,
 	DOMElementNode,
 	DOMState,
-	DOMTextNode,
+	DOMTree,
 	SelectorMap,
 )
 from browser_use.utils import time_execution_async
@@ -20,18 +21,49 @@ from browser_use.utils import time_execution_async
 logger = logging.getLogger(__name__)
 
 
+# The other node flags of the wire format are the DOMTree flags
+NODE_REUSED = 128
+
+# buildDomTree.js is installed once per document as init script (see BrowserContext._create_context),
+# every snapshot then only sends its arguments. The script ends with `void 0`, as page.evaluate calls
+# an expression whose value is a function, which would run buildDomTree without arguments
+BUILD_DOM_TREE_JS = resources.read_text('browser_use.dom', 'buildDomTree.js')
+BUILD_DOM_TREE_INIT_SCRIPT = f'window.__browserUseBuildDomTree = {BUILD_DOM_TREE_JS.strip().rstrip(";")};\nvoid 0;'
+_CALL_BUILD_DOM_TREE = '(args) => window.__browserUseBuildDomTree ? window.__browserUseBuildDomTree(args) : null'
+
+
+class MissingSnapshotNodeError(Exception):
+	"""An incremental snapshot references a node the previous snapshot does not have"""
+
+
 @dataclass
 class ViewportInfo:
 	width: int
 	height: int
 
 
+def _coordinate_set(left: int, top: int, width: int, height: int) -> CoordinateSet:
+	return CoordinateSet(
+		top_left=Coordinates(x=left, y=top),
+		top_right=Coordinates(x=left + width, y=top),
+		bottom_left=Coordinates(x=left, y=top + height),
+		bottom_right=Coordinates(x=left + width, y=top + height),
+		center=Coordinates(x=left + width // 2, y=top + height // 2),
+		width=width,
+		height=height,
+	)
+
+
 class DomService:
 	def __init__(self, page: 'Page'):
 		self.page = page
 		self.xpath_cache = {}
 
-		self.js_code = resources.read_text('browser_use.dom', 'buildDomTree.js')
+		# Last incremental snapshot: its tree, the js node id of every row and the reverse lookup
+		self._snapshot_id: Optional[str] = None
+		self._snapshot_tree: Optional[DOMTree] = None
+		self._snapshot_ids = array('i')
+		self._snapshot_rows: dict[int, int] = {}
 
 	# region - Clickable elements
 	@time_execution_async('--get_clickable_elements')
@@ -40,8 +72,20 @@ class DomService:
 		highlight_elements: bool = True,
 		focus_element: int = -1,
 		viewport_expansion: int = 0,
+		incremental: bool = False,
+		highlight_rects: bool = False,
 	) -> DOMState:
-		element_tree, selector_map = await self._build_dom_tree(highlight_elements, focus_element, viewport_expansion)
+		"""
+		incremental: only re-evaluate the subtrees that changed since the previous call and patch
+		the previous tree. Needs mutationObserver.js installed as init script, otherwise (and after
+		navigations, scrolling or resizing) a full snapshot is taken.
+
+		highlight_rects: set viewport_coordinates, page_coordinates and viewport_info of the elements
+		that would be highlighted, e.g. to draw the highlights onto a screenshot instead of into the page.
+		"""
+		element_tree, selector_map = await self._build_dom_tree(
+			highlight_elements, focus_element, viewport_expansion, incremental, highlight_rects
+		)
 		return DOMState(element_tree=element_tree, selector_map=selector_map)
 
 	@time_execution_async('--build_dom_tree')
@@ -50,10 +94,9 @@ class DomService:
 		highlight_elements: bool,
 		focus_element: int,
 		viewport_expansion: int,
+		incremental: bool = False,
+		highlight_rects: bool = False,
 	) -> tuple[DOMElementNode, SelectorMap]:
-		if await self.page.evaluate('1+1') != 2:
-			raise ValueError('The page cannot evaluate javascript code properly')
-
 		# NOTE: We execute JS code in the browser to extract important DOM information.
 		#       The returned hash map contains information about the DOM tree and the
 		#       relationship between the DOM elements.
@@ -63,10 +106,16 @@ class DomService:
 			'focusHighlightIndex': focus_element,
 			'viewportExpansion': viewport_expansion,
 			'debugMode': debug_mode,
+			'incremental': incremental,
+			'snapshotId': self._snapshot_id if incremental else None,
+			'highlightRects': highlight_rects,
 		}
 
+		# Forget the snapshot until the new one is parsed, a failure in between forces a full snapshot
+		self._snapshot_id = None
+
 		try:
-			eval_page = await self.page.evaluate(self.js_code, args)
+			eval_page = await self._evaluate_build_dom_tree(args)
 		except Exception as e:
 			logger.error('Error evaluating JavaScript: %s', e)
 			raise
@@ -75,95 +124,117 @@ class DomService:
 		if debug_mode and 'perfMetrics' in eval_page:
 			logger.debug('DOM Tree Building Performance Metrics:\n%s', json.dumps(eval_page['perfMetrics'], indent=2))
 
-		return await self._construct_dom_tree(eval_page)
+		try:
+			element_tree, selector_map = await self._construct_dom_tree(eval_page)
+		except MissingSnapshotNodeError as e:
+			logger.debug(f'Incremental DOM snapshot could not be applied ({e}), taking a full snapshot')
+			args['snapshotId'] = None
+			eval_page = await self._evaluate_build_dom_tree(args)
+			element_tree, selector_map = await self._construct_dom_tree(eval_page)
+
+		if 'highlightRects' in eval_page:
+			self._set_highlight_coordinates(eval_page, selector_map)
+		return element_tree, selector_map
+
+	@staticmethod
+	def _set_highlight_coordinates(eval_page: dict, selector_map: SelectorMap) -> None:
+		"""Sets the coordinates of the highlighted elements from the flat [index, left, top, width, height] list"""
+		scroll_x, scroll_y, width, height = (round(value) for value in eval_page['viewport'])
+		viewport_info = PageViewportInfo(scroll_x=scroll_x, scroll_y=scroll_y, width=width, height=height)
+		rects = eval_page['highlightRects']
+		for i in range(0, len(rects), 5):
+			element = selector_map.get(rects[i])
+			if element is None:
+				continue
+			left, top, rect_width, rect_height = (round(value) for value in rects[i + 1 : i + 5])
+			element.tree.set_extras(
+				element.row,
+				viewport_coordinates=_coordinate_set(left, top, rect_width, rect_height),
+				page_coordinates=_coordinate_set(left + scroll_x, top + scroll_y, rect_width, rect_height),
+				viewport_info=viewport_info,
+			)
+
+	async def _evaluate_build_dom_tree(self, args: dict) -> dict:
+		"""
+		Calls the installed buildDomTree function. Documents loaded before the init script was
+		registered (e.g. pages of a connected browser) get it installed on their first snapshot.
+		"""
+		payload = await self.page.evaluate(_CALL_BUILD_DOM_TREE, args)
+		if payload is None:
+			await self.page.evaluate(BUILD_DOM_TREE_INIT_SCRIPT)
+			payload = await self.page.evaluate(_CALL_BUILD_DOM_TREE, args)
+		return json.loads(payload)
 
 	@time_execution_async('--construct_dom_tree')
 	async def _construct_dom_tree(
 		self,
 		eval_page: dict,
 	) -> tuple[DOMElementNode, SelectorMap]:
-		js_node_map = eval_page['map']
-		js_root_id = eval_page['rootId']
-
-		selector_map = {}
-		node_map = {}
-
-		for id, node_data in js_node_map.items():
-			node, children_ids = self._parse_node(node_data)
-			if node is None:
-				continue
-
-			node_map[id] = node
-
-			if isinstance(node, DOMElementNode) and node.highlight_index is not None:
-				selector_map[node.highlight_index] = node
-
-			# NOTE: We know that we are building the tree bottom up
-			#       and all children are already processed.
-			if isinstance(node, DOMElementNode):
-				for child_id in children_ids:
-					if child_id not in node_map:
-						continue
-
-					child_node = node_map[child_id]
-
-					child_node.parent = node
-					node.children.append(child_node)
-
-		html_to_dict = node_map[str(js_root_id)]
-
-		del node_map
-		del js_node_map
-		del js_root_id
-
-		gc.collect()
-
+		"""Decodes the columnar payload of buildDomTree.js into a DOMTree, see encodeDomTree there for the layout"""
+		tree = DOMTree(eval_page['strings'])
+		ids = eval_page.get('ids')
+
+		# Incremental snapshots only contain the changed nodes, unchanged subtrees
+		# are referenced by the ids they had in the previous snapshot and copied from its tree
+		previous_tree = self._snapshot_tree if eval_page.get('incremental') else None
+		reused = 0
+
+		# payload row -> tree row, and tree row -> js node id for the next incremental snapshot
+		rows: list[int] = []
+		row_ids = array('i')
+
+		attributes = eval_page['attributes']
+		attribute_position = 0
+
+		for payload_row, (parent_row, flags, name, xpath, highlight_index, attribute_count) in enumerate(
+			zip(
+				eval_page['parents'],
+				eval_page['flags'],
+				eval_page['names'],
+				eval_page['xpaths'],
+				eval_page['highlights'],
+				eval_page['attributeCounts'],
+			)
+		):
+			# NOTE: Rows are in pre-order, the parent is always decoded before its children
+			parent = rows[parent_row] if parent_row >= 0 else -1
+
+			if flags & NODE_REUSED:
+				previous_row = self._snapshot_rows.get(ids[payload_row]) if previous_tree is not None and ids else None
+				if previous_row is None:
+					raise MissingSnapshotNodeError(
+						f'node {ids[payload_row] if ids else payload_row} is not part of the previous snapshot'
+					)
+				row = len(tree)
+				copied = tree.copy_subtree(previous_tree, previous_row, parent)
+				row_ids.extend(self._snapshot_ids[copied_row] for copied_row in copied)
+				reused += len(copied)
+			else:
+				end = attribute_position + 2 * attribute_count
+				row = tree.append(parent, flags, name, xpath, highlight_index, attributes[attribute_position:end])
+				attribute_position = end
+				if ids:
+					row_ids.append(ids[payload_row])
+
+			rows.append(row)
+
+		selector_map = {tree.highlight_indices[row]: tree.node(row) for row in tree.highlighted_rows()}
+		html_to_dict = tree.node(0) if len(tree) else None
+
+		if 'snapshotId' in eval_page:
+			self._snapshot_id = eval_page['snapshotId']
+			self._snapshot_tree = tree
+			self._snapshot_ids = row_ids
+			self._snapshot_rows = {js_id: row for row, js_id in enumerate(row_ids)}
+			logger.debug(f'DOM snapshot: {len(tree) - reused} nodes evaluated, {reused} reused')
+		else:
+			self._snapshot_tree = None
+			self._snapshot_ids = array('i')
+			self._snapshot_rows = {}
+
+		# NOTE: The tree does not reference its views, so it is freed by reference counting
+		#       as soon as the last state holding it is dropped - no need for gc.collect()
 		if html_to_dict is None or not isinstance(html_to_dict, DOMElementNode):
 			raise ValueError('Failed to parse HTML to dictionary')
 
 		return html_to_dict, selector_map
-
-	def _parse_node(
-		self,
-		node_data: dict,
-	) -> tuple[Optional[DOMBaseNode], list[int]]:
-		if not node_data:
-			return None, []
-
-		# Process text nodes immediately
-		if node_data.get('type') == 'TEXT_NODE':
-			text_node = DOMTextNode(
-				text=node_data['text'],
-				is_visible=node_data['isVisible'],
-				parent=None,
-			)
-			return text_node, []
-
-		# Process coordinates if they exist for element nodes
-
-		viewport_info = None
-
-		if 'viewport' in node_data:
-			viewport_info = ViewportInfo(
-				width=node_data['viewport']['width'],
-				height=node_data['viewport']['height'],
-			)
-
-		element_node = DOMElementNode(
-			tag_name=node_data['tagName'],
-			xpath=node_data['xpath'],
-			attributes=node_data.get('attributes', {}),
-			children=[],
-			is_visible=node_data.get('isVisible', False),
-			is_interactive=node_data.get('isInteractive', False),
-			is_top_element=node_data.get('isTopElement', False),
-			is_in_viewport=node_data.get('isInViewport', False),
-			highlight_index=node_data.get('highlightIndex'),
-			shadow_root=node_data.get('shadowRoot', False),
-			parent=None,
-			viewport_info=viewport_info,
-		)
-
-		children_ids = node_data.get('children', [])
-
-		return element_node, children_ids
@@ -21,7 +21,7 @@ async def test_process_dom():
 			js_code = f.read()
 
 		start = time.time()
-		dom_tree = await page.evaluate(js_code)
+		dom_tree = json.loads(await page.evaluate(js_code))
 		end = time.time()
 
 		# print(dom_tree)
@@ -1,26 +1,488 @@
-from dataclasses import dataclass
-from functools import cached_property
-from typing import TYPE_CHECKING, Dict, List, Optional
+from array import array
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
 from browser_use.dom.history_tree_processor.view import CoordinateSet, HashedDomElement, ViewportInfo
 from browser_use.utils import time_execution_sync
 
 # Avoid circular import issues
 if TYPE_CHECKING:
+	from browser_use.dom.history_tree_processor.service import DOMElementHashIndex
+
 	from .views import DOMElementNode
 
 
-@dataclass(frozen=False)
+# Node flags, shared with the buildDomTree.js wire format
+NODE_TEXT = 1
+NODE_VISIBLE = 2
+NODE_INTERACTIVE = 4
+NODE_TOP_ELEMENT = 8
+NODE_IN_VIEWPORT = 16
+NODE_SHADOW_ROOT = 32
+# The xpath column holds the whole xpath instead of the segment below the parent
+NODE_XPATH_ABSOLUTE = 64
+
+
+class DOMTree:
+	"""
+	Struct-of-arrays store of a DOM snapshot, every node is one row.
+
+	Strings (tag names, texts, xpath segments, attribute keys and values) are interned in `strings`,
+	the other columns are compact arrays. DOMElementNode and DOMTextNode are lightweight views over a row.
+	"""
+
+	__slots__ = (
+		'strings',
+		'flags',
+		'names',
+		'xpaths',
+		'highlight_indices',
+		'parents',
+		'first_children',
+		'next_siblings',
+		'last_children',
+		'attribute_offsets',
+		'attributes',
+		'_string_indices',
+		'_hashes',
+		'_hash_index',
+		'_extras',
+		'_forward',
+	)
+
+	def __init__(self, strings: Optional[List[str]] = None):
+		self.strings: List[str] = strings if strings is not None else []
+		self.flags = array('H')
+		# tag name of elements, text of text nodes
+		self.names = array('i')
+		self.xpaths = array('i')
+		self.highlight_indices = array('i')
+		self.parents = array('i')
+		self.first_children = array('i')
+		self.next_siblings = array('i')
+		self.last_children = array('i')
+		# attributes of row r are the (key, value) pairs attributes[attribute_offsets[r]:attribute_offsets[r + 1]]
+		self.attribute_offsets = array('i', [0])
+		self.attributes = array('i')
+		self._string_indices: Optional[Dict[str, int]] = None
+		# Element hashes by row, and the first row of every hash (see HistoryTreeProcessor.hash_dom_tree)
+		self._hashes: Dict[int, HashedDomElement] = {}
+		self._hash_index: Optional[Dict[HashedDomElement, int]] = None
+		# Rarely set fields (coordinates, viewport info) by row
+		self._extras: Dict[int, Dict[str, Any]] = {}
+		# Rows moved into another tree by adopt, views of them follow to their new tree and row
+		self._forward: Dict[int, Tuple['DOMTree', int]] = {}
+
+	def __len__(self) -> int:
+		return len(self.flags)
+
+	def intern(self, value: str) -> int:
+		if self._string_indices is None:
+			self._string_indices = {string: index for index, string in enumerate(self.strings)}
+		index = self._string_indices.get(value)
+		if index is None:
+			index = len(self.strings)
+			self.strings.append(value)
+			self._string_indices[value] = index
+		return index
+
+	def append(self, parent: int, flags: int, name: int, xpath: int, highlight_index: int, attributes: Sequence[int] = ()) -> int:
+		"""Appends a row as last child of `parent` (-1 for a root), strings are indices into `strings`"""
+		row = len(self.flags)
+		self.flags.append(flags)
+		self.names.append(name)
+		self.xpaths.append(xpath)
+		self.highlight_indices.append(highlight_index)
+		self.parents.append(parent)
+		self.first_children.append(-1)
+		self.next_siblings.append(-1)
+		self.last_children.append(-1)
+		if attributes:
+			self.attributes.extend(attributes)
+		self.attribute_offsets.append(len(self.attributes))
+
+		self._hash_index = None
+		if parent >= 0:
+			last_child = self.last_children[parent]
+			if last_child < 0:
+				self.first_children[parent] = row
+			else:
+				self.next_siblings[last_child] = row
+			self.last_children[parent] = row
+		return row
+
+	def set_extras(self, row: int, **extras: Any) -> None:
+		"""Sets rarely used fields of a row, e.g. viewport_coordinates"""
+		self._extras.setdefault(row, {}).update(extras)
+
+	def copy_subtree(self, source: 'DOMTree', row: int, parent: int) -> List[int]:
+		"""Copies the subtree of `row` in `source` below `parent`, returns the copied source rows in order"""
+		copied = []
+		same_strings = source.strings is self.strings
+		stack = [(row, parent)]
+		while stack:
+			source_row, target_parent = stack.pop()
+			flags = source.flags[source_row]
+			if source_row == row and not flags & NODE_TEXT:
+				# The subtree root keeps its xpath, whatever the new parent is
+				flags |= NODE_XPATH_ABSOLUTE
+				xpath = self.intern(source.xpath(source_row))
+			elif same_strings or source.xpaths[source_row] < 0:
+				xpath = source.xpaths[source_row]
+			else:
+				xpath = self.intern(source.strings[source.xpaths[source_row]])
+			attributes = source.attributes[source.attribute_offsets[source_row] : source.attribute_offsets[source_row + 1]]
+			if same_strings:
+				name = source.names[source_row]
+			else:
+				name = self.intern(source.strings[source.names[source_row]])
+				attributes = [self.intern(source.strings[index]) for index in attributes]
+
+			target_row = self.append(target_parent, flags, name, xpath, source.highlight_indices[source_row], attributes)
+			if source_row in source._extras:
+				self._extras[target_row] = dict(source._extras[source_row])
+			copied.append(source_row)
+
+			children = list(source.child_rows(source_row))
+			stack.extend((child, target_row) for child in reversed(children))
+		return copied
+
+	def adopt(self, node: 'DOMBaseNode', parent: int) -> None:
+		"""
+		Makes `node` the last child of `parent`. A node of another tree is copied with its subtree,
+		views of the copied rows follow them into this tree.
+		"""
+		source, row = node.tree, node.row
+		if source is self:
+			ancestor = parent
+			while ancestor >= 0:
+				if ancestor == row:
+					raise ValueError(f'Cannot move {node!r} below itself')
+				ancestor = self.parents[ancestor]
+			self.detach(row)
+			self._link(row, parent)
+			return
+
+		first_row = len(self)
+		copied = self.copy_subtree(source, row, parent)
+		source.detach(row)
+		for offset, source_row in enumerate(copied):
+			source._forward[source_row] = (self, first_row + offset)
+		self._changed()
+
+	def detach(self, row: int) -> None:
+		"""Unlinks a row from its parent, it keeps its subtree and xpath as a root of the tree"""
+		parent = self.parents[row]
+		if parent < 0:
+			return
+		self._make_xpath_absolute(row)
+		previous, child = -1, self.first_children[parent]
+		while child != row:
+			previous, child = child, self.next_siblings[child]
+		following = self.next_siblings[row]
+		if previous < 0:
+			self.first_children[parent] = following
+		else:
+			self.next_siblings[previous] = following
+		if self.last_children[parent] == row:
+			self.last_children[parent] = previous
+		self.parents[row] = -1
+		self.next_siblings[row] = -1
+		self._changed()
+
+	def set_children(self, row: int, children: Sequence['DOMBaseNode']) -> None:
+		"""Replaces the children of a row, removed children stay in the tree as roots"""
+		for child in list(self.child_rows(row)):
+			self.detach(child)
+		seen = set()
+		for child in children:
+			if child.tree is self and child.row in seen:
+				continue
+			self.adopt(child, row)
+			seen.add(child.row)
+
+	def set_attributes(self, row: int, attributes: Dict[str, str]) -> None:
+		start, end = self.attribute_offsets[row], self.attribute_offsets[row + 1]
+		pairs = array('i', [index for key, value in attributes.items() for index in (self.intern(key), self.intern(value))])
+		self.attributes[start:end] = pairs
+		shift = len(pairs) - (end - start)
+		if shift:
+			offsets = self.attribute_offsets
+			for following in range(row + 1, len(offsets)):
+				offsets[following] += shift
+		self._changed()
+
+	def set_xpath(self, row: int, xpath: str) -> None:
+		# Children with an xpath relative to this row keep theirs
+		for child in self.child_rows(row):
+			if not self.flags[child] & NODE_TEXT:
+				self._make_xpath_absolute(child)
+		self.xpaths[row] = self.intern(xpath)
+		self.flags[row] |= NODE_XPATH_ABSOLUTE
+		self._changed()
+
+	def set_flag(self, row: int, flag: int, value: bool) -> None:
+		if value:
+			self.flags[row] |= flag
+		else:
+			self.flags[row] &= ~flag
+
+	def _make_xpath_absolute(self, row: int) -> None:
+		if not self.flags[row] & (NODE_TEXT | NODE_XPATH_ABSOLUTE):
+			self.xpaths[row] = self.intern(self.xpath(row))
+			self.flags[row] |= NODE_XPATH_ABSOLUTE
+
+	def _link(self, row: int, parent: int) -> None:
+		self.parents[row] = parent
+		if parent >= 0:
+			last_child = self.last_children[parent]
+			if last_child < 0:
+				self.first_children[parent] = row
+			else:
+				self.next_siblings[last_child] = row
+			self.last_children[parent] = row
+		self._changed()
+
+	def _changed(self) -> None:
+		"""Element hashes depend on attributes and ancestors, they are computed again after a change"""
+		self._hashes.clear()
+		self._hash_index = None
+
+	def child_rows(self, row: int) -> Iterator[int]:
+		child = self.first_children[row]
+		while child >= 0:
+			yield child
+			child = self.next_siblings[child]
+
+	def xpath(self, row: int) -> str:
+		segments = []
+		while row >= 0:
+			segments.append(self.strings[self.xpaths[row]])
+			if self.flags[row] & NODE_XPATH_ABSOLUTE:
+				break
+			row = self.parents[row]
+		segments.reverse()
+		return '/'.join(segments)
+
+	def node(self, row: int) -> 'DOMBaseNode':
+		cls = DOMTextNode if self.flags[row] & NODE_TEXT else DOMElementNode
+		node = cls.__new__(cls)
+		node._tree = self
+		node._row = row
+		return node
+
+	def highlighted_rows(self) -> Iterator[int]:
+		for row, highlight_index in enumerate(self.highlight_indices):
+			if highlight_index >= 0:
+				yield row
+
+
 class DOMBaseNode:
-	is_visible: bool
-	# Use None as default and set parent later to avoid circular reference issues
-	parent: Optional['DOMElementNode']
+	"""A view over one row of a DOMTree, views of the same row compare equal"""
+
+	__slots__ = ('_tree', '_row')
+
+	_tree: DOMTree
+	_row: int
+
+	@property
+	def tree(self) -> DOMTree:
+		if self._tree._forward:
+			self._follow()
+		return self._tree
+
+	@property
+	def row(self) -> int:
+		if self._tree._forward:
+			self._follow()
+		return self._row
+
+	def _follow(self) -> None:
+		"""Rebinds the view to the tree and row its row was moved to by DOMTree.adopt"""
+		moved = self._tree._forward.get(self._row)
+		while moved is not None:
+			self._tree, self._row = moved
+			moved = self._tree._forward.get(self._row)
+
+	def __eq__(self, other: object) -> bool:
+		if not isinstance(other, DOMBaseNode):
+			return NotImplemented
+		return self.tree is other.tree and self._row == other.row
+
+	def __hash__(self) -> int:
+		return hash((id(self.tree), self._row))
+
+	@property
+	def is_visible(self) -> bool:
+		return bool(self.tree.flags[self._row] & NODE_VISIBLE)
+
+	@is_visible.setter
+	def is_visible(self, value: bool) -> None:
+		self.tree.set_flag(self._row, NODE_VISIBLE, value)
+
+	@property
+	def parent(self) -> Optional['DOMElementNode']:
+		parent = self.tree.parents[self._row]
+		return self.tree.node(parent) if parent >= 0 else None  # type: ignore
+
+	@parent.setter
+	def parent(self, parent: Optional['DOMElementNode']) -> None:
+		"""Moves the node with its subtree to the end of the children of `parent`, None detaches it"""
+		if parent is None:
+			self.tree.detach(self._row)
+		elif self.parent != parent:
+			parent.tree.adopt(self, parent.row)
+
+	def _extra(self, key: str) -> Any:
+		extras = self.tree._extras.get(self._row)
+		return extras.get(key) if extras else None
+
+
+def _new_row(
+	parent: Optional['DOMElementNode'],
+	flags: int,
+	name: str,
+	xpath: Optional[str],
+	highlight_index: int,
+	attributes: Dict[str, str],
+) -> tuple[DOMTree, int]:
+	"""Appends a standalone node as last child of its parent, or as root of a new tree"""
+	tree = parent.tree if parent is not None else DOMTree()
+	pairs = [index for key, value in attributes.items() for index in (tree.intern(key), tree.intern(value))]
+	xpath_index = tree.intern(xpath) if xpath is not None else -1
+	return tree, tree.append(
+		parent.row if parent is not None else -1, flags, tree.intern(name), xpath_index, highlight_index, pairs
+	)
+
+
+class _Attributes(Dict[str, str]):
+	"""The attributes of an element as a dict, changes are written through to its DOMTree"""
+
+	def __init__(self, node: 'DOMElementNode', attributes: Dict[str, str]):
+		super().__init__(attributes)
+		self._node = node
+
+	def _write(self) -> None:
+		self._node.tree.set_attributes(self._node.row, self)
+
+	def __setitem__(self, key: str, value: str) -> None:
+		super().__setitem__(key, value)
+		self._write()
+
+	def __delitem__(self, key: str) -> None:
+		super().__delitem__(key)
+		self._write()
+
+	def __ior__(self, other: Any) -> '_Attributes':  # type: ignore[override]
+		self.update(other)
+		return self
+
+	def update(self, *args: Any, **kwargs: str) -> None:
+		super().update(*args, **kwargs)
+		self._write()
+
+	def setdefault(self, key: str, default: str = '') -> str:  # type: ignore[override]
+		value = super().setdefault(key, default)
+		self._write()
+		return value
+
+	def pop(self, *args: Any) -> Any:
+		value = super().pop(*args)
+		self._write()
+		return value
+
+	def popitem(self) -> Tuple[str, str]:
+		item = super().popitem()
+		self._write()
+		return item
+
+	def clear(self) -> None:
+		super().clear()
+		self._write()
+
+
+class _Children(List['DOMBaseNode']):
+	"""
+	The children of an element as a list, changes are written through to its DOMTree: added nodes are moved
+	(or copied from another tree) below the element, removed ones stay in the tree without a parent.
+	A node is a child once, appending a node that already is a child keeps it where it is.
+	"""
+
+	def __init__(self, node: 'DOMElementNode', children: Iterable['DOMBaseNode']):
+		super().__init__(children)
+		self._node = node
+
+	def _write(self) -> None:
+		node = self._node
+		node.tree.set_children(node.row, self)
+		super().__init__(node.tree.node(child) for child in node.tree.child_rows(node.row))
+
+	def append(self, child: 'DOMBaseNode') -> None:
+		if child not in self:
+			super().append(child)
+			self._write()
+
+	def extend(self, children: Any) -> None:
+		super().extend(children)
+		self._write()
+
+	def insert(self, index: Any, child: 'DOMBaseNode') -> None:
+		super().insert(index, child)
+		self._write()
+
+	def remove(self, child: 'DOMBaseNode') -> None:
+		super().remove(child)
+		self._write()
+
+	def pop(self, index: Any = -1) -> 'DOMBaseNode':
+		child = super().pop(index)
+		self._write()
+		return child
+
+	def clear(self) -> None:
+		super().clear()
+		self._write()
+
+	def reverse(self) -> None:
+		super().reverse()
+		self._write()
+
+	def sort(self, *args: Any, **kwargs: Any) -> None:
+		super().sort(*args, **kwargs)
+		self._write()
+
+	def __setitem__(self, index: Any, value: Any) -> None:
+		super().__setitem__(index, value)
+		self._write()
+
+	def __delitem__(self, index: Any) -> None:
+		super().__delitem__(index)
+		self._write()
+
+	def __iadd__(self, children: Any) -> '_Children':  # type: ignore[override]
+		self.extend(children)
+		return self
 
 
-@dataclass(frozen=False)
 class DOMTextNode(DOMBaseNode):
-	text: str
-	type: str = 'TEXT_NODE'
+	__slots__ = ()
+
+	type = 'TEXT_NODE'
+
+	def __init__(self, is_visible: bool, parent: Optional['DOMElementNode'], text: str):
+		flags = NODE_TEXT | (NODE_VISIBLE if is_visible else 0)
+		self._tree, self._row = _new_row(parent, flags, text, None, -1, {})
+
+	@property
+	def text(self) -> str:
+		return self.tree.strings[self.tree.names[self._row]]
+
+	@text.setter
+	def text(self, text: str) -> None:
+		self.tree.names[self._row] = self.tree.intern(text)
+
+	def __repr__(self) -> str:
+		return f'DOMTextNode(text={self.text!r}, is_visible={self.is_visible})'
 
 	def has_parent_with_highlight_index(self) -> bool:
 		current = self.parent
@@ -43,25 +505,168 @@ class DOMTextNode(DOMBaseNode):
 		return self.parent.is_top_element
 
 
-@dataclass(frozen=False)
 class DOMElementNode(DOMBaseNode):
 	"""
 	xpath: the xpath of the element from the last root node (shadow root or iframe OR document if no shadow root or iframe).
 	To properly reference the element we need to recursively switch the root node until we find the element (work you way up the tree with `.parent`)
+
+	Standalone nodes are appended to the tree of their parent (or get their own DOMTree), given children
+	are moved into it. Fields can be changed as before: `parent`, `children` and `attributes` write through
+	to the tree, so `child.parent = node` and `node.children.append(child)` both make child the last child of node.
 	"""
 
-	tag_name: str
-	xpath: str
-	attributes: Dict[str, str]
-	children: List[DOMBaseNode]
-	is_interactive: bool = False
-	is_top_element: bool = False
-	is_in_viewport: bool = False
-	shadow_root: bool = False
-	highlight_index: Optional[int] = None
-	viewport_coordinates: Optional[CoordinateSet] = None
-	page_coordinates: Optional[CoordinateSet] = None
-	viewport_info: Optional[ViewportInfo] = None
+	__slots__ = ()
+
+	def __init__(
+		self,
+		is_visible: bool,
+		parent: Optional['DOMElementNode'],
+		tag_name: str,
+		xpath: str,
+		attributes: Dict[str, str],
+		children: List[DOMBaseNode],
+		is_interactive: bool = False,
+		is_top_element: bool = False,
+		is_in_viewport: bool = False,
+		shadow_root: bool = False,
+		highlight_index: Optional[int] = None,
+		viewport_coordinates: Optional[CoordinateSet] = None,
+		page_coordinates: Optional[CoordinateSet] = None,
+		viewport_info: Optional[ViewportInfo] = None,
+	):
+		flags = (
+			NODE_XPATH_ABSOLUTE
+			| (NODE_VISIBLE if is_visible else 0)
+			| (NODE_INTERACTIVE if is_interactive else 0)
+			| (NODE_TOP_ELEMENT if is_top_element else 0)
+			| (NODE_IN_VIEWPORT if is_in_viewport else 0)
+			| (NODE_SHADOW_ROOT if shadow_root else 0)
+		)
+		self._tree, self._row = _new_row(
+			parent, flags, tag_name, xpath, -1 if highlight_index is None else highlight_index, attributes
+		)
+		extras = {
+			key: value
+			for key, value in (
+				('viewport_coordinates', viewport_coordinates),
+				('page_coordinates', page_coordinates),
+				('viewport_info', viewport_info),
+			)
+			if value is not None
+		}
+		if extras:
+			self.tree._extras[self._row] = extras
+		for child in children:
+			self.tree.adopt(child, self._row)
+
+	@property
+	def tag_name(self) -> str:
+		return self.tree.strings[self.tree.names[self._row]]
+
+	@tag_name.setter
+	def tag_name(self, tag_name: str) -> None:
+		self.tree.names[self._row] = self.tree.intern(tag_name)
+		self.tree._changed()
+
+	@property
+	def xpath(self) -> str:
+		return self.tree.xpath(self._row)
+
+	@xpath.setter
+	def xpath(self, xpath: str) -> None:
+		self.tree.set_xpath(self._row, xpath)
+
+	@property
+	def attributes(self) -> Dict[str, str]:
+		tree = self.tree
+		pairs = tree.attributes[tree.attribute_offsets[self._row] : tree.attribute_offsets[self._row + 1]]
+		strings = tree.strings
+		return _Attributes(self, {strings[pairs[i]]: strings[pairs[i + 1]] for i in range(0, len(pairs), 2)})
+
+	@attributes.setter
+	def attributes(self, attributes: Dict[str, str]) -> None:
+		self.tree.set_attributes(self._row, attributes)
+
+	@property
+	def children(self) -> List[DOMBaseNode]:
+		tree = self.tree
+		next_siblings = tree.next_siblings
+		children = []
+		child = tree.first_children[self._row]
+		while child >= 0:
+			children.append(tree.node(child))
+			child = next_siblings[child]
+		return _Children(self, children)
+
+	@children.setter
+	def children(self, children: List[DOMBaseNode]) -> None:
+		self.tree.set_children(self._row, children)
+
+	@property
+	def is_interactive(self) -> bool:
+		return bool(self.tree.flags[self._row] & NODE_INTERACTIVE)
+
+	@is_interactive.setter
+	def is_interactive(self, value: bool) -> None:
+		self.tree.set_flag(self._row, NODE_INTERACTIVE, value)
+
+	@property
+	def is_top_element(self) -> bool:
+		return bool(self.tree.flags[self._row] & NODE_TOP_ELEMENT)
+
+	@is_top_element.setter
+	def is_top_element(self, value: bool) -> None:
+		self.tree.set_flag(self._row, NODE_TOP_ELEMENT, value)
+
+	@property
+	def is_in_viewport(self) -> bool:
+		return bool(self.tree.flags[self._row] & NODE_IN_VIEWPORT)
+
+	@is_in_viewport.setter
+	def is_in_viewport(self, value: bool) -> None:
+		self.tree.set_flag(self._row, NODE_IN_VIEWPORT, value)
+
+	@property
+	def shadow_root(self) -> bool:
+		return bool(self.tree.flags[self._row] & NODE_SHADOW_ROOT)
+
+	@shadow_root.setter
+	def shadow_root(self, value: bool) -> None:
+		self.tree.set_flag(self._row, NODE_SHADOW_ROOT, value)
+
+	@property
+	def highlight_index(self) -> Optional[int]:
+		highlight_index = self.tree.highlight_indices[self._row]
+		return highlight_index if highlight_index >= 0 else None
+
+	@highlight_index.setter
+	def highlight_index(self, highlight_index: Optional[int]) -> None:
+		self.tree.highlight_indices[self._row] = -1 if highlight_index is None else highlight_index
+		self.tree._changed()
+
+	@property
+	def viewport_coordinates(self) -> Optional[CoordinateSet]:
+		return self._extra('viewport_coordinates')
+
+	@viewport_coordinates.setter
+	def viewport_coordinates(self, value: Optional[CoordinateSet]) -> None:
+		self.tree.set_extras(self._row, viewport_coordinates=value)
+
+	@property
+	def page_coordinates(self) -> Optional[CoordinateSet]:
+		return self._extra('page_coordinates')
+
+	@page_coordinates.setter
+	def page_coordinates(self, value: Optional[CoordinateSet]) -> None:
+		self.tree.set_extras(self._row, page_coordinates=value)
+
+	@property
+	def viewport_info(self) -> Optional[ViewportInfo]:
+		return self._extra('viewport_info')
+
+	@viewport_info.setter
+	def viewport_info(self, value: Optional[ViewportInfo]) -> None:
+		self.tree.set_extras(self._row, viewport_info=value)
 
 	def __repr__(self) -> str:
 		tag_str = f'<{self.tag_name}'
@@ -89,13 +694,21 @@ class DOMElementNode(DOMBaseNode):
 
 		return tag_str
 
-	@cached_property
+	@property
 	def hash(self) -> HashedDomElement:
-		from browser_use.dom.history_tree_processor.service import (
-			HistoryTreeProcessor,
-		)
-
-		return HistoryTreeProcessor._hash_dom_element(self)
+		hashed = self.tree._hashes.get(self._row)
+		if hashed is None:
+			from browser_use.dom.history_tree_processor.service import (
+				HistoryTreeProcessor,
+			)
+
+			# Highlighted elements are hashed all at once, the others one by one
+			if self.highlight_index is not None and self.tree._hash_index is None:
+				HistoryTreeProcessor.hash_dom_tree(self.tree)
+				hashed = self.tree._hashes.get(self._row)
+			if hashed is None:
+				hashed = self.tree._hashes[self._row] = HistoryTreeProcessor._hash_dom_element(self)
+		return hashed
 
 	def get_all_text_till_next_clickable_element(self, max_depth: int = -1) -> str:
 		text_parts = []
@@ -120,49 +733,107 @@ class DOMElementNode(DOMBaseNode):
 	@time_execution_sync('--clickable_elements_to_string')
 	def clickable_elements_to_string(self, include_attributes: list[str] = []) -> str:
 		"""Convert the processed DOM content to HTML."""
-		formatted_text = []
-
-		def process_node(node: DOMBaseNode, depth: int) -> None:
-			if isinstance(node, DOMElementNode):
-				# Add element with highlight_index
-				if node.highlight_index is not None:
-					attributes_str = ''
-					text = node.get_all_text_till_next_clickable_element()
-					if include_attributes:
-						attributes = list(
-							set(
-								[
-									str(value)
-									for key, value in node.attributes.items()
-									if key in include_attributes and value != node.tag_name
-								]
-							)
-						)
-						if text in attributes:
-							attributes.remove(text)
-						attributes_str = ';'.join(attributes)
-					line = f'[{node.highlight_index}]<{node.tag_name} '
-					if attributes_str:
-						line += f'{attributes_str}'
-					if text:
-						if attributes_str:
-							line += f'>{text}'
-						else:
-							line += f'{text}'
-					line += '/>'
-					formatted_text.append(line)
-
-				# Process children regardless
-				for child in node.children:
-					process_node(child, depth + 1)
-
-			elif isinstance(node, DOMTextNode):
-				# Add text only if it doesn't have a highlighted parent
-				if not node.has_parent_with_highlight_index() and node.is_visible:  # and node.is_parent_top_element()
-					formatted_text.append(f'{node.text}')
+		return '\n'.join(self.iter_clickable_elements(include_attributes))
+
+	def iter_clickable_elements(self, include_attributes: list[str] = []) -> Iterator[str]:
+		"""Yields the lines of clickable_elements_to_string"""
+		for _, line in self.iter_clickable_element_rows(include_attributes):
+			yield line
+
+	def iter_clickable_element_rows(self, include_attributes: list[str] = []) -> Iterator[tuple[int, str]]:
+		"""
+		Yields the lines of clickable_elements_to_string with the row of their element or text node, in one pass over the tree.
+
+		Text nodes are collected into their nearest highlighted ancestor on the way down, the line of a
+		highlighted element is filled in once its subtree is done. Lines are yielded as soon as no
+		highlighted element is pending anymore.
+		"""
+		tree = self.tree
+		flags = tree.flags
+		names = tree.names
+		strings = tree.strings
+		highlight_indices = tree.highlight_indices
+		first_children = tree.first_children
+		next_siblings = tree.next_siblings
+		include = frozenset(include_attributes)
+
+		lines: List[tuple[int, str]] = []
+		# Highlighted elements whose subtree is still being walked: (row, line slot, text parts)
+		open_elements: List[tuple[int, int, List[str]]] = []
+		# Texts below a highlighted ancestor of the start node belong to that ancestor
+		has_highlighted_ancestor = self._has_highlighted_ancestor()
+
+		# Depth first walk, a negative entry closes the element ~entry
+		stack = [self.row]
+		while stack:
+			row = stack.pop()
+
+			if row < 0:
+				row, slot, text_parts = open_elements.pop()
+				lines[slot] = (row, self._format_clickable_element(row, '\n'.join(text_parts).strip(), include))
+				if not open_elements:
+					yield from lines
+					lines.clear()
+				continue
+
+			if flags[row] & NODE_TEXT:
+				text = strings[names[row]]
+				if open_elements:
+					open_elements[-1][2].append(text)
+				elif not has_highlighted_ancestor and flags[row] & NODE_VISIBLE:
+					yield row, text
+				continue
+
+			if highlight_indices[row] >= 0:
+				open_elements.append((row, len(lines), []))
+				lines.append((row, ''))
+				stack.append(~row)
+
+			children = []
+			child = first_children[row]
+			while child >= 0:
+				children.append(child)
+				child = next_siblings[child]
+			children.reverse()
+			stack.extend(children)
+
+		yield from lines
+
+	def _has_highlighted_ancestor(self) -> bool:
+		current = self.parent
+		while current is not None:
+			if current.highlight_index is not None:
+				return True
+			current = current.parent
+		return False
 
-		process_node(self, 0)
-		return '\n'.join(formatted_text)
+	def _format_clickable_element(self, row: int, text: str, include_attributes: frozenset[str]) -> str:
+		tree = self.tree
+		tag_name = tree.strings[tree.names[row]]
+		attributes_str = ''
+		if include_attributes:
+			node = tree.node(row)
+			# Deduplicated in attribute order, so the output is deterministic
+			attributes = list(
+				dict.fromkeys(
+					str(value)
+					for key, value in node.attributes.items()
+					if key in include_attributes and value != tag_name  # type: ignore
+				)
+			)
+			if text in attributes:
+				attributes.remove(text)
+			attributes_str = ';'.join(attributes)
+		line = f'[{tree.highlight_indices[row]}]<{tag_name} '
+		if attributes_str:
+			line += f'{attributes_str}'
+		if text:
+			if attributes_str:
+				line += f'>{text}'
+			else:
+				line += f'{text}'
+		line += '/>'
+		return line
 
 	def get_file_upload_element(self, check_siblings: bool = True) -> Optional['DOMElementNode']:
 		# Check if current element is a file input
@@ -179,7 +850,7 @@ class DOMElementNode(DOMBaseNode):
 		# Check siblings only for the initial call
 		if check_siblings and self.parent:
 			for sibling in self.parent.children:
-				if sibling is not self and isinstance(sibling, DOMElementNode):
+				if sibling != self and isinstance(sibling, DOMElementNode):
 					result = sibling.get_file_upload_element(check_siblings=False)
 					if result:
 						return result
@@ -194,3 +865,14 @@ SelectorMap = dict[int, DOMElementNode]
 class DOMState:
 	element_tree: DOMElementNode
 	selector_map: SelectorMap
+
+	_hash_index: Optional['DOMElementHashIndex'] = field(default=None, init=False, repr=False, compare=False)
+
+	@property
+	def hash_index(self) -> 'DOMElementHashIndex':
+		"""Highlighted elements by hash, built on first use and shared by all actions of a step"""
+		if self._hash_index is None:
+			from browser_use.dom.history_tree_processor.service import DOMElementHashIndex
+
+			self._hash_index = DOMElementHashIndex(self.selector_map.values())
+		return self._hash_index
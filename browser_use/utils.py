@@ -1,7 +1,10 @@
 import logging
+import re
 import time
-from functools import wraps
-from typing import Any, Callable, Coroutine, ParamSpec, TypeVar
+from functools import lru_cache, wraps
+from typing import Any, Callable, Coroutine, Dict, ParamSpec, TypeVar
+
+from pydantic import BaseModel
 
 logger = logging.getLogger(__name__)
 
@@ -52,3 +55,93 @@ def singleton(cls):
 		return instance[0]
 
 	return wrapper
+
+
+_SECRET_PLACEHOLDER_PATTERN = re.compile(r'<secret>(.*?)</secret>')
+
+
+def _trie_pattern(values: list[str]) -> str:
+	"""
+	Regex matching any of the values, as a prefix trie: at every position re follows one branch instead of trying
+	every value, and optional suffixes are greedy, so the longest value wins.
+	"""
+	trie: dict = {}
+	for value in values:
+		node = trie
+		for char in value:
+			node = node.setdefault(char, {})
+		node[''] = {}
+
+	def to_pattern(node: dict) -> str:
+		is_end = '' in node
+		branches = []
+		for char, child in node.items():
+			if char == '':
+				continue
+			# Single child chains become one literal, which keeps the recursion shallow
+			run = [char]
+			while len(child) == 1 and '' not in child:
+				char, child = next(iter(child.items()))
+				run.append(char)
+			branches.append(re.escape(''.join(run)) + to_pattern(child))
+		if not branches:
+			return ''
+		if is_end:
+			return f'(?:{"|".join(branches)})?'
+		return branches[0] if len(branches) == 1 else f'(?:{"|".join(branches)})'
+
+	return to_pattern(trie)
+
+
+class SensitiveDataRedactor:
+	"""
+	Replaces sensitive values by <secret>placeholder</secret> and placeholders by their values, each in a single pass
+	with patterns compiled once per set of secrets (see for_secrets).
+	"""
+
+	def __init__(self, sensitive_data: Dict[str, str]):
+		self.secrets = dict(sensitive_data)
+		# Value -> placeholder, the first placeholder of a value wins
+		self._placeholders: Dict[str, str] = {}
+		for key, value in sensitive_data.items():
+			if value:
+				self._placeholders.setdefault(value, key)
+		self._value_pattern = re.compile(_trie_pattern(list(self._placeholders))) if self._placeholders else None
+
+	@staticmethod
+	def for_secrets(sensitive_data: Dict[str, str]) -> 'SensitiveDataRedactor':
+		"""Returns the redactor of these secrets, built once and reused while they do not change"""
+		return _redactor(tuple(sensitive_data.items()))
+
+	def redact(self, text: str) -> str:
+		"""Replaces every sensitive value in text by its placeholder, longest values first"""
+		if self._value_pattern is None:
+			return text
+		placeholders = self._placeholders
+		return self._value_pattern.sub(lambda match: f'<secret>{placeholders[match.group(0)]}</secret>', text)
+
+	def unredact(self, text: str) -> str:
+		"""Replaces every known <secret>placeholder</secret> in text by its value"""
+		if '<secret>' not in text:
+			return text
+		secrets = self.secrets
+		return _SECRET_PLACEHOLDER_PATTERN.sub(lambda match: secrets.get(match.group(1), match.group(0)), text)
+
+	def unredact_params(self, value: Any) -> Any:
+		"""Replaces placeholders in all strings of action params, models are updated in place"""
+		if isinstance(value, str):
+			return self.unredact(value)
+		if isinstance(value, BaseModel):
+			for key, field_value in value.__dict__.items():
+				value.__dict__[key] = self.unredact_params(field_value)
+			return value
+		if isinstance(value, dict):
+			return {k: self.unredact_params(v) for k, v in value.items()}
+		if isinstance(value, list):
+			return [self.unredact_params(v) for v in value]
+		return value
+
+
+@lru_cache(maxsize=8)
+def _redactor(sensitive_data: tuple[tuple[str, str], ...]) -> SensitiveDataRedactor:
+	return SensitiveDataRedactor(dict(sensitive_data))
@@ -57,3 +57,94 @@ async def browser_context(browser):
 	context = BrowserContext(browser=browser)
 	yield context
 	await context.close()
+
+
+# Tags that get a highlight index in the DOM fixture pages
+_FIXTURE_INTERACTIVE_TAGS = {'a', 'button', 'input', 'select', 'textarea', 'summary'}
+_FIXTURE_VOID_TAGS = {'meta', 'link', 'input', 'br', 'img', 'hr', 'source', 'wbr'}
+_FIXTURE_SKIPPED_TAGS = {'head', 'script', 'style', 'option'}
+
+
+def load_dom_fixture(name: str):
+	"""
+	Parses tests/fixtures/dom/<name>.html into the DOMElementNode tree buildDomTree.js would return:
+	xpaths, visibility (hidden attribute, display: none) and highlight indices in document order.
+	"""
+	from html.parser import HTMLParser
+
+	from browser_use.dom.views import (
+		NODE_IN_VIEWPORT,
+		NODE_INTERACTIVE,
+		NODE_TEXT,
+		NODE_TOP_ELEMENT,
+		NODE_VISIBLE,
+		NODE_XPATH_ABSOLUTE,
+		DOMTree,
+	)
+
+	tree = DOMTree()
+	# Open elements: (row, xpath, visible, child tag counts)
+	stack = []
+	skipped = []
+	highlight_index = 0
+
+	class Parser(HTMLParser):
+		def handle_starttag(self, tag, attrs):
+			nonlocal highlight_index
+			if skipped or tag in _FIXTURE_SKIPPED_TAGS:
+				if tag not in _FIXTURE_VOID_TAGS:
+					skipped.append(tag)
+				return
+			if tag == 'html':
+				return
+			attributes = {key: value or '' for key, value in attrs}
+			if tag == 'body':
+				parent, parent_xpath, xpath, visible = -1, None, '/body', True
+			else:
+				parent, parent_xpath, parent_visible, counts = stack[-1]
+				counts[tag] = counts.get(tag, 0) + 1
+				segment = tag if counts[tag] == 1 else f'{tag}[{counts[tag]}]'
+				xpath = f'{parent_xpath}/{segment}' if parent_xpath != '/body' else f'html/body/{segment}'
+				visible = (
+					parent_visible
+					and 'hidden' not in attributes
+					and 'hidden' not in attributes.get('class', '').split()
+					and 'display: none' not in attributes.get('style', '')
+				)
+			interactive = visible and (
+				tag in _FIXTURE_INTERACTIVE_TAGS or 'onclick' in attributes or attributes.get('role') == 'button'
+			)
+			flags = (NODE_VISIBLE | NODE_TOP_ELEMENT) if visible else 0
+			if interactive:
+				flags |= NODE_INTERACTIVE | NODE_IN_VIEWPORT
+			if parent_xpath is not None and xpath.startswith(parent_xpath + '/'):
+				xpath_index = tree.intern(xpath[len(parent_xpath) + 1 :])
+			else:
+				flags |= NODE_XPATH_ABSOLUTE
+				xpath_index = tree.intern(xpath)
+			pairs = [index for key, value in attributes.items() for index in (tree.intern(key), tree.intern(value))]
+			row = tree.append(parent, flags, tree.intern(tag), xpath_index, highlight_index if interactive else -1, pairs)
+			if interactive:
+				highlight_index += 1
+			if tag not in _FIXTURE_VOID_TAGS:
+				stack.append((row, xpath, visible, {}))
+
+		def handle_endtag(self, tag):
+			if skipped:
+				if skipped[-1] == tag:
+					skipped.pop()
+				return
+			if stack and tree.strings[tree.names[stack[-1][0]]] == tag:
+				stack.pop()
+
+		def handle_data(self, data):
+			text = data.strip()
+			if skipped or not stack or not text:
+				return
+			row, _, visible, _ = stack[-1]
+			tree.append(row, NODE_TEXT | (NODE_VISIBLE if visible else 0), tree.intern(text), -1, -1)
+
+	path = os.path.join(os.path.dirname(__file__), 'fixtures', 'dom', f'{name}.html')
+	with open(path) as f:
+		Parser(convert_charrefs=True).feed(f.read())
+	return tree.node(0)
@@ -2,10 +2,10 @@ import asyncio
 import base64
 import os
 import pytest
-from browser_use.browser.context import BrowserContext, BrowserContextConfig
+from browser_use.browser.context import BrowserContext, BrowserContextConfig, RequestBlocker
 from browser_use.browser.views import BrowserState
 from browser_use.dom.views import DOMElementNode
-from unittest.mock import Mock
+from unittest.mock import AsyncMock, Mock
 
 def test_is_url_allowed():
     """
@@ -147,43 +147,6 @@ async def test_enhanced_css_selector_for_element():
     expected_selector = 'html > body > div:nth-of-type(2).foo.bar[id="my-id"][placeholder*="some \\"quoted\\" text"][data-testid="123"]'
     assert actual_selector == expected_selector, f"Expected {expected_selector}, but got {actual_selector}"
 @pytest.mark.asyncio
-async def test_get_scroll_info():
-    """
-    Test the get_scroll_info method by mocking the page's evaluate method.
-    This dummy page returns preset values for window.scrollY, window.innerHeight,
-    and document.documentElement.scrollHeight. The test then verifies that the 
-    computed scroll information (pixels_above and pixels_below) match the expected values.
-    """
-    # Define a dummy page with an async evaluate method returning preset values.
-    class DummyPage:
-        async def evaluate(self, script):
-            if "window.scrollY" in script:
-                return 100  # scrollY
-            elif "window.innerHeight" in script:
-                return 500  # innerHeight
-            elif "document.documentElement.scrollHeight" in script:
-                return 1200  # total scrollable height
-            return None
-    # Create a dummy session with a dummy current_page.
-    dummy_session = type("DummySession", (), {})()
-    dummy_session.current_page = DummyPage()
-    # We also need a dummy context attribute but it won't be used in this test.
-    dummy_session.context = type("DummyContext", (), {})()
-    # Create a dummy browser mock.
-    dummy_browser = Mock()
-    dummy_browser.config = Mock()
-    # Initialize BrowserContext with the dummy browser and config.
-    context = BrowserContext(browser=dummy_browser, config=BrowserContextConfig())
-    # Manually set the session to our dummy session.
-    context.session = dummy_session
-    # Call get_scroll_info on the dummy page.
-    pixels_above, pixels_below = await context.get_scroll_info(dummy_session.current_page)
-    # Expected calculations:
-    # pixels_above = scrollY = 100
-    # pixels_below = total_height - (scrollY + innerHeight) = 1200 - (100 + 500) = 600
-    assert pixels_above == 100, f"Expected 100 pixels above, got {pixels_above}"
-    assert pixels_below == 600, f"Expected 600 pixels below, got {pixels_below}"
-@pytest.mark.asyncio
 async def test_reset_context():
     """
     Test the reset_context method to ensure it correctly closes all existing tabs,
@@ -323,4 +286,291 @@ async def test_remove_highlights_failure():
     try:
         await context.remove_highlights()
     except Exception as e:
-        pytest.fail(f"remove_highlights raised an exception: {e}")
\ No newline at end of file
+        pytest.fail(f"remove_highlights raised an exception: {e}")
+
+class _NetworkEventPage:
+    """Page that records event listeners so a test can emit Playwright network events."""
+
+    def __init__(self):
+        self.listeners = {}
+
+    def on(self, event, handler):
+        self.listeners.setdefault(event, []).append(handler)
+
+    def remove_listener(self, event, handler):
+        self.listeners[event].remove(handler)
+
+    def emit(self, event, payload):
+        for handler in list(self.listeners.get(event, [])):
+            handler(payload)
+
+
+def _network_request(url, resource_type="document"):
+    return Mock(url=url, resource_type=resource_type, headers={})
+
+
+@pytest.mark.asyncio
+async def test_wait_for_stable_network_is_event_driven():
+    """
+    The wait ends one idle window after the last relevant request completes, through a response,
+    a finished request without a response or a failed request. Ignored requests do not keep it waiting,
+    and all listeners are removed afterwards.
+    """
+    config = BrowserContextConfig(wait_for_network_idle_page_load_time=0.1, maximum_wait_page_load_time=2)
+    context = BrowserContext(browser=Mock(), config=config)
+    page = _NetworkEventPage()
+    context.get_current_page = AsyncMock(return_value=page)
+    loop = asyncio.get_running_loop()
+
+    start = loop.time()
+    waiter = asyncio.create_task(context._wait_for_stable_network())
+    await asyncio.sleep(0)
+    document = _network_request("https://example.com/")
+    script = _network_request("https://example.com/app.js", "script")
+    failing = _network_request("https://example.com/logo.png", "image")
+    page.emit("request", document)
+    page.emit("request", script)
+    page.emit("request", failing)
+    page.emit("request", _network_request("https://www.google-analytics.com/collect"))
+    page.emit("request", _network_request("https://example.com/live", "eventsource"))
+
+    await asyncio.sleep(0.15)
+    assert not waiter.done()
+    page.emit("response", Mock(request=document, headers={"content-type": "text/html"}))
+    page.emit("requestfinished", script)
+    await asyncio.sleep(0.15)
+    assert not waiter.done()
+    page.emit("requestfailed", failing)
+    last_activity = loop.time()
+
+    await asyncio.wait_for(waiter, timeout=1)
+    assert 0.1 <= loop.time() - last_activity < 0.5
+    assert loop.time() - start < 1
+    assert all(not handlers for handlers in page.listeners.values())
+
+
+@pytest.mark.asyncio
+async def test_wait_for_stable_network_times_out():
+    """
+    A request that never completes ends the wait after maximum_wait_page_load_time.
+    """
+    config = BrowserContextConfig(wait_for_network_idle_page_load_time=0.05, maximum_wait_page_load_time=0.3)
+    context = BrowserContext(browser=Mock(), config=config)
+    page = _NetworkEventPage()
+    context.get_current_page = AsyncMock(return_value=page)
+
+    waiter = asyncio.create_task(context._wait_for_stable_network())
+    await asyncio.sleep(0)
+    page.emit("request", _network_request("https://example.com/slow.css", "stylesheet"))
+
+    await asyncio.wait_for(waiter, timeout=1)
+    assert all(not handlers for handlers in page.listeners.values())
+
+
+def _routed_request(url, resource_type="script", top_level=False):
+    frame = Mock(parent_frame=None if top_level else Mock())
+    return Mock(url=url, resource_type=resource_type, frame=frame)
+
+
+@pytest.mark.asyncio
+async def test_request_blocker():
+    """
+    Requests are blocked by resource type, URL substring and domain including subdomains, top level documents
+    never are, and blocked requests are counted by resource type.
+    """
+    blocker = RequestBlocker(["media"], ["/ads/"], ["tracker.com"])
+
+    assert blocker.should_block(_routed_request("https://example.com/intro.mp4", "media"))
+    assert blocker.should_block(_routed_request("https://example.com/ADS/banner.js"))
+    assert blocker.should_block(_routed_request("https://tracker.com/t.js"))
+    assert blocker.should_block(_routed_request("https://eu.cdn.tracker.com/t.js", "xhr"))
+    assert blocker.should_block(_routed_request("https://tracker.com/frame", "document"))
+    assert not blocker.should_block(_routed_request("https://tracker.com/", "document", top_level=True))
+    assert not blocker.should_block(_routed_request("https://nottracker.com/t.js"))
+    assert not blocker.should_block(_routed_request("https://example.com/app.js"))
+
+    allowed_route = AsyncMock(request=_routed_request("https://example.com/app.js"))
+    await blocker.handle_route(allowed_route)
+    allowed_route.fallback.assert_awaited_once()
+    allowed_route.abort.assert_not_awaited()
+
+    blocked_route = AsyncMock(request=_routed_request("https://tracker.com/collect", "fetch"))
+    await blocker.handle_route(blocked_route)
+    blocked_route.abort.assert_awaited_once_with("blockedbyclient")
+    assert blocker.blocked_requests == 1
+    assert blocker.blocked_by_resource_type == {"fetch": 1}
+
+
+@pytest.mark.asyncio
+async def test_blocked_requests_are_not_pending():
+    """
+    With block_resources, requests the blocker aborts never keep _wait_for_stable_network waiting.
+    """
+    config = BrowserContextConfig(
+        block_resources=True, wait_for_network_idle_page_load_time=0.05, maximum_wait_page_load_time=1
+    )
+    context = BrowserContext(browser=Mock(), config=config)
+    assert context.request_blocker is not None
+    assert BrowserContext(browser=Mock(), config=BrowserContextConfig()).request_blocker is None
+    page = _NetworkEventPage()
+    context.get_current_page = AsyncMock(return_value=page)
+    loop = asyncio.get_running_loop()
+
+    start = loop.time()
+    waiter = asyncio.create_task(context._wait_for_stable_network())
+    await asyncio.sleep(0)
+    page.emit("request", _routed_request("https://www.googletagmanager.com/gtm.js"))
+    page.emit("request", _routed_request("https://example.com/font.woff2", "font"))
+
+    await asyncio.wait_for(waiter, timeout=1)
+    assert loop.time() - start < 0.5
+
+
+class _Phases:
+    """
+    Records when fake page calls start and end. Phases in `concurrent` wait at a barrier until all of them
+    have started, which only returns if they run concurrently.
+    """
+
+    def __init__(self, concurrent):
+        self.concurrent = set(concurrent)
+        self.events = []
+        self._all_started = asyncio.Event()
+
+    async def run(self, name):
+        self.events.append(f"{name} start")
+        if name in self.concurrent:
+            if self.concurrent <= {event[: -len(" start")] for event in self.events if event.endswith(" start")}:
+                self._all_started.set()
+            await asyncio.wait_for(self._all_started.wait(), timeout=1)
+        self.events.append(f"{name} end")
+
+
+class _StatePage:
+    """Page whose title and evaluate calls are recorded as phases."""
+
+    url = "https://example.com/"
+
+    def __init__(self, phases, title="Example"):
+        self._phases = phases
+        self._title = title
+
+    async def evaluate(self, script):
+        if script != "1":
+            await self._phases.run("page_info")
+        return {"title": self._title, "scrollY": 100, "innerHeight": 500, "scrollHeight": 1200}
+
+    async def title(self):
+        await self._phases.run(f"title {self._title}")
+        return self._title
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("highlight_elements", [True, False])
+async def test_update_state_collects_phases_concurrently(highlight_elements):
+    """
+    The DOM walk, title and scroll position and the tab titles are collected concurrently, the screenshot
+    joins them when highlights are disabled and parallel_screenshot is set. Phase timings are recorded.
+    """
+    concurrent = ["dom", "page_info", "title Example", "title Second", "title Third"]
+    if not highlight_elements:
+        concurrent.append("screenshot")
+    phases = _Phases(concurrent)
+    config = BrowserContextConfig(highlight_elements=highlight_elements, parallel_screenshot=True)
+    context = BrowserContext(browser=Mock(), config=config)
+    page = _StatePage(phases)
+    pages = [page, _StatePage(phases, "Second"), _StatePage(phases, "Third")]
+    context.get_session = AsyncMock(return_value=Mock(context=Mock(pages=pages)))
+    context.get_current_page = AsyncMock(return_value=page)
+    context.remove_highlights = AsyncMock()
+
+    async def get_clickable_elements(**kwargs):
+        await phases.run("dom")
+        return Mock(element_tree=Mock(), selector_map={})
+
+    async def take_screenshot():
+        await phases.run("screenshot")
+        return "c2NyZWVu"
+
+    context._get_dom_service = Mock(return_value=Mock(get_clickable_elements=get_clickable_elements))
+    context.take_screenshot = take_screenshot
+
+    state = await context._update_state()
+
+    assert state.title == "Example"
+    assert (state.pixels_above, state.pixels_below) == (100, 600)
+    assert [tab.title for tab in state.tabs] == ["Example", "Second", "Third"]
+    assert state.screenshot == "c2NyZWVu"
+    assert set(context.state_timings) == {"remove_highlights", "dom", "page_info", "tabs", "screenshot"}
+    if highlight_elements:
+        # The screenshot shows the highlights drawn by the DOM walk, so it is taken after it
+        assert phases.events.index("screenshot start") > phases.events.index("dom end")
+
+
+@pytest.mark.asyncio
+async def test_get_scroll_info():
+    """get_scroll_info returns the pixels above and below the viewport."""
+    context = BrowserContext(browser=Mock(), config=BrowserContextConfig())
+    page = _StatePage(_Phases([]))
+
+    assert await context.get_scroll_info(page) == (100, 600)
+
+
+class _ScreenshotPage:
+    """Page with a 1280x800 viewport scrolled down by 400 pixels of a 1280x4000 document."""
+
+    def __init__(self):
+        self.cdp_session = AsyncMock()
+        self.cdp_session.send.return_value = {"data": "anBlZw=="}
+        self.context = Mock(new_cdp_session=AsyncMock(return_value=self.cdp_session))
+        self.screenshot = AsyncMock(return_value=b"png")
+
+    async def bring_to_front(self):
+        pass
+
+    async def wait_for_load_state(self):
+        pass
+
+    def is_closed(self):
+        return False
+
+    async def evaluate(self, script):
+        return {"scrollX": 0, "scrollY": 400, "width": 1280, "height": 800, "scrollWidth": 1280, "scrollHeight": 4000}
+
+
+@pytest.mark.asyncio
+async def test_take_screenshot_pipeline():
+    """
+    With a format, quality or size limit, screenshots are taken with CDP Page.captureScreenshot, scaled and
+    clipped by the browser, and the base64 data is returned as is. The CDP session of a page is reused.
+    """
+    config = BrowserContextConfig(screenshot_format="jpeg", screenshot_quality=70, screenshot_max_dimension=640)
+    context = BrowserContext(browser=Mock(), config=config)
+    page = _ScreenshotPage()
+    context.get_current_page = AsyncMock(return_value=page)
+
+    assert await context.take_screenshot() == "anBlZw=="
+    assert await context.take_screenshot(full_page=True) == "anBlZw=="
+    assert await context.take_screenshot(clip={"x": 10, "y": 20, "width": 100, "height": 50}) == "anBlZw=="
+
+    viewport, full_page, clipped = [call.args for call in page.cdp_session.send.call_args_list]
+    assert viewport == (
+        "Page.captureScreenshot",
+        {
+            "format": "jpeg",
+            "clip": {"x": 0, "y": 400, "width": 1280, "height": 800, "scale": 0.5},
+            "captureBeyondViewport": False,
+            "optimizeForSpeed": True,
+            "quality": 70,
+        },
+    )
+    assert full_page[1]["clip"] == {"x": 0, "y": 0, "width": 1280, "height": 4000, "scale": 0.16}
+    assert full_page[1]["captureBeyondViewport"] is True
+    assert clipped[1]["clip"] == {"x": 10, "y": 420, "width": 100, "height": 50, "scale": 1}
+    page.context.new_cdp_session.assert_awaited_once()
+    page.screenshot.assert_not_awaited()
+
+    default_context = BrowserContext(browser=Mock(), config=BrowserContextConfig())
+    default_context.get_current_page = AsyncMock(return_value=page)
+    assert await default_context.take_screenshot() == base64.b64encode(b"png").decode()
+    page.screenshot.assert_awaited_once_with(full_page=False, animations="disabled")
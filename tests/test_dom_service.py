@@ -0,0 +1,750 @@
+import asyncio
+import gc
+import json
+import os
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Optional
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+
+from browser_use.dom.service import BUILD_DOM_TREE_INIT_SCRIPT, BUILD_DOM_TREE_JS, DomService
+from browser_use.dom.views import DOMElementNode, DOMTextNode, DOMTree
+
+# Flags of the buildDomTree.js wire format
+TEXT, VISIBLE, INTERACTIVE, TOP_ELEMENT, IN_VIEWPORT, SHADOW_ROOT, XPATH_ABSOLUTE, REUSED = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+def _element(xpath, children, highlight_index=None, attributes=None):
+    return {
+        "tagName": xpath.split("/")[-1].split("[")[0] or "body",
+        "xpath": xpath,
+        "attributes": attributes or {},
+        "children": children,
+        "isVisible": True,
+        "isInteractive": highlight_index is not None,
+        "isTopElement": True,
+        "isInViewport": highlight_index is not None,
+        "highlightIndex": highlight_index,
+    }
+
+
+def _encode(node_map, root_id, snapshot_id=None, incremental=False):
+    """
+    Python port of encodeDomTree in buildDomTree.js: turns the old id -> node map
+    into the columnar payload returned by page.evaluate.
+    """
+    strings, string_indices = [], {}
+
+    def intern(value):
+        if value not in string_indices:
+            string_indices[value] = len(strings)
+            strings.append(value)
+        return string_indices[value]
+
+    columns = {key: [] for key in ("ids", "parents", "flags", "names", "xpaths", "highlights", "attributeCounts")}
+    attributes, row_xpaths = [], []
+    stack = [(root_id, -1)]
+    while stack:
+        node_id, parent = stack.pop()
+        row = len(columns["flags"])
+        node = node_map.get(node_id)
+        columns["ids"].append(int(node_id))
+        columns["parents"].append(parent)
+        if node is None:
+            row_values = (REUSED, -1, -1, -1, 0)
+            row_xpaths.append(None)
+        elif node.get("type") == "TEXT_NODE":
+            row_values = (TEXT | (VISIBLE if node["isVisible"] else 0), intern(node["text"]), -1, -1, 0)
+            row_xpaths.append(None)
+        else:
+            flags = (
+                (VISIBLE if node.get("isVisible") else 0)
+                | (INTERACTIVE if node.get("isInteractive") else 0)
+                | (TOP_ELEMENT if node.get("isTopElement") else 0)
+                | (IN_VIEWPORT if node.get("isInViewport") else 0)
+                | (SHADOW_ROOT if node.get("shadowRoot") else 0)
+            )
+            parent_xpath = row_xpaths[parent] if parent >= 0 else None
+            if parent_xpath is not None and node["xpath"].startswith(parent_xpath + "/"):
+                xpath = intern(node["xpath"][len(parent_xpath) + 1 :])
+            else:
+                flags |= XPATH_ABSOLUTE
+                xpath = intern(node["xpath"])
+            row_xpaths.append(node["xpath"])
+            for key, value in node["attributes"].items():
+                attributes += [intern(key), intern(value)]
+            highlight_index = node.get("highlightIndex")
+            row_values = (
+                flags,
+                intern(node["tagName"]),
+                xpath,
+                -1 if highlight_index is None else highlight_index,
+                len(node["attributes"]),
+            )
+            stack.extend((child, row) for child in reversed(node["children"]))
+        for key, value in zip(("flags", "names", "xpaths", "highlights", "attributeCounts"), row_values):
+            columns[key].append(value)
+
+    payload = {"strings": strings, "attributes": attributes, **columns}
+    if snapshot_id is None:
+        del payload["ids"]
+    else:
+        payload["snapshotId"] = snapshot_id
+        payload["incremental"] = incremental
+    return json.dumps(payload, separators=(",", ":"))
+
+
+@dataclass
+class _LegacyTextNode:
+    """DOMTextNode as a plain dataclass, the baseline of the benchmarks."""
+
+    is_visible: bool
+    parent: Optional["_LegacyElementNode"]
+    text: str
+    type: str = "TEXT_NODE"
+
+
+@dataclass
+class _LegacyElementNode:
+    """DOMElementNode as a plain dataclass, the baseline of the benchmarks."""
+
+    is_visible: bool
+    parent: Optional["_LegacyElementNode"]
+    tag_name: str
+    xpath: str
+    attributes: dict
+    children: list
+    is_interactive: bool = False
+    is_top_element: bool = False
+    is_in_viewport: bool = False
+    shadow_root: bool = False
+    highlight_index: Optional[int] = None
+    viewport_coordinates: Optional[dict] = None
+    page_coordinates: Optional[dict] = None
+    viewport_info: Optional[dict] = None
+
+
+def _decode_legacy(node_map, root_id):
+    """The previous node map decoding into dataclasses, the baseline of the benchmarks."""
+    nodes = {}
+    for node_id, data in node_map.items():
+        if data.get("type") == "TEXT_NODE":
+            nodes[node_id] = _LegacyTextNode(text=data["text"], is_visible=data["isVisible"], parent=None)
+            continue
+        node = _LegacyElementNode(
+            tag_name=data["tagName"],
+            xpath=data["xpath"],
+            attributes=data.get("attributes", {}),
+            children=[],
+            is_visible=data.get("isVisible", False),
+            is_interactive=data.get("isInteractive", False),
+            is_top_element=data.get("isTopElement", False),
+            is_in_viewport=data.get("isInViewport", False),
+            highlight_index=data.get("highlightIndex"),
+            shadow_root=data.get("shadowRoot", False),
+            parent=None,
+        )
+        for child_id in data["children"]:
+            if child_id in nodes:
+                nodes[child_id].parent = node
+                node.children.append(nodes[child_id])
+        nodes[node_id] = node
+    return nodes[root_id]
+
+
+def _synthetic_page(rows=1000):
+    """A node map shaped like buildDomTree.js output: table rows with links, buttons and text."""
+    node_map, next_id = {}, 0
+    highlight_index = 0
+
+    def add(node):
+        nonlocal next_id
+        node_map[str(next_id)] = node
+        next_id += 1
+        return str(next_id - 1)
+
+    row_ids = []
+    for row in range(rows):
+        base = f"html/body/div/main/div[2]/table/tbody/tr[{row + 1}]"
+        cells = []
+        for column in range(4):
+            cell = f"{base}/td[{column + 1}]"
+            text = add({"type": "TEXT_NODE", "text": f"Cell {row}-{column}", "isVisible": True})
+            if column == 3:
+                link_text = add({"type": "TEXT_NODE", "text": "Details", "isVisible": True})
+                link = add(
+                    _element(
+                        f"{cell}/a",
+                        [link_text],
+                        highlight_index,
+                        {"href": f"/items/{row}", "class": "btn btn-link", "role": "link"},
+                    )
+                )
+                highlight_index += 1
+                cells.append(add(_element(cell, [text, link])))
+            else:
+                cells.append(add(_element(cell, [text])))
+        row_ids.append(add(_element(base, cells)))
+    table = add(_element("html/body/div/main/div[2]/table", [add(_element("html/body/div/main/div[2]/table/tbody", row_ids))]))
+    root = add(_element("/body", [add(_element("html/body/div", [add(_element("html/body/div/main", [table]))]))]))
+    return node_map, root
+
+
+def _tree_signature(node):
+    if isinstance(node, (DOMTextNode, _LegacyTextNode)):
+        return ("text", node.text, node.is_visible)
+    return (
+        node.tag_name,
+        node.xpath,
+        node.attributes,
+        node.is_visible,
+        node.is_interactive,
+        node.is_top_element,
+        node.is_in_viewport,
+        node.highlight_index,
+        node.shadow_root,
+        [_tree_signature(child) for child in node.children],
+    )
+
+
+@pytest.mark.asyncio
+async def test_columnar_payload_decodes_to_the_same_tree():
+    """
+    Decoding the columnar payload yields the same tree as the node map it was encoded from,
+    with parent links and the selector map in place.
+    """
+    node_map, root_id = _synthetic_page(rows=20)
+    page = Mock()
+    page.evaluate = AsyncMock(side_effect=[_encode(node_map, root_id)])
+
+    state = await DomService(page).get_clickable_elements()
+
+    assert _tree_signature(state.element_tree) == _tree_signature(_decode_legacy(node_map, root_id))
+    assert sorted(state.selector_map) == list(range(20))
+    link = state.selector_map[3]
+    assert link.xpath == "html/body/div/main/div[2]/table/tbody/tr[4]/td[4]/a"
+    assert link.attributes == {"href": "/items/3", "class": "btn btn-link", "role": "link"}
+    assert link.parent.parent.parent.parent == state.element_tree.children[0].children[0].children[0]
+
+
+@pytest.mark.asyncio
+async def test_incremental_snapshot_reuses_unchanged_subtrees():
+    """
+    A full snapshot followed by an incremental one that only re-evaluates the body:
+    the rows of the untouched button are copied from the previous tree below the new body,
+    in their new position, and the button stays in the selector map.
+    """
+    full = _encode(
+        {
+            "0": _element("button", [], highlight_index=0),
+            "1": _element("a", [], highlight_index=1),
+            "2": _element("", ["0", "1"]),
+        },
+        "2",
+        snapshot_id="s1",
+    )
+    incremental = _encode(
+        {
+            "3": _element("a", [], highlight_index=1),
+            "4": _element("", ["0", "3"]),
+        },
+        "4",
+        snapshot_id="s1",
+        incremental=True,
+    )
+    page = Mock()
+    page.evaluate = AsyncMock(side_effect=[full, incremental])
+    service = DomService(page)
+
+    first = await service.get_clickable_elements(incremental=True)
+    second = await service.get_clickable_elements(incremental=True)
+
+    # The second evaluation is told which snapshot it may patch
+    assert page.evaluate.call_args_list[1].args[1]["snapshotId"] == "s1"
+    assert _tree_signature(second.selector_map[0]) == _tree_signature(first.selector_map[0])
+    assert second.selector_map[0].parent == second.element_tree
+    assert second.selector_map[0].tree is second.element_tree.tree
+    assert [child.xpath for child in second.element_tree.children] == ["button", "a"]
+
+    # Reused rows keep their js ids, so they can be reused again
+    third = _encode({"5": _element("", ["0", "3"])}, "5", snapshot_id="s1", incremental=True)
+    page.evaluate = AsyncMock(side_effect=[third])
+    state = await service.get_clickable_elements(incremental=True)
+    assert sorted(state.selector_map) == [0, 1]
+
+
+@pytest.mark.asyncio
+async def test_incremental_snapshot_with_unknown_node_falls_back_to_full_snapshot():
+    """
+    If an incremental snapshot references a node Python does not know, a full snapshot is taken.
+    """
+    broken = _encode({"1": _element("", ["0"])}, "1", snapshot_id="s2", incremental=True)
+    full = _encode({"0": _element("button", [], highlight_index=0), "1": _element("", ["0"])}, "1", snapshot_id="s2")
+    page = Mock()
+    page.evaluate = AsyncMock(side_effect=[broken, full])
+    service = DomService(page)
+    service._snapshot_tree = DOMTree()
+
+    state = await service.get_clickable_elements(incremental=True)
+
+    assert page.evaluate.call_args_list[1].args[1]["snapshotId"] is None
+    assert list(state.selector_map) == [0]
+    assert service._snapshot_id == "s2"
+
+
+@pytest.mark.asyncio
+async def test_snapshot_sends_only_its_arguments():
+    """
+    A snapshot is one evaluate call of the installed function, documents without it get it installed first.
+    """
+    node_map, root_id = _synthetic_page(rows=2)
+    payload = _encode(node_map, root_id)
+    page = Mock()
+    page.evaluate = AsyncMock(side_effect=[payload, None, None, payload])
+    service = DomService(page)
+
+    await service.get_clickable_elements()
+    assert page.evaluate.call_count == 1
+    assert len(page.evaluate.call_args.args[0]) < 200
+
+    # A document loaded before the init script was registered
+    await service.get_clickable_elements()
+    assert page.evaluate.call_count == 4
+    assert page.evaluate.call_args_list[2].args == (BUILD_DOM_TREE_INIT_SCRIPT,)
+    assert page.evaluate.call_args_list[3].args == page.evaluate.call_args_list[0].args
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_installed_build_dom_tree_matches_resent_source():
+    """
+    On the shop fixture page in Chromium, one call of the function installed as init script returns the same
+    tree as sending the whole buildDomTree.js source, with only the arguments sent per snapshot. A document
+    loaded without the init script gets the function installed on its first snapshot.
+    """
+    from playwright.async_api import async_playwright
+
+    url = "file://" + os.path.join(os.path.dirname(__file__), "fixtures", "dom", "shop.html")
+    args = {"doHighlightElements": False, "focusHighlightIndex": -1, "viewportExpansion": 0, "debugMode": False}
+
+    async with async_playwright() as playwright:
+        browser = await playwright.chromium.launch(headless=True)
+        context = await browser.new_context()
+        await context.add_init_script(BUILD_DOM_TREE_INIT_SCRIPT)
+        page = await context.new_page()
+        await page.goto(url)
+
+        resent = json.loads(await page.evaluate(BUILD_DOM_TREE_JS, args))
+        installed = await DomService(page)._evaluate_build_dom_tree(args)
+
+        page_without_init_script = await browser.new_page()
+        await page_without_init_script.goto(url)
+        assert await page_without_init_script.evaluate("typeof window.__browserUseBuildDomTree") == "undefined"
+        installed_on_first_snapshot = await DomService(page_without_init_script)._evaluate_build_dom_tree(args)
+        assert await page_without_init_script.evaluate("typeof window.__browserUseBuildDomTree") == "function"
+        await browser.close()
+
+    # Snapshot ids differ between the calls, the trees do not
+    for payload in (installed, resent, installed_on_first_snapshot):
+        payload.pop("snapshotId", None)
+    assert installed == resent == installed_on_first_snapshot
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+@pytest.mark.parametrize("fixture", ["shop", "article"])
+async def test_installed_build_dom_tree_benchmark(fixture):
+    """
+    Benchmark on the fixture pages in Chromium: a liveness check plus the whole buildDomTree.js source per
+    snapshot (previous behaviour) against one call of the function installed as init script. Only prints
+    the timings, they depend on the machine.
+    """
+    from playwright.async_api import async_playwright
+
+    url = "file://" + os.path.join(os.path.dirname(__file__), "fixtures", "dom", f"{fixture}.html")
+    args = {"doHighlightElements": False, "focusHighlightIndex": -1, "viewportExpansion": 0, "debugMode": False}
+    steps = 50
+
+    async with async_playwright() as playwright:
+        browser = await playwright.chromium.launch(headless=True)
+        context = await browser.new_context()
+        await context.add_init_script(BUILD_DOM_TREE_INIT_SCRIPT)
+        page = await context.new_page()
+        await page.goto(url)
+        service = DomService(page)
+
+        resent_times = []
+        installed_times = []
+        for _ in range(steps):
+            start = time.perf_counter()
+            assert await page.evaluate("1+1") == 2
+            json.loads(await page.evaluate(BUILD_DOM_TREE_JS, args))
+            resent_times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            await service._evaluate_build_dom_tree(args)
+            installed_times.append(time.perf_counter() - start)
+        await browser.close()
+
+    resent_times.sort()
+    installed_times.sort()
+    print(
+        f"\n{fixture}: median per snapshot, source re-sent {resent_times[steps // 2] * 1000:.2f} ms "
+        f"({len(BUILD_DOM_TREE_JS) / 1024:.0f} KiB, 2 round trips), installed function "
+        f"{installed_times[steps // 2] * 1000:.2f} ms ({len(json.dumps(args))} bytes, 1 round trip)"
+    )
+
+
+@pytest.mark.asyncio
+async def test_highlight_rects_set_element_coordinates():
+    """
+    With highlight_rects, the page only reports the boxes and they end up as coordinates of the highlighted elements.
+    """
+    node_map, root_id = _synthetic_page(rows=2)
+    payload = json.loads(_encode(node_map, root_id))
+    payload["highlightRects"] = [1, 10.4, 20, 30, 16.6, 7, 0, 0, 5, 5]
+    payload["viewport"] = [0, 100, 1280, 800]
+    page = Mock()
+    page.evaluate = AsyncMock(return_value=json.dumps(payload))
+
+    state = await DomService(page).get_clickable_elements(highlight_elements=False, highlight_rects=True)
+
+    assert page.evaluate.call_args.args[1]["highlightRects"] is True
+    assert page.evaluate.call_args.args[1]["doHighlightElements"] is False
+    coordinates = state.selector_map[1].viewport_coordinates
+    assert (coordinates.top_left.x, coordinates.top_left.y, coordinates.width, coordinates.height) == (10, 20, 30, 17)
+    assert state.selector_map[1].page_coordinates.top_left.y == 120
+    assert state.selector_map[1].viewport_info.width == 1280
+    assert state.selector_map[0].viewport_coordinates is None
+
+
+# buildDomTree.js as before the xpaths were built top-down: getXPathTree walks up to the boundary for every element
+_BOTTOM_UP_BUILD_DOM_TREE_JS = BUILD_DOM_TREE_JS.replace(
+    "xpath: xpath ?? getXPathTree(node, true),", "xpath: getXPathTree(node, true),"
+)
+
+
+def _deep_page(depth, width):
+    """Nested sections with rows of same-tag siblings at every level, ending in links"""
+    html = "".join(f"<a href='/{i}'>link {i}</a>" for i in range(width))
+    for level in range(depth):
+        html = "".join(f"<div>{html if i == width - 1 else f'<span>{level}.{i}</span>'}</div>" for i in range(width))
+    return f"<html><body>{html}</body></html>"
+
+
+# Shadow roots in the page and in a same-origin iframe, with same-tag siblings on both sides of the boundaries
+_BOUNDARIES_PAGE = """<html><body>
+<div><p>before</p><p>host below</p><div id="host"></div><p>after</p></div>
+<iframe srcdoc="<html><body><div><a href='/1'>one</a><a href='/2'>two</a></div><div id='host'></div>
+  <script>document.getElementById('host').attachShadow({mode: 'open'}).innerHTML =
+  '<button>in iframe shadow</button><button>second</button>'</script></body></html>"></iframe>
+<div><button>page</button><button>page 2</button></div>
+<script>
+  const root = document.getElementById("host").attachShadow({mode: "open"});
+  root.innerHTML = "<div><a href='/a'>a</a><a href='/b'>b</a></div><div><span>x</span><div id='inner'></div></div>";
+  root.getElementById("inner").attachShadow({mode: "open"}).innerHTML = "<input><input><p><a href='/c'>c</a></p>";
+</script>
+</body></html>"""
+
+
+def _xpath_pages():
+    fixtures = os.path.join(os.path.dirname(__file__), "fixtures", "dom")
+    for fixture in ("shop", "article"):
+        with open(os.path.join(fixtures, f"{fixture}.html")) as f:
+            yield fixture, f.read()
+    yield "iframe and shadow roots", _BOUNDARIES_PAGE
+    for depth, width in ((20, 10), (60, 10), (120, 5)):
+        yield f"depth {depth} x {width}", _deep_page(depth, width)
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_top_down_xpaths_match_get_xpath_tree():
+    """
+    In Chromium, the xpaths that buildDomTree.js builds top-down during the walk are the ones getXPathTree
+    computes bottom-up for every element: on the fixture pages, on deep pages, and across iframe and shadow
+    root boundaries.
+    """
+    from playwright.async_api import async_playwright
+
+    args = {"doHighlightElements": False, "focusHighlightIndex": -1, "viewportExpansion": -1, "debugMode": False}
+    assert _BOTTOM_UP_BUILD_DOM_TREE_JS != BUILD_DOM_TREE_JS
+    async with async_playwright() as playwright:
+        browser = await playwright.chromium.launch(headless=True)
+        page = await browser.new_page()
+        for name, html in _xpath_pages():
+            await page.set_content(html)
+            trees = []
+            for script in (BUILD_DOM_TREE_JS, _BOTTOM_UP_BUILD_DOM_TREE_JS):
+                payload = json.loads(await page.evaluate(script, args))
+                trees.append((await DomService(Mock())._construct_dom_tree(payload))[0])
+            top_down, bottom_up = trees
+
+            assert _tree_signature(top_down) == _tree_signature(bottom_up), name
+            if name == "iframe and shadow roots":
+                xpaths = {node.xpath for node in _element_nodes(top_down)}
+                # Iframe documents start at html, children of a shadow root have an empty xpath, except in iframe
+                # documents, where getXPathTree does not recognize the shadow root of another window
+                assert {"html/body/div/a[2]", "", "a[2]", "span", "button[2]"} <= xpaths
+        await browser.close()
+
+
+def _element_nodes(node):
+    stack = list(node.children)
+    while stack:
+        node = stack.pop()
+        if isinstance(node, DOMElementNode):
+            yield node
+            stack.extend(node.children)
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_top_down_xpath_benchmark():
+    """
+    Benchmark in Chromium: PERF_METRICS walk time of buildDomTree.js, which builds xpaths top-down, against the
+    same walk calling getXPathTree for every element as before. Only prints the timings, they depend on the machine.
+    """
+    from playwright.async_api import async_playwright
+
+    args = {"doHighlightElements": False, "focusHighlightIndex": -1, "viewportExpansion": -1, "debugMode": True}
+    runs = 5
+    async with async_playwright() as playwright:
+        browser = await playwright.chromium.launch(headless=True)
+        page = await browser.new_page()
+        print()
+        for name, html in _xpath_pages():
+            await page.set_content(html)
+            walks = {}
+            for label, script in (("bottom-up", _BOTTOM_UP_BUILD_DOM_TREE_JS), ("top-down", BUILD_DOM_TREE_JS)):
+                results = [json.loads(await page.evaluate(script, args))["perfMetrics"] for _ in range(runs)]
+                walks[label] = sorted(result["timings"]["buildDomTree"] for result in results)[runs // 2]
+            print(
+                f"{name}: {results[0]['nodeMetrics']['processedNodes']} nodes, median walk "
+                f"bottom-up {walks['bottom-up'] * 1000:.2f} ms, top-down {walks['top-down'] * 1000:.2f} ms"
+            )
+        await browser.close()
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_hit_testing_only_checks_interactive_elements():
+    """
+    On a page with 3000 containers and 1000 buttons in Chromium, the operation counts of PERF_METRICS show that
+    only visible interactive elements are hit-tested, in the phase after the walk. Also prints the walk and
+    hit-test timings, which depend on the machine.
+    """
+    from playwright.async_api import async_playwright
+
+    rows = "".join(f"<div><div><span>row {i}</span></div><button>action {i}</button></div>" for i in range(1000))
+    args = {"doHighlightElements": True, "focusHighlightIndex": -1, "viewportExpansion": -1, "debugMode": True}
+    async with async_playwright() as playwright:
+        browser = await playwright.chromium.launch(headless=True)
+        page = await browser.new_page()
+        await page.set_content(f"<html><body>{rows}</body></html>")
+        metrics = json.loads(await page.evaluate(BUILD_DOM_TREE_JS, args))["perfMetrics"]
+        await browser.close()
+
+    operations = metrics["buildDomTreeBreakdown"]["domOperationCounts"]
+    print(
+        f"\nwalk {metrics['timings']['buildDomTree'] * 1000:.1f} ms, "
+        f"hit-tests {metrics['timings']['resolveTopElements'] * 1000:.1f} ms; "
+        f"{metrics['nodeMetrics']['processedNodes']} nodes, {operations['elementFromPoint']} elementFromPoint, "
+        f"{operations['checkVisibility']} checkVisibility, {operations['getComputedStyle']} getComputedStyle"
+    )
+    # Elements outside the viewport count as top without a hit-test
+    assert operations["elementFromPoint"] <= metrics["nodeMetrics"]["topElementChecks"] < 1100
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_columnar_payload_benchmark():
+    """
+    Benchmark on a ~20k node page: payload bytes and transfer + parse time of the
+    columnar format against the previous node map.
+    """
+    node_map, root_id = _synthetic_page(rows=2000)
+    legacy_payload = json.dumps({"rootId": root_id, "map": node_map}, separators=(",", ":"))
+    columnar_payload = _encode(node_map, root_id)
+
+    legacy_time = columnar_time = float("inf")
+    service = DomService(Mock())
+    for _ in range(3):
+        # Garbage of the previous round is collected outside the timed regions of both sides
+        gc.collect()
+        start = time.perf_counter()
+        legacy_page = json.loads(legacy_payload)
+        _decode_legacy(legacy_page["map"], legacy_page["rootId"])
+        legacy_time = min(legacy_time, time.perf_counter() - start)
+
+        gc.collect()
+        start = time.perf_counter()
+        await service._construct_dom_tree(json.loads(columnar_payload))
+        columnar_time = min(columnar_time, time.perf_counter() - start)
+
+    print(
+        f"\n{len(node_map)} nodes: node map {len(legacy_payload) / 1024:.0f} KiB in {legacy_time * 1000:.0f} ms, "
+        f"columnar {len(columnar_payload) / 1024:.0f} KiB in {columnar_time * 1000:.0f} ms"
+    )
+    assert len(node_map) > 20000
+    assert len(columnar_payload) * 3 < len(legacy_payload)
+
+
+@pytest.mark.slow
+def test_dom_tree_memory_benchmark():
+    """
+    Benchmark on a ~20k node page: memory held by a DOMTree against the previous dataclasses.
+    """
+    node_map, root_id = _synthetic_page(rows=2000)
+    payload = _encode(node_map, root_id)
+
+    gc.collect()
+    tracemalloc.start()
+    legacy_tree = _decode_legacy(json.loads(json.dumps(node_map)), root_id)
+    gc.collect()
+    legacy_size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del legacy_tree
+
+    gc.collect()
+    tracemalloc.start()
+    service = DomService(Mock())
+    element_tree, selector_map = asyncio.run(service._construct_dom_tree(json.loads(payload)))
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    print(f"\n{len(node_map)} nodes: dataclasses {legacy_size / 1024:.0f} KiB, DOMTree {size / 1024:.0f} KiB")
+    assert len(element_tree.tree) == len(node_map)
+    assert size * 3 < legacy_size
+
+
+def test_standalone_nodes():
+    """
+    Nodes can still be constructed directly, children are moved into the tree of the new node.
+    """
+    button = DOMElementNode(
+        tag_name="button",
+        xpath="html/body/button",
+        attributes={"type": "submit"},
+        children=[DOMTextNode(text="Send", is_visible=True, parent=None)],
+        is_visible=True,
+        parent=None,
+        highlight_index=4,
+    )
+    root = DOMElementNode(tag_name="body", xpath="/body", attributes={}, children=[button], is_visible=True, parent=None)
+    label = DOMTextNode(text="Subscribe", is_visible=True, parent=root)
+
+    assert root.children == [button, label]
+    assert button.tree is root.tree
+    assert button.xpath == "html/body/button"
+    assert button.attributes == {"type": "submit"}
+    assert button.parent == root
+    assert button.get_all_text_till_next_clickable_element() == "Send"
+    assert root.clickable_elements_to_string() == "[4]<button Send/>\nSubscribe"
+
+
+def test_nodes_are_mutable_through_the_old_api():
+    """
+    Trees linked bottom-up with parent and children.append, as the dataclass nodes were, keep every view valid,
+    and changes of parent, children, attributes and the other fields are written through to the tree.
+    """
+
+    def element(tag_name, xpath, highlight_index=None):
+        return DOMElementNode(
+            tag_name=tag_name,
+            xpath=xpath,
+            attributes={},
+            children=[],
+            is_visible=True,
+            parent=None,
+            highlight_index=highlight_index,
+        )
+
+    link = element("a", "html/body/nav/a", highlight_index=0)
+    text = DOMTextNode(text="Home", is_visible=True, parent=None)
+    nav = element("nav", "html/body/nav")
+    button = element("button", "html/body/button", highlight_index=1)
+    root = element("body", "html/body")
+    for parent, child in ((link, text), (nav, link), (root, nav), (root, button)):
+        child.parent = parent
+        parent.children.append(child)
+    selector_map = {0: link, 1: button}
+
+    assert root.clickable_elements_to_string() == "[0]<a Home/>\n[1]<button />"
+    assert [child.tag_name for child in root.children] == ["nav", "button"]
+    assert selector_map[0].parent.parent == root and selector_map[0].tree is root.tree
+    assert text.has_parent_with_highlight_index()
+
+    hash_before = link.hash
+    link.attributes["href"] = "/home"
+    link.attributes.update({"title": "Start"})
+    del link.attributes["title"]
+    assert link.attributes == {"href": "/home"}
+    assert link.hash != hash_before
+    link.attributes = {"href": "/start"}
+    link.highlight_index = 2
+    link.is_in_viewport = True
+    text.text = "Start"
+    assert root.clickable_elements_to_string(["href"]) == "[2]<a /start>Start/>\n[1]<button />"
+    assert link.is_in_viewport
+
+    # Moving within the tree keeps the xpath, removed nodes lose their parent
+    button.parent = nav
+    assert [child.tag_name for child in nav.children] == ["a", "button"] and root.children == [nav]
+    assert button.xpath == "html/body/button"
+    nav.children.remove(link)
+    assert link.parent is None and nav.children == [button]
+    root.children.insert(0, link)
+    assert root.children == [link, nav]
+    nav.parent = None
+    assert root.children == [link]
+    with pytest.raises(ValueError):
+        root.parent = link
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_event_loop_stall_benchmark():
+    """
+    Benchmark with 30 agents sharing one event loop: how long the loop is blocked while every
+    agent builds its DOM state, with the former forced gc.collect() after each build and without.
+    Only prints the stalls, wall-clock times are not asserted.
+    """
+    payload = _encode(*_synthetic_page(rows=200))
+
+    async def run(collect):
+        stalls = []
+        done = asyncio.Event()
+
+        async def monitor():
+            while not done.is_set():
+                start = time.perf_counter()
+                await asyncio.sleep(0.001)
+                stalls.append(time.perf_counter() - start - 0.001)
+
+        async def agent(index):
+            service = DomService(Mock())
+            for _ in range(2):
+                # Waiting for the LLM and the browser, staggered between agents
+                await asyncio.sleep(0.002 * index)
+                await service._construct_dom_tree(json.loads(payload))
+                if collect:
+                    gc.collect()
+
+        monitor_task = asyncio.create_task(monitor())
+        await asyncio.gather(*(agent(index) for index in range(30)))
+        done.set()
+        await monitor_task
+        return max(stalls), sum(stall for stall in stalls if stall > 0)
+
+    collect_max, collect_total = await run(collect=True)
+    max_stall, total = await run(collect=False)
+
+    print(
+        f"\nevent loop stalls with gc.collect(): max {collect_max * 1000:.0f} ms, total {collect_total * 1000:.0f} ms; "
+        f"without: max {max_stall * 1000:.0f} ms, total {total * 1000:.0f} ms"
+    )
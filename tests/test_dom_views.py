@@ -0,0 +1,275 @@
+import os
+import time
+from dataclasses import replace
+
+import pytest
+
+from browser_use.agent.views import AgentSettings
+from browser_use.dom.history_tree_processor.service import HistoryTreeProcessor
+from browser_use.dom.history_tree_processor.view import DOMHistoryElement
+from browser_use.dom.views import NODE_TEXT, NODE_VISIBLE, NODE_XPATH_ABSOLUTE, DOMElementNode, DOMState, DOMTextNode, DOMTree
+from conftest import load_dom_fixture
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "dom")
+INCLUDE_ATTRIBUTES = AgentSettings().include_attributes
+
+
+def _reference_clickable_elements_to_string(root, include_attributes):
+    """
+    The previous implementation: text of every highlighted element is collected with a second
+    walk, and every text node checks all its ancestors for a highlight index.
+    """
+    formatted_text = []
+
+    def process_node(node):
+        if isinstance(node, DOMElementNode):
+            if node.highlight_index is not None:
+                attributes_str = ""
+                text = node.get_all_text_till_next_clickable_element()
+                if include_attributes:
+                    attributes = list(
+                        dict.fromkeys(
+                            str(value)
+                            for key, value in node.attributes.items()
+                            if key in include_attributes and value != node.tag_name
+                        )
+                    )
+                    if text in attributes:
+                        attributes.remove(text)
+                    attributes_str = ";".join(attributes)
+                line = f"[{node.highlight_index}]<{node.tag_name} "
+                if attributes_str:
+                    line += f"{attributes_str}"
+                if text:
+                    line += f">{text}" if attributes_str else f"{text}"
+                line += "/>"
+                formatted_text.append(line)
+            for child in node.children:
+                process_node(child)
+        elif isinstance(node, DOMTextNode):
+            if not node.has_parent_with_highlight_index() and node.is_visible:
+                formatted_text.append(node.text)
+
+    process_node(root)
+    return "\n".join(formatted_text)
+
+
+def _deep_page(depth=60, breadth=200):
+    """Wide page of deeply nested cards, each with a highlighted button around more nested text."""
+    tree = DOMTree()
+    body = tree.append(-1, NODE_VISIBLE | NODE_XPATH_ABSOLUTE, tree.intern("body"), tree.intern("/body"), -1)
+    div, button = tree.intern("div"), tree.intern("button")
+    highlight_index = 0
+    for card in range(breadth):
+        parent = body
+        for level in range(depth):
+            parent = tree.append(parent, NODE_VISIBLE, div, tree.intern("div"), -1)
+            if level == depth // 2:
+                parent = tree.append(parent, NODE_VISIBLE, button, tree.intern("button"), highlight_index)
+                highlight_index += 1
+            if level % 10 == 0:
+                tree.append(parent, NODE_TEXT | NODE_VISIBLE, tree.intern(f"card {card} level {level}"), -1, -1)
+    return tree.node(body)
+
+
+@pytest.mark.parametrize("page", ["shop", "article"])
+def test_clickable_elements_golden_output(page):
+    """
+    The serialized fixture pages match their golden files and the previous two-pass implementation.
+    """
+    root = load_dom_fixture(page)
+    with open(os.path.join(FIXTURES, f"{page}.txt")) as f:
+        golden = f.read().rstrip("\n")
+
+    output = root.clickable_elements_to_string(include_attributes=INCLUDE_ATTRIBUTES)
+
+    assert output == golden
+    assert output == _reference_clickable_elements_to_string(root, INCLUDE_ATTRIBUTES)
+    assert root.clickable_elements_to_string() == _reference_clickable_elements_to_string(root, [])
+
+
+def test_clickable_elements_of_subtree():
+    """
+    Serializing a subtree below a highlighted element does not emit the texts owned by that element.
+    """
+    root = load_dom_fixture("shop")
+    # <div role="button">Add to cart <a href="/p/1">details</a></div>
+    add_to_cart = next(root.tree.node(row) for row in root.tree.highlighted_rows() if root.tree.highlight_indices[row] == 7)
+    link = add_to_cart.children[-1]
+
+    assert link.clickable_elements_to_string() == "[8]<a details/>"
+    assert add_to_cart.clickable_elements_to_string() == "[7]<div Add to cart/>\n[8]<a details/>"
+
+
+def test_clickable_elements_are_streamed():
+    """
+    Lines are yielded as soon as they are complete, before the rest of the tree is walked.
+    """
+    root = load_dom_fixture("article")
+    lines = root.iter_clickable_elements(INCLUDE_ATTRIBUTES)
+
+    assert next(lines) == "[0]<a Introduction/>"
+    assert next(lines) == "[1]<a Method/>"
+    assert "\n".join(["[0]<a Introduction/>", "[1]<a Method/>", *lines]) == root.clickable_elements_to_string(INCLUDE_ATTRIBUTES)
+
+
+@pytest.mark.slow
+def test_clickable_elements_benchmark():
+    """
+    Micro-benchmark on a deep page (200 cards, 60 levels): single pass against the previous implementation.
+    Only prints the timings, wall-clock times are not asserted.
+    """
+    root = _deep_page()
+
+    start = time.perf_counter()
+    reference = _reference_clickable_elements_to_string(root, INCLUDE_ATTRIBUTES)
+    reference_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    output = root.clickable_elements_to_string(include_attributes=INCLUDE_ATTRIBUTES)
+    single_pass_time = time.perf_counter() - start
+
+    print(f"\n{len(root.tree)} nodes: previous {reference_time * 1000:.0f} ms, single pass {single_pass_time * 1000:.0f} ms")
+    assert output == reference
+
+
+@pytest.mark.parametrize("page", ["shop", "article"])
+def test_tree_hashes_match_element_hashes(page):
+    """
+    The one-pass tree hashes equal the hashes of single elements, and history elements are found by hash.
+    """
+    root = load_dom_fixture(page)
+    selector_map = {root.tree.highlight_indices[row]: root.tree.node(row) for row in root.tree.highlighted_rows()}
+
+    hash_index = HistoryTreeProcessor.hash_dom_tree(root.tree)
+
+    assert len(hash_index) == len(selector_map)
+    for element in selector_map.values():
+        assert element.hash == HistoryTreeProcessor._hash_dom_element(element)
+        history_element = HistoryTreeProcessor.convert_dom_element_to_history_element(element)
+        assert HistoryTreeProcessor.find_history_element_in_tree(history_element, root) == element
+        assert HistoryTreeProcessor.find_history_element_in_tree(history_element, root.children[0]) in (element, None)
+
+
+@pytest.mark.slow
+def test_tree_hashes_benchmark():
+    """
+    Micro-benchmark on a deep page: hashing the selector map and replaying 20 history elements,
+    element by element with a tree search per lookup against the tree pass with its hash index.
+    Only prints the timings, wall-clock times are not asserted.
+    """
+    root = _deep_page(depth=60, breadth=400)
+    elements = [root.tree.node(row) for row in root.tree.highlighted_rows()]
+    history_elements = [HistoryTreeProcessor.convert_dom_element_to_history_element(element) for element in elements[::20]]
+
+    def search(history_element):
+        hashed = HistoryTreeProcessor._hash_dom_history_element(history_element)
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            if node.highlight_index is not None and HistoryTreeProcessor._hash_dom_element(node) == hashed:
+                return node
+            stack.extend(reversed([child for child in node.children if isinstance(child, DOMElementNode)]))
+
+    start = time.perf_counter()
+    one_by_one = [HistoryTreeProcessor._hash_dom_element(element) for element in elements]
+    searched = [search(history_element) for history_element in history_elements]
+    one_by_one_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    tree_pass = [element.hash for element in elements]
+    found = [HistoryTreeProcessor.find_history_element_in_tree(history_element, root) for history_element in history_elements]
+    tree_pass_time = time.perf_counter() - start
+
+    print(
+        f"\n{len(elements)} elements in {len(root.tree)} nodes: one by one {one_by_one_time * 1000:.0f} ms, "
+        f"tree pass {tree_pass_time * 1000:.0f} ms"
+    )
+    assert tree_pass == one_by_one
+    assert found == searched
+
+
+def _state(root):
+    selector_map = {root.tree.highlight_indices[row]: root.tree.node(row) for row in root.tree.highlighted_rows()}
+    return DOMState(element_tree=root, selector_map=selector_map)
+
+
+def test_state_hash_index_matches_history_elements():
+    """
+    History elements are found in the hash index of the state, exactly or by a unique partial hash.
+    """
+    state = _state(load_dom_fixture("shop"))
+    search_button = state.selector_map[5]
+    history_element = HistoryTreeProcessor.convert_dom_element_to_history_element(search_button)
+
+    assert HistoryTreeProcessor.find_history_element_in_state(history_element, state) == search_button
+    # Moved among its siblings: same attributes and branch path, different xpath
+    moved = replace(history_element, xpath="html/body/header/form/button[2]")
+    assert HistoryTreeProcessor.find_history_element_in_state(moved, state) == search_button
+    # Moved to another container: the attributes alone are not enough
+    elsewhere = replace(moved, xpath="html/body/main/form/button", entire_parent_branch_path=["main", "form", "button"])
+    assert HistoryTreeProcessor.find_history_element_in_state(elsewhere, state) is None
+    # Same position, changed attributes
+    relabeled = replace(history_element, attributes={**history_element.attributes, "aria-label": "Find"})
+    assert HistoryTreeProcessor.find_history_element_in_state(relabeled, state) == search_button
+    # Nothing in common
+    gone = replace(moved, attributes={"type": "reset"})
+    assert HistoryTreeProcessor.find_history_element_in_state(gone, state) is None
+
+
+def test_state_hash_index_ignores_empty_attributes():
+    """
+    Elements without attributes all share the empty attributes hash, it never matches another element on its own.
+    """
+    root = DOMElementNode(tag_name="body", xpath="/body", attributes={}, children=[], is_visible=True, parent=None)
+    footer = DOMElementNode(tag_name="footer", xpath="html/body/footer", attributes={}, children=[], is_visible=True, parent=root)
+    DOMElementNode(
+        tag_name="span",
+        xpath="html/body/footer/span",
+        attributes={},
+        children=[],
+        is_visible=True,
+        parent=footer,
+        highlight_index=0,
+    )
+    history_element = DOMHistoryElement(
+        tag_name="button",
+        xpath="html/body/div/button",
+        highlight_index=3,
+        entire_parent_branch_path=["div", "button"],
+        attributes={},
+    )
+
+    assert HistoryTreeProcessor.find_history_element_in_state(history_element, _state(root)) is None
+
+
+def test_state_hash_index_ambiguous_and_built_once():
+    """
+    Partial hashes shared by several elements do not match, and the index is built once per state.
+    """
+    state = _state(_deep_page(depth=6, breadth=5))
+    first = state.selector_map[0]
+    history_element = HistoryTreeProcessor.convert_dom_element_to_history_element(first)
+
+    # Identical cards: the exact hash resolves to the first one in document order
+    assert HistoryTreeProcessor.find_history_element_in_state(history_element, state) == first
+    index = state.hash_index
+    # All cards share attributes and xpath, so a partial match is ambiguous
+    moved = replace(history_element, entire_parent_branch_path=["main", "button"])
+    assert HistoryTreeProcessor.find_history_element_in_state(moved, state) is None
+    assert state.hash_index is index
+    assert len(index.by_attributes) == 1 and len(index.by_attributes[first.hash.attributes_hash]) == 5
+
+
+def test_clickable_elements_by_key():
+    """
+    Lines are in page order and keyed by the branch path and xpath hash of their element, texts by their text.
+    """
+    root = load_dom_fixture("shop")
+    lines = HistoryTreeProcessor.clickable_elements_by_key(root, INCLUDE_ATTRIBUTES)
+
+    assert "\n".join(lines.values()) == root.clickable_elements_to_string(INCLUDE_ATTRIBUTES)
+    search_button = _state(root).selector_map[5]
+    key = ("element", search_button.hash.branch_path_hash, search_button.hash.xpath_hash, 0)
+    assert lines[key].startswith("[5]<button ")
+    assert all(kind in ("element", "text") for kind, *_ in lines)
@@ -0,0 +1,128 @@
+import asyncio
+import base64
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from browser_use.agent.gif import HistoryGifWriter, _gif_frame_data, _load_fonts, create_history_gif
+from browser_use.agent.views import ActionResult, AgentBrain, AgentHistory, AgentHistoryList, AgentOutput
+from browser_use.browser.views import BrowserStateHistory
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def _screenshot(color, size=(640, 400)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, "PNG")
+    return base64.b64encode(buffer.getvalue()).decode("utf-8")
+
+
+def _history(screenshots):
+    return AgentHistoryList(
+        history=[
+            AgentHistory(
+                model_output=AgentOutput(
+                    current_state=AgentBrain(evaluation_previous_goal="", memory="", next_goal=f"Goal {i % 2}"),
+                    action=[],
+                ),
+                result=[ActionResult()],
+                state=BrowserStateHistory(
+                    url="https://example.com", title="Example", tabs=[], interacted_element=[None], screenshot=screenshot
+                ),
+            )
+            for i, screenshot in enumerate(screenshots)
+        ]
+    )
+
+
+@pytest.mark.parametrize("workers", [0, 3])
+def test_history_gif_is_streamed(tmp_path, workers):
+    """
+    Frames are written one by one into a valid looping GIF: the task frame, then one frame per screenshot,
+    resized to the size of the first one. Rendering in worker threads gives the same file.
+    """
+    screenshots = [_screenshot((200, 30, 30)), None, _screenshot((30, 200, 30)), _screenshot((30, 30, 200), (800, 500))]
+    history = _history(screenshots)
+    output_path = tmp_path / "history.gif"
+
+    create_history_gif("Find the cheapest shoes", history, output_path=str(output_path), duration=500, workers=workers)
+
+    with Image.open(output_path) as gif:
+        assert (gif.n_frames, gif.size, gif.info["loop"], gif.info["duration"]) == (4, (640, 400), 0, 500)
+        gif.seek(3)
+        # Top right corner, away from the overlays
+        assert gif.convert("RGB").getpixel((630, 10)) == (30, 30, 200)
+    if workers:
+        in_thread_path = tmp_path / "in_thread.gif"
+        create_history_gif("Find the cheapest shoes", history, output_path=str(in_thread_path), duration=500, workers=0)
+        assert in_thread_path.read_bytes() == output_path.read_bytes()
+
+
+def test_history_video_falls_back_to_gif_without_ffmpeg(tmp_path, monkeypatch):
+    """
+    Without a local ffmpeg, video paths produce a GIF next to them.
+    """
+    monkeypatch.setattr("browser_use.agent.gif.shutil.which", lambda name: None)
+
+    create_history_gif("Task", _history([_screenshot((0, 0, 0))]), output_path=str(tmp_path / "history.mp4"), show_task=False)
+
+    assert [path.name for path in tmp_path.iterdir()] == ["history.gif"]
+
+
+@pytest.mark.asyncio
+async def test_history_gif_writer_renders_step_by_step(tmp_path):
+    """
+    The writer appends every step's frame in a background thread, closing it only finishes the file,
+    which is the same as the GIF created from the whole history at the end.
+    """
+    history = _history([_screenshot((200, 30, 30)), _screenshot((30, 200, 30)), None, _screenshot((30, 30, 200))])
+    writer = HistoryGifWriter("Find the cheapest shoes", output_path=str(tmp_path / "steps.gif"), duration=500, max_pending=1)
+
+    partial = history.model_copy(update={"history": history.history[:2]})
+    await writer.add_history(partial)
+    await writer.add_history(partial)
+    await writer.add_history(history)
+    assert await asyncio.wrap_future(writer.close()) == str(tmp_path / "steps.gif")
+
+    create_history_gif("Find the cheapest shoes", history, output_path=str(tmp_path / "whole.gif"), duration=500)
+    assert (tmp_path / "steps.gif").read_bytes() == (tmp_path / "whole.gif").read_bytes()
+
+
+@pytest.mark.asyncio
+async def test_history_gif_writer_without_screenshots(tmp_path):
+    """
+    Without any screenshot, no file is created and the future resolves to None.
+    """
+    writer = HistoryGifWriter("Task", output_path=str(tmp_path / "steps.gif"))
+
+    await writer.add_history(_history([None, None]))
+
+    assert await asyncio.wrap_future(writer.close()) is None
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_fonts_are_loaded_once_per_thread():
+    """
+    Every rendering thread gets its own fonts, loaded once.
+    """
+    fonts = _load_fonts(40, 56, 44)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        other_thread_fonts = executor.submit(_load_fonts, 40, 56, 44).result()
+
+    assert _load_fonts(40, 56, 44) is fonts
+    assert other_thread_fonts is not fonts
+
+
+def test_gif_frame_data_without_image_descriptor():
+    """
+    A GIF without an image descriptor after its extensions raises a ValueError.
+    """
+
+    class _Frame:
+        def save(self, output, format, duration):
+            # Header, logical screen descriptor without a color table, then the trailer
+            output.write(b"GIF89a" + bytes([1, 0, 1, 0, 0, 0, 0]) + b";")
+
+    with pytest.raises(ValueError, match="No image descriptor"):
+        _gif_frame_data(_Frame(), 500)
@@ -0,0 +1,89 @@
+import base64
+import io
+
+import pytest
+
+from browser_use.browser.highlights import HIGHLIGHT_COLORS, draw_highlights
+from browser_use.dom.history_tree_processor.view import Coordinates, CoordinateSet, ViewportInfo
+from browser_use.dom.views import DOMElementNode
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def _screenshot(width, height, image_format="PNG"):
+    output = io.BytesIO()
+    Image.new("RGB", (width, height), "white").save(output, format=image_format)
+    return base64.b64encode(output.getvalue()).decode("utf-8")
+
+
+def _element(highlight_index, left, top, width, height):
+    return DOMElementNode(
+        is_visible=True,
+        parent=None,
+        tag_name="button",
+        xpath="html/body/button",
+        attributes={},
+        children=[],
+        highlight_index=highlight_index,
+        viewport_coordinates=CoordinateSet(
+            top_left=Coordinates(x=left, y=top),
+            top_right=Coordinates(x=left + width, y=top),
+            bottom_left=Coordinates(x=left, y=top + height),
+            bottom_right=Coordinates(x=left + width, y=top + height),
+            center=Coordinates(x=left + width // 2, y=top + height // 2),
+            width=width,
+            height=height,
+        ),
+        viewport_info=ViewportInfo(scroll_x=0, scroll_y=0, width=400, height=300),
+    )
+
+
+def _color(index):
+    color = HIGHLIGHT_COLORS[index % len(HIGHLIGHT_COLORS)]
+    return tuple(int(color[i : i + 2], 16) for i in (1, 3, 5))
+
+
+def _load(screenshot_b64):
+    return Image.open(io.BytesIO(base64.b64decode(screenshot_b64))).convert("RGB")
+
+
+def test_draw_highlights_onto_screenshot():
+    """
+    Every element gets a box in the color of its index, the rest of the screenshot is unchanged.
+    """
+    selector_map = {0: _element(0, 20, 40, 200, 100), 2: _element(2, 250, 200, 100, 50)}
+
+    image = _load(draw_highlights(_screenshot(400, 300), selector_map))
+
+    assert image.getpixel((20, 90)) == _color(0)
+    assert image.getpixel((250, 225)) == _color(2)
+    # Box interiors are tinted, not covered
+    assert image.getpixel((60, 120)) != (255, 255, 255)
+    assert max(abs(a - b) for a, b in zip(image.getpixel((60, 120)), (255, 255, 255))) < 40
+    assert image.getpixel((5, 5)) == (255, 255, 255)
+
+
+def test_draw_highlights_on_clipped_and_scaled_screenshot():
+    """
+    Viewport coordinates are mapped into a clipped screenshot downscaled by the browser.
+    """
+    selector_map = {1: _element(1, 120, 140, 80, 40)}
+    clip = {"x": 100, "y": 100, "width": 200, "height": 100}
+
+    image = _load(draw_highlights(_screenshot(100, 50), selector_map, clip=clip))
+
+    # (120, 140) in the viewport is (20, 40) in the clip, halved by the scale
+    assert image.getpixel((10, 30)) == _color(1)
+    assert image.getpixel((2, 2)) == (255, 255, 255)
+
+    jpeg = draw_highlights(_screenshot(100, 50, "JPEG"), selector_map, clip=clip, image_format="jpeg", quality=80)
+    assert Image.open(io.BytesIO(base64.b64decode(jpeg))).format == "JPEG"
+
+
+def test_draw_highlights_without_coordinates_keeps_screenshot():
+    screenshot = _screenshot(40, 30)
+    element = DOMElementNode(
+        is_visible=True, parent=None, tag_name="a", xpath="html/body/a", attributes={}, children=[], highlight_index=0
+    )
+
+    assert draw_highlights(screenshot, {0: element}) == screenshot
@@ -0,0 +1,343 @@
+import base64
+import io
+
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+
+from browser_use.agent.message_manager.compaction import (
+    CollapseToolCalls,
+    DropOldActionResults,
+    SlidingWindow,
+    SummarizeHistory,
+)
+from browser_use.agent.message_manager.service import MessageManager, MessageManagerSettings
+from browser_use.agent.message_manager.tokenizer import EstimatedTokenizer, Tokenizer, count_image_tokens, image_size
+from browser_use.agent.message_manager.utils import screenshot_change, screenshot_fingerprint
+from browser_use.agent.views import ActionResult, AgentBrain, AgentOutput, AgentStepInfo, MessageManagerState
+from browser_use.browser.views import BrowserState
+from browser_use.dom.views import DOMElementNode, DOMTextNode
+
+Image = pytest.importorskip("PIL.Image")
+ImageDraw = pytest.importorskip("PIL.ImageDraw")
+
+
+def _screenshot(boxes=(), size=(1280, 800), format="PNG"):
+    image = Image.new("RGB", size, (255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    for box in boxes:
+        draw.rectangle(box, fill=(20, 20, 20))
+    buffer = io.BytesIO()
+    image.save(buffer, format)
+    return base64.b64encode(buffer.getvalue()).decode("utf-8")
+
+
+def _state(screenshot, element_tree=None, url="https://example.com"):
+    return BrowserState(
+        element_tree=element_tree
+        or DOMElementNode(tag_name="body", is_visible=True, parent=None, xpath="/body", attributes={}, children=[]),
+        selector_map={},
+        url=url,
+        title="Example",
+        tabs=[],
+        screenshot=screenshot,
+    )
+
+
+def _has_image(message):
+    return isinstance(message.content, list) and any("image_url" in item for item in message.content)
+
+
+def test_screenshot_change():
+    """
+    A blinking cursor is no change, a new dialog is.
+    """
+    page = screenshot_fingerprint(_screenshot([(100, 100, 600, 140)]))
+    cursor = screenshot_fingerprint(_screenshot([(100, 100, 600, 140), (700, 100, 701, 118)]))
+    dialog = screenshot_fingerprint(_screenshot([(100, 100, 600, 140), (400, 250, 880, 550)]))
+
+    assert screenshot_change(page, page) == 0
+    assert screenshot_change(page, cursor) < 0.005
+    assert screenshot_change(page, dialog) > 0.1
+
+
+def test_unchanged_screenshots_are_replaced_by_a_note():
+    """
+    The last screenshot sent stays in the history and is replaced only when the screen changes, state messages of an
+    unchanged screen refer to it with a note and its image tokens are counted as saved. Steps follow Agent.step, which
+    removes the state message after the model call, so the model always gets the image the note refers to.
+    """
+    settings = MessageManagerSettings(skip_unchanged_screenshots=True, cache_prompt_prefix=True)
+    manager = MessageManager(
+        task="Task", system_message=SystemMessage(content="System"), settings=settings, state=MessageManagerState()
+    )
+    screenshots = [
+        _screenshot([(100, 100, 600, 140)]),
+        _screenshot([(100, 100, 600, 140), (700, 100, 701, 118)]),
+        _screenshot([(100, 100, 600, 140), (400, 250, 880, 550)]),
+        _screenshot([(100, 100, 600, 140), (400, 250, 880, 550)]),
+    ]
+
+    notes, images = [], []
+    for step, screenshot in enumerate(screenshots):
+        manager.add_state_message(_state(screenshot), step_info=AgentStepInfo(step_number=step, max_steps=10))
+        messages = manager.get_messages()
+        notes.append(messages[-1].content.rsplit("\n", 1)[-1])
+        # The kept screenshot is the last cache breakpoint
+        images.append([(m.content[0]["text"], "cache_control" in m.content[-1]) for m in messages if _has_image(m)])
+        manager._remove_last_state_message()
+        manager.add_model_output(
+            AgentOutput(current_state=AgentBrain(evaluation_previous_goal="", memory="", next_goal=""), action=[])
+        )
+
+    assert notes == [
+        "Current screenshot: the screenshot of step 1 above.",
+        "Screenshot omitted: the screen is unchanged since the screenshot of step 1 above.",
+        "Current screenshot: the screenshot of step 3 above.",
+        "Screenshot omitted: the screen is unchanged since the screenshot of step 3 above.",
+    ]
+    first, third = ("Screenshot of step 1 (https://example.com):", True), ("Screenshot of step 3 (https://example.com):", True)
+    assert images == [[first], [first], [third], [third]]
+    assert manager.state.screenshot_tokens_saved == 2 * settings.image_tokens
+
+
+def test_screenshots_are_sent_by_default():
+    """
+    Without skip_unchanged_screenshots every state message carries its screenshot.
+    """
+    manager = MessageManager(task="Task", system_message=SystemMessage(content="System"), state=MessageManagerState())
+    screenshot = _screenshot()
+
+    for _ in range(2):
+        manager.add_state_message(_state(screenshot))
+        assert _has_image(manager.get_messages()[-1])
+        manager._remove_last_state_message()
+    assert manager.state.screenshot_tokens_saved == 0
+
+
+class _CountingTokenizer(Tokenizer):
+    def __init__(self):
+        self.calls = 0
+
+    def count(self, text):
+        self.calls += 1
+        return len(text.split())
+
+
+@pytest.mark.parametrize("format", ["PNG", "JPEG", "WEBP", "GIF"])
+def test_image_size(format):
+    screenshot = _screenshot(size=(1280, 800), format=format)
+    assert image_size(f"data:image/{format.lower()};base64,{screenshot}") == (1280, 800)
+    assert image_size("https://example.com/image.png") is None
+
+
+def test_count_image_tokens():
+    assert count_image_tokens(1280, 800, "openai") == 85 + 170 * 6
+    assert count_image_tokens(512, 512, "openai") == 85 + 170
+    assert count_image_tokens(1280, 800, "anthropic") == 1366
+    assert count_image_tokens(4000, 3000, "anthropic") == 1534
+    assert count_image_tokens(300, 200, "google") == 258
+    assert count_image_tokens(1280, 800, "google") == 258 * 4
+
+
+def test_token_counts_use_tokenizer_and_are_memoized():
+    """
+    Text is counted with the configured tokenizer once per content, images with the provider formula.
+    """
+    tokenizer = _CountingTokenizer()
+    settings = MessageManagerSettings(model_name="gpt-4o", tokenizer=tokenizer)
+    manager = MessageManager(
+        task="Task", system_message=SystemMessage(content="System"), settings=settings, state=MessageManagerState()
+    )
+
+    assert manager._count_tokens(HumanMessage(content="one two three")) == 3
+    calls = tokenizer.calls
+    assert manager._count_tokens(HumanMessage(content="one two three")) == 3
+    assert tokenizer.calls == calls
+
+    manager.add_state_message(_state(_screenshot()))
+    assert manager.state.history.messages[-1].metadata.tokens > 85 + 170 * 6
+
+
+def test_unknown_models_estimate_tokens():
+    manager = MessageManager(task="Task", system_message=SystemMessage(content="System"), state=MessageManagerState())
+
+    assert isinstance(manager.tokenizer, EstimatedTokenizer)
+    assert manager._count_tokens(HumanMessage(content="x" * 30)) == 10
+
+
+async def _run_steps(manager, steps):
+    tokens = []
+    for step in range(steps):
+        result = [ActionResult(extracted_content=f"Found item {step}", include_in_memory=True)]
+        manager.add_state_message(_state(None), result, use_vision=False)
+        await manager.compact_history()
+        tokens.append(manager.state.history.current_tokens)
+        manager._remove_last_state_message()
+        tool_call = {
+            "name": "AgentOutput",
+            "args": {
+                "current_state": {"evaluation_previous_goal": "Success", "memory": "m" * 300, "next_goal": f"Goal {step}"},
+                "action": [{"click_element": {"index": step}}],
+            },
+            "id": str(manager.state.tool_id),
+            "type": "tool_call",
+        }
+        manager._add_message_with_tokens(AIMessage(content="", tool_calls=[tool_call]), message_type="model_output")
+        manager.add_tool_message(content="")
+    return tokens
+
+
+def _assert_tool_messages_follow_their_calls(messages):
+    for previous, message in zip(messages, messages[1:]):
+        if isinstance(message, ToolMessage):
+            assert isinstance(previous, AIMessage)
+            assert message.tool_call_id in [tool_call["id"] for tool_call in previous.tool_calls]
+
+
+async def test_compaction_keeps_the_history_flat():
+    """
+    With compaction the history stops growing, initial messages and new tasks are kept, and every tool response
+    still follows its tool call.
+    """
+    settings = MessageManagerSettings(
+        compaction_policies=[
+            CollapseToolCalls(keep_last_steps=2),
+            DropOldActionResults(keep_last_steps=2),
+            SlidingWindow(max_steps=6),
+        ]
+    )
+    manager = MessageManager(
+        task="Task", system_message=SystemMessage(content="System"), settings=settings, state=MessageManagerState()
+    )
+    initial_messages = manager.get_messages()
+    manager.add_new_task("New task")
+
+    tokens = await _run_steps(manager, 20)
+
+    # Only the number of digits in the step numbers still changes
+    assert max(tokens[8:]) - min(tokens[8:]) <= 10
+    messages = manager.get_messages()
+    assert messages[: len(initial_messages)] == initial_messages
+    assert messages[len(initial_messages)].content.startswith("Your new ultimate task")
+    _assert_tool_messages_follow_their_calls(messages)
+
+    types = [m.metadata.message_type for m in manager.state.history.messages]
+    assert types.count("collapsed_model_output") == 4
+    assert types.count("model_output") == 3
+    assert types.count("action_result") == 2
+    collapsed = manager.state.history.messages[types.index("collapsed_model_output")].message
+    assert collapsed.content == "Evaluation: Success | Goal: Goal 13 | Actions: click_element(index=13)"
+
+
+async def test_compaction_without_policies_keeps_everything():
+    manager = MessageManager(task="Task", system_message=SystemMessage(content="System"), state=MessageManagerState())
+
+    tokens = await _run_steps(manager, 10)
+
+    assert tokens == sorted(tokens) and tokens[0] < tokens[-1]
+
+
+async def test_summarize_history():
+    """
+    Old steps are replaced by one summary once enough of them accumulated, earlier summaries are folded in.
+    """
+    llm = FakeListChatModel(responses=["first summary", "second summary"])
+    settings = MessageManagerSettings(compaction_policies=[SummarizeHistory(llm, keep_last_steps=2, min_steps=3)])
+    manager = MessageManager(
+        task="Task", system_message=SystemMessage(content="System"), settings=settings, state=MessageManagerState()
+    )
+
+    await _run_steps(manager, 10)
+
+    summaries = [m.message.content for m in manager.state.history.messages if m.metadata.message_type == "summary"]
+    assert summaries == ["Summary of the previous steps: second summary"]
+    types = [m.metadata.message_type for m in manager.state.history.messages]
+    assert types.count("model_output") == 4
+    _assert_tool_messages_follow_their_calls(manager.get_messages())
+
+
+def test_cache_breakpoints_on_stable_prefix():
+    """
+    The initial messages and the last history message before the state are marked as cache breakpoints in the
+    returned messages only, and the prefix is identical on every step.
+    """
+    settings = MessageManagerSettings(cache_prompt_prefix=True)
+    manager = MessageManager(
+        task="Task", system_message=SystemMessage(content="System"), settings=settings, state=MessageManagerState()
+    )
+    prefix = manager.get_messages()
+
+    manager.add_state_message(
+        _state(None), [ActionResult(extracted_content="Found it", include_in_memory=True)], use_vision=False
+    )
+    messages = manager.get_messages()
+
+    marked = [i for i, m in enumerate(messages) if isinstance(m.content, list) and "cache_control" in m.content[0]]
+    assert marked == [len(prefix) - 1, len(prefix)]
+    assert messages[len(prefix)].content[0]["text"] == "Action result: Found it"
+    assert messages[: len(prefix)] == prefix
+    assert all(isinstance(m.message.content, str) for m in manager.state.history.messages[:-1])
+
+    other = MessageManager(
+        task="Task", system_message=SystemMessage(content="System"), settings=settings, state=MessageManagerState()
+    )
+    assert other.get_messages() == prefix
+
+
+def _form(values, button=False):
+    body = DOMElementNode(True, None, "body", "/body", {}, [])
+    DOMTextNode(True, body, "Sign up")
+    for i, value in enumerate(values):
+        DOMElementNode(
+            True, body, "input", f"html/body/input[{i + 1}]", {"name": f"field{i}", "value": value}, [], highlight_index=i
+        )
+    if button:
+        DOMElementNode(True, body, "button", "html/body/button", {}, [], highlight_index=len(values))
+    return body
+
+
+def test_diff_state_messages():
+    """
+    State messages list only the changes since a page snapshot kept in the history. A new snapshot replaces the old one
+    every full_state_interval steps, after navigation and when most of the page changed.
+    """
+    settings = MessageManagerSettings(diff_state_messages=True, full_state_interval=3, include_attributes=["name", "value"])
+    manager = MessageManager(
+        task="Task", system_message=SystemMessage(content="System"), settings=settings, state=MessageManagerState()
+    )
+    pages = [
+        (_form(["", "", "", ""]), "https://example.com/signup"),
+        (_form(["Ada", "", "", ""]), "https://example.com/signup"),
+        (_form(["Ada", "Lovelace", "", ""], button=True), "https://example.com/signup"),
+        (_form(["Ada", "Lovelace", "", ""], button=True), "https://example.com/signup"),
+        (_form(["Ada", "Lovelace", "", ""], button=True), "https://example.com/done"),
+        (_form(["x", "y", "z", "w"]), "https://example.com/done"),
+    ]
+
+    state_messages, snapshots = [], []
+    for step, (page, url) in enumerate(pages):
+        manager.add_state_message(
+            _state(None, page, url), step_info=AgentStepInfo(step_number=step, max_steps=10), use_vision=False
+        )
+        state_messages.append(manager.get_messages()[-1].content)
+        snapshots.append(
+            [m.message.content for m in manager.state.history.messages if m.metadata.message_type == "elements_snapshot"]
+        )
+        manager._remove_last_state_message()
+
+    assert "Unchanged since the page snapshot of step 1." in state_messages[0]
+    assert snapshots[0] == [
+        "Page snapshot of step 1 (https://example.com/signup), later states list the changes since this snapshot.\n"
+        "Interactive elements from top layer of the page inside the viewport:\n"
+        "Sign up\n[0]<input field0/>\n[1]<input field1/>\n[2]<input field2/>\n[3]<input field3/>"
+    ]
+    assert "Changes since the page snapshot of step 1" in state_messages[1]
+    assert "\n~ [0]<input field0;Ada/>\n" in state_messages[1]
+    assert "[1]<input" not in state_messages[1]
+    assert "~ [1]<input field1;Lovelace/>\n+ [4]<button />" in state_messages[2]
+    assert snapshots[2] == snapshots[0]
+    # Every full_state_interval steps, after navigation and after large changes a new snapshot replaces the old one
+    for step in (3, 4, 5):
+        assert f"Unchanged since the page snapshot of step {step + 1}." in state_messages[step]
+        assert len(snapshots[step]) == 1 and snapshots[step][0].startswith(f"Page snapshot of step {step + 1} ")
@@ -0,0 +1,129 @@
+import base64
+import json
+from unittest.mock import patch
+
+from browser_use.agent.views import ActionResult, AgentHistory, AgentHistoryList, AgentOutput
+from browser_use.browser import screenshot_store
+from browser_use.browser.screenshot_store import FileSystemScreenshotStore, InMemoryScreenshotStore
+from browser_use.browser.views import BrowserStateHistory
+
+
+def _b64(data):
+    return base64.b64encode(data).decode("utf-8")
+
+
+def _history(store, screenshots):
+    return AgentHistoryList(
+        history=[
+            AgentHistory(
+                model_output=None,
+                result=[ActionResult()],
+                state=BrowserStateHistory(
+                    url="https://example.com",
+                    title="Example",
+                    tabs=[],
+                    interacted_element=[None],
+                    screenshot_ref=store.put_base64(_b64(screenshot)),
+                    screenshot_store=store,
+                ),
+            )
+            for screenshot in screenshots
+        ]
+    )
+
+
+def test_in_memory_store_dedupes_and_evicts_least_recently_used():
+    """
+    Identical screenshots are stored once, and least recently used ones are evicted above max_bytes.
+    Reading an evicted screenshot logs a warning.
+    """
+    store = InMemoryScreenshotStore(max_bytes=25)
+    first = store.put(b"a" * 10)
+    assert store.put(b"a" * 10) == first
+    assert len(store) == 1 and store.size == 10
+
+    second = store.put(b"b" * 10)
+    assert store.get(first) == b"a" * 10
+    third = store.put(b"c" * 10)
+
+    with patch.object(screenshot_store.logger, "warning") as warning:
+        assert store.get(second) is None
+    assert "was evicted" in warning.call_args.args[0]
+    assert store.get(first) == b"a" * 10
+    assert store.get_base64(third) == _b64(b"c" * 10)
+    assert store.size == 20
+
+    # Unbounded by default, nothing the history references is dropped
+    unbounded = InMemoryScreenshotStore()
+    keys = [unbounded.put(bytes([i]) * 1000) for i in range(100)]
+    assert all(unbounded.get(key) is not None for key in keys)
+
+
+def test_file_system_store(tmp_path):
+    """
+    Screenshots are written once per content and read back on demand, keys cannot leave the directory.
+    """
+    store = FileSystemScreenshotStore(tmp_path / "screenshots")
+    key = store.put_base64(_b64(b"png bytes"))
+
+    assert store.put(b"png bytes") == key
+    assert [path.name for path in (tmp_path / "screenshots").iterdir()] == [key]
+    assert FileSystemScreenshotStore(tmp_path / "screenshots").get(key) == b"png bytes"
+    assert store.get("0" * 32) is None
+    assert store.get("../secret") is None
+
+
+def test_history_keeps_screenshot_references(tmp_path):
+    """
+    Saved histories contain references only, deduplicated in the store, and screenshots are read from
+    the store after loading.
+    """
+    store = FileSystemScreenshotStore(tmp_path / "screenshots")
+    history = _history(store, [b"frame 1", b"frame 1", b"frame 2"])
+    path = tmp_path / "history.json"
+
+    history.save_to_file(path)
+
+    with open(path) as f:
+        states = [h["state"] for h in json.load(f)["history"]]
+    assert all(state["screenshot"] is None for state in states)
+    assert states[0]["screenshot_ref"] == states[1]["screenshot_ref"] != states[2]["screenshot_ref"]
+    assert len(list((tmp_path / "screenshots").iterdir())) == 2
+
+    loaded = AgentHistoryList.load_from_file(
+        path, AgentOutput, screenshot_store=FileSystemScreenshotStore(tmp_path / "screenshots")
+    )
+    assert loaded.screenshots() == [_b64(b"frame 1"), _b64(b"frame 1"), _b64(b"frame 2")]
+    assert AgentHistoryList.load_from_file(path, AgentOutput).screenshots() == [None, None, None]
+
+
+def test_history_inlines_screenshots_of_in_memory_store(tmp_path):
+    """
+    Screenshots of an in-memory store do not outlive the process, saved histories contain them inline.
+    """
+    history = _history(InMemoryScreenshotStore(), [b"frame 1", b"frame 2"])
+    path = tmp_path / "history.json"
+
+    history.save_to_file(path)
+
+    with open(path) as f:
+        states = [h["state"] for h in json.load(f)["history"]]
+    assert [state["screenshot"] for state in states] == [_b64(b"frame 1"), _b64(b"frame 2")]
+    assert all("screenshot_ref" not in state for state in states)
+    assert AgentHistoryList.load_from_file(path, AgentOutput).screenshots() == [_b64(b"frame 1"), _b64(b"frame 2")]
+
+
+def test_screenshot_attribute_reads_from_store():
+    """
+    state.screenshot keeps returning the base64 screenshot when the history only keeps a reference.
+    """
+    store = InMemoryScreenshotStore()
+    history = _history(store, [b"frame 1"])
+    state = history.history[0].state
+
+    assert state.screenshot == state.get_screenshot() == _b64(b"frame 1")
+    assert history.screenshots() == [_b64(b"frame 1")]
+
+    state.screenshot = _b64(b"inline")
+    assert state.screenshot == _b64(b"inline")
+    assert BrowserStateHistory(url="u", title="t", tabs=[], interacted_element=[None]).screenshot is None
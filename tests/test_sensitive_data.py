@@ -0,0 +1,132 @@
+import random
+import string
+import time
+
+import pytest
+from langchain_core.messages import HumanMessage, SystemMessage
+from pydantic import BaseModel
+
+from browser_use.agent.message_manager.service import MessageManager, MessageManagerSettings
+from browser_use.agent.views import MessageManagerState
+from browser_use.controller.registry.service import Registry
+from browser_use.utils import SensitiveDataRedactor
+
+
+class _Credentials(BaseModel):
+    user: str
+    password: str
+
+
+class _LoginAction(BaseModel):
+    url: str
+    credentials: _Credentials
+    tags: list[str]
+
+
+def _reference_redact(text, sensitive_data):
+    """The previous implementation: one str.replace per secret, in dict order."""
+    for key, value in sensitive_data.items():
+        if value:
+            text = text.replace(value, f"<secret>{key}</secret>")
+    return text
+
+
+def test_redact_longest_match_first():
+    """
+    A secret containing another one is replaced as a whole, empty secrets are ignored, and placeholders
+    are replaced back.
+    """
+    sensitive_data = {"pin": "1234", "card": "1234 5678", "empty": "", "user": "ada"}
+    redactor = SensitiveDataRedactor(sensitive_data)
+
+    redacted = redactor.redact("card 1234 5678, pin 1234, user ada, ADA")
+
+    assert redacted == "card <secret>card</secret>, pin <secret>pin</secret>, user <secret>user</secret>, ADA"
+    assert redactor.unredact(redacted) == "card 1234 5678, pin 1234, user ada, ADA"
+    assert redactor.unredact("<secret>unknown</secret> <secret>empty</secret>") == "<secret>unknown</secret> "
+    assert SensitiveDataRedactor({}).redact("1234") == "1234"
+
+
+def test_redactor_is_built_once_per_secrets():
+    sensitive_data = {"password": "hunter2"}
+    redactor = SensitiveDataRedactor.for_secrets(sensitive_data)
+
+    assert SensitiveDataRedactor.for_secrets(dict(sensitive_data)) is redactor
+    sensitive_data["password"] = "hunter3"
+    assert SensitiveDataRedactor.for_secrets(sensitive_data).redact("hunter3") == "<secret>password</secret>"
+
+
+def test_message_manager_redacts_all_content_parts():
+    settings = MessageManagerSettings(sensitive_data={"password": "hunter2"})
+    manager = MessageManager(
+        task="Task", system_message=SystemMessage(content="System"), settings=settings, state=MessageManagerState()
+    )
+
+    manager._add_message_with_tokens(
+        HumanMessage(
+            content=[
+                {"type": "text", "text": "typed hunter2"},
+                {"type": "image_url", "image_url": {"url": "data:image/png;base64,hunter2"}},
+                {"type": "text", "text": "still hunter2"},
+            ]
+        )
+    )
+
+    content = manager.get_messages()[-1].content
+    assert content[0]["text"] == "typed <secret>password</secret>"
+    assert content[1]["image_url"]["url"] == "data:image/png;base64,hunter2"
+    assert content[2]["text"] == "still <secret>password</secret>"
+
+
+def test_registry_replaces_placeholders_in_nested_params():
+    """
+    Placeholders are replaced in all strings of the params, nested models keep their type.
+    """
+    params = _LoginAction(
+        url="https://example.com/?user=<secret>user</secret>",
+        credentials=_Credentials(user="<secret>user</secret>", password="<secret>password</secret>"),
+        tags=["<secret>password</secret>", "<secret>unknown</secret>"],
+    )
+
+    replaced = Registry()._replace_sensitive_data(params, {"user": "ada", "password": "hunter2"})
+
+    assert replaced.url == "https://example.com/?user=ada"
+    assert replaced.credentials == _Credentials(user="ada", password="hunter2")
+    assert replaced.tags == ["hunter2", "<secret>unknown</secret>"]
+
+
+@pytest.mark.slow
+def test_redact_benchmark():
+    """
+    Micro-benchmark with 1000 secrets and a 200 KB message: one pass of the compiled trie pattern against
+    one str.replace per secret. Only prints the timings, wall-clock times are not asserted.
+    """
+    rng = random.Random(0)
+    alphabet = string.ascii_letters + string.digits
+    sensitive_data = {f"secret_{i}": "".join(rng.choices(alphabet, k=rng.randint(8, 40))) for i in range(1000)}
+    values = list(sensitive_data.values())
+    words, size = [], 0
+    while size < 200_000:
+        word = rng.choice(values) if rng.random() < 0.01 else "".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 10)))
+        words.append(word)
+        size += len(word) + 1
+    text = " ".join(words)
+
+    start = time.perf_counter()
+    redactor = SensitiveDataRedactor(sensitive_data)
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    reference = _reference_redact(text, sensitive_data)
+    reference_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    redacted = redactor.redact(text)
+    redact_time = time.perf_counter() - start
+
+    print(
+        f"\n1000 secrets, {len(text) // 1000} KB: str.replace {reference_time * 1000:.0f} ms, "
+        f"one pass {redact_time * 1000:.0f} ms (built once in {build_time * 1000:.0f} ms)"
+    )
+    assert redacted == reference
+    assert redactor.unredact(redacted) == text
@@ -2,6 +2,7 @@ from unittest.mock import AsyncMock, MagicMock, Mock, patch
 
 import pytest
 from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
 from pydantic import BaseModel
 
 from browser_use.agent.service import Agent
@@ -80,6 +81,36 @@ class TestAgent:
 		assert 'test_action' in call_args
 		assert call_args['test_action'] == mock_controller.registry.registry.actions['test_action'].param_model.return_value  # type: ignore
 
+	def test_prompt_cache_usage(self, mock_controller, mock_llm, mock_browser, mock_browser_context):  # type: ignore
+		"""
+		Cache breakpoints are only added for Anthropic models unless configured, and the cache usage reported with
+		the model output is recorded for the step metadata.
+		"""
+		agent = Agent(
+			task='Test task', llm=mock_llm, controller=mock_controller, browser=mock_browser, browser_context=mock_browser_context
+		)
+		assert agent._message_manager.settings.cache_prompt_prefix is False
+		agent = Agent(
+			task='Test task',
+			llm=mock_llm,
+			controller=mock_controller,
+			browser=mock_browser,
+			browser_context=mock_browser_context,
+			cache_prompt_prefix=True,
+		)
+		assert agent._message_manager.settings.cache_prompt_prefix is True
+
+		usage = {
+			'input_tokens': 2000,
+			'output_tokens': 10,
+			'total_tokens': 2010,
+			'input_token_details': {'cache_read': 1800, 'cache_creation': 0},
+		}
+		agent._record_input_token_details(AIMessage(content='', usage_metadata=usage))
+		assert agent._input_token_details == {'cache_read': 1800, 'cache_creation': 0}
+		agent._record_input_token_details(AIMessage(content=''))
+		assert agent._input_token_details == {}
+
 	@pytest.mark.asyncio
 	async def test_step_error_handling(self):
 		"""